@@ -33,6 +33,7 @@ setup(
     entry_points={
         "console_scripts": [
             "topprism-chatopt=topprism_chatopt.app:main",
+            "topprism-batch=topprism_chatopt.batch:main",
         ],
     },
     include_package_data=True,
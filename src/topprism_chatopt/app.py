@@ -1,89 +1,28 @@
 # app.py
-import streamlit as st
+import time
 import pandas as pd
-import os
-from .rag_retriever import TopprismRAG
-from .llm_generator import generate_model_code
-from .or_solver import solve_visit_scheduling
-from .utils import plot_map
-
-# 页面配置
-st.set_page_config(page_title="Topprism-ChatOpt", layout="wide", page_icon="🎯")
-st.title("🎯 Topprism-ChatOpt | 自然语言规划引擎")
-
-# 侧边栏
-st.sidebar.header("📝 输入业务规则")
-rules_input = st.sidebar.text_area(
-    "每行一条规则",
-    value="每个销售每天最多拜访4个客户\nA类客户优先安排\n医院客户必须在9-12点拜访",
-    height=200
-)
-rules = [r.strip() for r in rules_input.split('\n') if r.strip()]
-
-st.sidebar.markdown("---")
-if st.sidebar.button("🚀 开始求解", key="solve"):
-    solving = True
-else:
-    solving = False
-
-# 主界面
-col1, col2 = st.columns([1, 1])
-
-with col1:
-    st.subheader("⚙️ 建模解析")
-    if rules and solving:
-        retriever = TopprismRAG()
-        matches = []
-        for rule in rules:
-            matched = retriever.retrieve(rule, k=1)
-            matches.extend(matched)
-
-        st.write("✅ 匹配到以下建模模式：")
-        for m in matches:
-            with st.expander(f"🔹 {m['description']}"):
-                st.code(m["or_tools_template"], language="python")
-
-        # 读取数据用于代码生成
-        # 获取当前文件所在目录
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        data_dir = os.path.join(current_dir, "data")
-        customers = pd.read_csv(os.path.join(data_dir, "customers.csv"))
-        agents = pd.read_csv(os.path.join(data_dir, "agents.csv"))
-
-        with st.spinner("🧠 Topprism 正在生成模型..."):
-            generated_code = generate_model_code(rules, matches, customers, agents)
-        st.code(generated_code, language="python")
-
-with col2:
-    st.subheader("📊 求解结果")
-
-    if solving:
-        # 获取当前文件所在目录
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        data_dir = os.path.join(current_dir, "data")
-        customers = pd.read_csv(os.path.join(data_dir, "customers.csv"))
-        agents = pd.read_csv(os.path.join(data_dir, "agents.csv"))
-
-        with st.spinner("🔧 正在求解..."):
-            # 将生成的代码传递给求解器
-            result = solve_visit_scheduling(customers, agents, rules, generated_code if 'generated_code' in locals() else "")
-
-        st.success("✅ Topprism-ChatOpt 求解完成！")
-        st.dataframe(result["schedule"], use_container_width=True)
-
-        # 显示地图可视化
-        map_fig = plot_map(customers)
-        st.plotly_chart(map_fig, use_container_width=True)
-        
-        # 可选：显示调度时间线
-        # timeline_fig = plot_schedule_timeline(result["schedule"], customers)
-        # st.plotly_chart(timeline_fig, use_container_width=True)
+import streamlit as st
+from .decomposition import DEFAULT_CLUSTER_SIZE
+from .jobs import CANCELLED, FAILED, FINISHED, RUNNING, JobQueueFull, get_default_job_manager
+from .llm_generator import generate_model_code, get_llm_service
+from .resources import get_retriever, load_datasets, warm_up
+from .solve_cache import get_default_cache
+from .utils import plot_map, plot_schedule_timeline
+
+JOB_POLL_SECONDS = 0.5
+
+@st.cache_resource(show_spinner="🔥 Topprism 正在加载模型与数据...")
+def _warm_resources():
+    """进程内只执行一次的预热，所有会话共享"""
+    warm_up()
+    return True
 
 def main():
     """主函数"""
     # 页面配置
     st.set_page_config(page_title="Topprism-ChatOpt", layout="wide", page_icon="🎯")
     st.title("🎯 Topprism-ChatOpt | 自然语言规划引擎")
+    _warm_resources()
 
     # 侧边栏
     st.sidebar.header("📝 输入业务规则")
@@ -95,21 +34,30 @@ def main():
     rules = [r.strip() for r in rules_input.split('\n') if r.strip()]
 
     st.sidebar.markdown("---")
+    incremental = st.sidebar.checkbox(
+        "基于上次结果增量求解",
+        value=False,
+        disabled="last_routes" not in st.session_state,
+        help="数据小幅变化时，从上一轮路线热启动，只做短时间改进"
+    )
     if st.sidebar.button("🚀 开始求解", key="solve"):
         solving = True
     else:
         solving = False
 
+    # 共享的数据集，只在文件变化时重新读取
+    customers, agents = load_datasets()
+    generated_code = ""
+
     # 主界面
     col1, col2 = st.columns([1, 1])
 
     with col1:
         st.subheader("⚙️ 建模解析")
         if rules and solving:
-            retriever = TopprismRAG()
+            retriever = get_retriever()
             matches = []
-            for rule in rules:
-                matched = retriever.retrieve(rule, k=1)
+            for matched in retriever.retrieve_many(rules, k=1):
                 matches.extend(matched)
 
             st.write("✅ 匹配到以下建模模式：")
@@ -117,41 +65,94 @@ def main():
                 with st.expander(f"🔹 {m['description']}"):
                     st.code(m["or_tools_template"], language="python")
 
-            # 读取数据用于代码生成
-            # 获取当前文件所在目录
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            data_dir = os.path.join(current_dir, "data")
-            customers = pd.read_csv(os.path.join(data_dir, "customers.csv"))
-            agents = pd.read_csv(os.path.join(data_dir, "agents.csv"))
-
             with st.spinner("🧠 Topprism 正在生成模型..."):
                 generated_code = generate_model_code(rules, matches, customers, agents)
             st.code(generated_code, language="python")
 
     with col2:
         st.subheader("📊 求解结果")
+        jobs = get_default_job_manager()
 
         if solving:
-            # 获取当前文件所在目录
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            data_dir = os.path.join(current_dir, "data")
-            customers = pd.read_csv(os.path.join(data_dir, "customers.csv"))
-            agents = pd.read_csv(os.path.join(data_dir, "agents.csv"))
-
-            with st.spinner("🔧 正在求解..."):
-                # 将生成的代码传递给求解器
-                result = solve_visit_scheduling(customers, agents, rules, generated_code if 'generated_code' in locals() else "")
-
-            st.success("✅ Topprism-ChatOpt 求解完成！")
-            st.dataframe(result["schedule"], use_container_width=True)
-
-            # 显示地图可视化
-            map_fig = plot_map(customers)
-            st.plotly_chart(map_fig, use_container_width=True)
-            
-            # 可选：显示调度时间线
-            # timeline_fig = plot_schedule_timeline(result["schedule"], customers)
-            # st.plotly_chart(timeline_fig, use_container_width=True)
+            # 提交到后台任务队列，页面按快照刷新进度，不阻塞会话
+            # 客户规模较大时按地理聚类分解后并行求解
+            decompose = len(customers) > DEFAULT_CLUSTER_SIZE and not incremental
+            initial_routes = st.session_state.get("last_routes") if incremental else None
+            try:
+                st.session_state["job_id"] = jobs.submit(
+                    customers, agents, rules, generated_code, initial_routes=initial_routes,
+                    cluster_size=DEFAULT_CLUSTER_SIZE if decompose else None,
+                )
+            except JobQueueFull as e:
+                st.warning(f"⏳ {str(e)}")
+
+        job_id = st.session_state.get("job_id")
+        if job_id is not None:
+            if st.sidebar.button("⏹️ 取消求解", key="cancel"):
+                jobs.cancel(job_id)
+            snapshot = jobs.status(job_id)
+            if snapshot is None:
+                st.session_state.pop("job_id", None)
+            elif snapshot["status"] not in FINISHED:
+                _job_progress(job_id)
+            elif snapshot["status"] == FAILED:
+                st.error(f"求解失败: {snapshot['error']}")
+            elif snapshot["result"] is not None:
+                if snapshot["status"] == CANCELLED:
+                    st.warning("⏹️ 求解已取消，显示已找到的最好结果")
+                _render_result(snapshot["result"], customers, agents)
+            else:
+                st.warning("⏹️ 求解已取消")
+
+def _render_progress(job_id):
+    """
+    显示一次任务进度快照，不等待任务结束
+    任务结束后整页重跑，由 main 显示结果
+    """
+    jobs = get_default_job_manager()
+    snapshot = jobs.status(job_id)
+    if snapshot is None or snapshot["status"] in FINISHED:
+        st.rerun()
+    if snapshot["status"] == RUNNING:
+        best = snapshot["best_objective"]
+        st.info(f"🔧 正在求解… 已用 {snapshot['elapsed']:.1f} 秒，"
+                f"当前最优目标值：{best if best is not None else '尚未找到可行解'}")
+    else:
+        st.info(f"⏳ 排队中（{jobs.stats()['queued']} 个任务等待）")
+    if snapshot["progress"]:
+        progress = pd.DataFrame(snapshot["progress"], columns=["秒", "目标值"]).set_index("秒")
+        st.line_chart(progress)
+
+if hasattr(st, "fragment"):
+    # 只重跑进度片段，页面其余部分不重新执行
+    _job_progress = st.fragment(run_every=JOB_POLL_SECONDS)(_render_progress)
+else:
+    def _job_progress(job_id):
+        """旧版 Streamlit 没有 st.fragment：显示一次快照，短暂等待后重跑页面"""
+        _render_progress(job_id)
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+
+def _render_result(result, customers, agents):
+    """显示求解结果"""
+    st.session_state["last_routes"] = result["routes"]
+
+    st.success("✅ Topprism-ChatOpt 求解完成！" + ("（缓存命中）" if result.get("from_cache") else ""))
+    cache_stats = get_default_cache().stats()
+    st.sidebar.caption(f"求解缓存：命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次")
+    st.sidebar.caption(
+        f"合并的重复请求：求解 {get_default_job_manager().stats()['deduplicated']} 次，"
+        f"模型生成 {get_llm_service().flight.stats()['deduplicated']} 次"
+    )
+    st.dataframe(result["schedule"], use_container_width=True)
+
+    # 显示地图可视化（客户点与每位销售代表的路线）
+    map_fig = plot_map(customers, routes=result["routes"], agents_df=agents)
+    st.plotly_chart(map_fig, use_container_width=True)
+
+    # 显示调度时间线
+    timeline_fig = plot_schedule_timeline(result["schedule"], customers, agents_df=agents, result=result)
+    st.plotly_chart(timeline_fig, use_container_width=True)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
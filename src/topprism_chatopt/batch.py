@@ -0,0 +1,273 @@
+# batch.py
+# Topprism-ChatOpt | 无界面的批量求解：规则 → 检索 → 生成约束代码 → 求解
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from .data_loader import load_agents, load_customers
+from .llm_generator import generate_model_code, get_llm_service
+from .or_solver import solve_visit_scheduling
+from .resources import get_retriever
+from .solve_result import SolveResult, _plain
+from .tracing import get_default_tracer
+
+DEFAULT_LLM_CONCURRENCY = 4
+
+class Scenario:
+    """一个批量求解场景：数据文件、规则与搜索参数"""
+    def __init__(self, name, customers_path, agents_path, rules, search_options=None):
+        self.name = name
+        self.customers_path = customers_path
+        self.agents_path = agents_path
+        self.rules = rules
+        self.search_options = search_options or {}
+
+def _read_rules(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def load_scenarios(source):
+    """
+    读取场景列表
+    - 目录：每个子目录（或目录本身）包含 customers.csv、agents.csv、rules.txt（每行一条规则）
+    - 清单文件（.json 列表或 .jsonl）：每项包含 name、customers、agents、rules（列表）或 rules_file，
+      可选 search_options；相对路径相对于清单所在目录
+    """
+    if os.path.isdir(source):
+        candidates = [source] + sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if os.path.isdir(os.path.join(source, name))
+        )
+        scenarios = []
+        for directory in candidates:
+            paths = [os.path.join(directory, name) for name in ("customers.csv", "agents.csv", "rules.txt")]
+            if all(os.path.exists(path) for path in paths):
+                name = os.path.basename(os.path.normpath(directory))
+                scenarios.append(Scenario(name, paths[0], paths[1], _read_rules(paths[2])))
+        return scenarios
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        if source.endswith(".jsonl"):
+            entries = [json.loads(line) for line in f if line.strip()]
+        else:
+            entries = json.load(f)
+
+    def resolve(path):
+        return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+    scenarios = []
+    for i, entry in enumerate(entries):
+        rules = entry.get("rules")
+        if rules is None:
+            rules = _read_rules(resolve(entry["rules_file"]))
+        scenarios.append(Scenario(
+            entry.get("name", f"scenario-{i + 1}"),
+            resolve(entry["customers"]),
+            resolve(entry["agents"]),
+            rules,
+            entry.get("search_options"),
+        ))
+    return scenarios
+
+def prepare_model(rules, customers_df=None, agents_df=None, retriever=None, service=None):
+    """
+    规则 → 知识库检索 → 约束代码
+    返回 (匹配到的建模模式, 生成的代码)；检索器与 LLM 客户端在进程内共享
+    """
+    retriever = retriever or get_retriever()
+    matches = []
+    for matched in retriever.retrieve_many(rules, k=1) if rules else []:
+        matches.extend(matched)
+    code = generate_model_code(rules, matches, customers_df, agents_df, service=service)
+    return matches, code
+
+def result_to_dict(result):
+    """把求解结果转换为可以写入 JSON 的字典"""
+    # 先按键过滤再取值，结构化结果的 schedule 不会因此生成
+    data = {key: result[key] for key in result if key not in ("schedule", "routes", "days")}
+    data = {key: value for key, value in data.items() if not hasattr(value, "to_dict")}
+    data["schedule"] = result["schedule"].to_dict("records")
+    data["routes"] = {str(agent_id): [_plain(cid) for cid in route] for agent_id, route in result["routes"].items()}
+    return _plain(data)
+
+def confine_path(root, path):
+    """
+    把 path 解析到 root 之下（相对路径相对于 root），返回绝对路径
+    路径（含 ..、符号链接）指向 root 之外或就是 root 本身时抛出 PermissionError
+    """
+    root = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(root, str(path)))
+    if resolved == root or os.path.commonpath([root, resolved]) != root:
+        raise PermissionError(f"路径不在目录内: {path}")
+    return resolved
+
+def _solve_scenario(args):
+    """worker 进程内求解（数据已在主进程中加载）"""
+    name, customers, agents, rules, code, search_options = args
+    start = time.perf_counter()
+    with get_default_tracer().capture() as trace:
+        result = solve_visit_scheduling(customers, agents, rules, code, search_options=search_options,
+                                        use_cache=False)
+    result["total_seconds"] = round(time.perf_counter() - start, 3)
+    result["trace"] = trace
+    return result
+
+def write_result(out_dir, name, result, code):
+    """
+    每个场景输出 schedule.csv 与 result.json，结构化结果另存 result.npz
+    场景名作为 out_dir 下的目录名，指向 out_dir 之外（如 ../x）时抛出 PermissionError
+    """
+    directory = confine_path(out_dir, name)
+    os.makedirs(directory, exist_ok=True)
+    if isinstance(result, SolveResult):
+        result.save(os.path.join(directory, "result.npz"))
+    result["schedule"].to_csv(os.path.join(directory, "schedule.csv"), index=False, encoding="utf-8-sig")
+    data = result_to_dict(result)
+    data["generated_code"] = code
+    with open(os.path.join(directory, "result.json"), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+def run_batch(scenarios, out_dir, max_workers=None, search_options=None,
+              llm_concurrency=DEFAULT_LLM_CONCURRENCY):
+    """
+    批量求解
+    1. 主进程中共享一个检索器与 LLM 客户端，按场景并发生成约束代码
+    2. 各场景在多个进程中并行求解，结果写入 out_dir/<场景名>/
+    返回汇总列表（同时写入 out_dir/summary.json）
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    retriever = get_retriever()
+    service = get_llm_service()
+
+    def prepare(scenario):
+        # 输出目录不合法的场景不建模；数据只在这里加载一次，随任务交给求解进程
+        confine_path(out_dir, scenario.name)
+        customers = load_customers(scenario.customers_path)
+        agents = load_agents(scenario.agents_path)
+        code = prepare_model(scenario.rules, customers, agents, retriever=retriever, service=service)[1]
+        return customers, agents, code
+
+    summary = []
+    prepared = {}
+    codes = {}
+    with ThreadPoolExecutor(max_workers=llm_concurrency) as pool:
+        futures = [(scenario, pool.submit(prepare, scenario)) for scenario in scenarios]
+        for scenario, future in futures:
+            try:
+                prepared[scenario.name] = future.result()
+                codes[scenario.name] = prepared[scenario.name][2]
+            except Exception as e:
+                print(f"场景 {scenario.name} 建模失败: {str(e)}")
+                summary.append({"name": scenario.name, "status": "error", "error": str(e)})
+
+    tasks = []
+    for scenario in scenarios:
+        if scenario.name not in codes:
+            continue
+        options = dict(search_options or {})
+        options.update(scenario.search_options)
+        customers, agents, code = prepared.pop(scenario.name)
+        tasks.append((scenario, (scenario.name, customers, agents, scenario.rules, code, options)))
+
+    max_workers = max_workers or os.cpu_count() or 1
+    if tasks:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+            futures = [(scenario, executor.submit(_solve_scenario, args)) for scenario, args in tasks]
+            for scenario, future in futures:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"场景 {scenario.name} 求解失败: {str(e)}")
+                    summary.append({"name": scenario.name, "status": "error", "error": str(e)})
+                    continue
+                get_default_tracer().replay(result.pop("trace", []))
+                write_result(out_dir, scenario.name, result, codes[scenario.name])
+                summary.append({
+                    "name": scenario.name,
+                    "status": "solved" if result["solved"] else "infeasible",
+                    "objective": _plain(result["objective"]),
+                    "seconds": result["total_seconds"],
+                })
+
+    order = {scenario.name: i for i, scenario in enumerate(scenarios)}
+    summary.sort(key=lambda item: order.get(item["name"], len(order)))
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+def main(argv=None):
+    """
+    命令行入口：topprism-batch run <场景目录或清单> --out <输出目录> | topprism-batch serve
+    | topprism-batch bench [--baseline 基线文件] [--update-baseline]
+    """
+    parser = argparse.ArgumentParser(prog="topprism-batch", description="Topprism-ChatOpt 批量求解")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="批量求解场景目录或清单")
+    run.add_argument("scenarios", help="场景目录，或 .json/.jsonl 清单")
+    run.add_argument("--out", required=True, help="输出目录")
+    run.add_argument("--workers", type=int, default=None, help="并行求解的进程数，默认 CPU 核数")
+    run.add_argument("--time-limit", type=float, default=None, help="每个场景的搜索时间上限（秒）")
+
+    serve = subparsers.add_parser("serve", help="启动本地 HTTP 服务")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--workers", type=int, default=None, help="求解进程数，默认 CPU 核数")
+    serve.add_argument("--data-root", default=None,
+                       help="允许请求按 customers_path/agents_path 读取的数据目录，默认不允许")
+
+    bench = subparsers.add_parser("bench", help="运行性能基准并与基线比较")
+    bench.add_argument("--sizes", type=int, nargs="+", default=None, help="求解基准的客户数，默认 50 200")
+    bench.add_argument("--time-limit", type=float, default=None, help="每个求解基准的搜索时间（秒）")
+    bench.add_argument("--stages", nargs="+", default=["retrieval", "generation", "solve"],
+                       choices=["retrieval", "index", "generation", "solve", "render"])
+    bench.add_argument("--baseline", default=None, help="基线文件（JSON）")
+    bench.add_argument("--update-baseline", action="store_true", help="把本次结果写入基线文件")
+    bench.add_argument("--out", default=None, help="本次结果的输出文件（JSON）")
+
+    args = parser.parse_args(argv)
+    if args.command == "bench":
+        return _run_bench(args)
+    if args.command == "serve":
+        from .server import serve_forever
+        serve_forever(args.host, args.port, max_workers=args.workers, data_root=args.data_root)
+        return 0
+
+    scenarios = load_scenarios(args.scenarios)
+    if not scenarios:
+        print(f"没有找到场景: {args.scenarios}")
+        return 1
+    search_options = {"time_limit_seconds": args.time_limit} if args.time_limit else None
+    summary = run_batch(scenarios, args.out, max_workers=args.workers, search_options=search_options)
+    for item in summary:
+        print(f"{item['name']}: {item['status']} {item.get('objective', item.get('error', ''))}")
+    return 0 if all(item["status"] == "solved" for item in summary) else 1
+
+def _run_bench(args):
+    from .benchmark import (DEFAULT_SIZES, DEFAULT_TIME_LIMIT_SECONDS, compare_to_baseline, format_results,
+                            load_baseline, run_benchmarks, save_baseline)
+
+    results = run_benchmarks(sizes=args.sizes or DEFAULT_SIZES,
+                             time_limit_seconds=args.time_limit or DEFAULT_TIME_LIMIT_SECONDS,
+                             stages=args.stages)
+    print(format_results(results))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, default=str)
+    if not args.baseline:
+        return 0
+    if args.update_baseline or not os.path.exists(args.baseline):
+        save_baseline(results, args.baseline)
+        print(f"基线已写入: {args.baseline}")
+        return 0
+
+    regressions = compare_to_baseline(results, load_baseline(args.baseline))
+    for item in regressions:
+        print(f"回归: {item['case']} {item['metric']} {item['baseline']} → {item['current']}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,508 @@
+# benchmark.py
+# Topprism-ChatOpt | 可复现的性能基准：检索、代码生成与求解
+import copy
+import json
+import math
+import os
+import platform
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from .tracing import InMemoryExporter, get_default_tracer
+
+BENCHMARK_CENTER = (39.9042, 116.4074)
+KM_PER_DEGREE_LAT = 111.0
+CUSTOMER_TYPES = ["医院", "诊所", "药店", "客户"]
+# (开始小时, 结束小时, 权重)：上午、下午与全天时间窗
+TIME_WINDOWS = [(9, 12, 0.2), (13, 17, 0.2), (8, 18, 0.6)]
+PRIORITY_WEIGHTS = {"A": 0.2, "B": 0.5, "C": 0.3}
+VISITS_PER_AGENT = 12
+DEFAULT_SIZES = (50, 200)
+DEFAULT_TIME_LIMIT_SECONDS = 5
+# 相对基线的容忍幅度，超出即视为回归
+DEFAULT_TOLERANCES = {"wall_seconds": 0.25, "peak_rss_mb": 0.25, "objective": 0.05, "payload_kb": 0.1}
+SYNTHETIC_PATTERN_VERBS = ["负责", "拜访", "配送", "巡检"]
+STUB_CODE = "routing.AddConstantDimension(1, 12, True, 'VisitCount')"
+
+def synthetic_instance(n_customers, n_agents=None, seed=0, n_hotspots=5, spread_km=3.0):
+    """
+    生成随机但可复现的实例：客户分布在若干城区热点附近，带时间窗、服务时长与优先级
+    n_agents 省略时按每人约 VISITS_PER_AGENT 个客户配置，每人上限留有余量以保证可行
+    """
+    rng = np.random.default_rng(seed)
+    n_agents = n_agents or max(1, math.ceil(n_customers / VISITS_PER_AGENT))
+    lat0, lon0 = BENCHMARK_CENTER
+    km_per_degree_lon = KM_PER_DEGREE_LAT * math.cos(math.radians(lat0))
+
+    # 热点分布在中心 15 公里范围内，客户围绕热点正态分布
+    hotspots = rng.uniform(-15, 15, size=(n_hotspots, 2))
+    hotspot = rng.integers(0, n_hotspots, n_customers)
+    offsets = hotspots[hotspot] + rng.normal(0, spread_km, size=(n_customers, 2))
+
+    windows = np.array([(start, end) for start, end, _ in TIME_WINDOWS])
+    window_weights = np.array([weight for _, _, weight in TIME_WINDOWS])
+    window = rng.choice(len(TIME_WINDOWS), n_customers, p=window_weights / window_weights.sum())
+    kinds = rng.choice(CUSTOMER_TYPES, n_customers)
+
+    customers = pd.DataFrame({
+        "id": np.arange(1, n_customers + 1),
+        "name": [f"{kind}{i}" for i, kind in enumerate(kinds, start=1)],
+        "lat": lat0 + offsets[:, 0] / KM_PER_DEGREE_LAT,
+        "lon": lon0 + offsets[:, 1] / km_per_degree_lon,
+        "priority": rng.choice(list(PRIORITY_WEIGHTS), n_customers, p=list(PRIORITY_WEIGHTS.values())),
+        "service_time_minutes": rng.choice([10, 15, 20, 30], n_customers),
+        "time_window_start": windows[window, 0],
+        "time_window_end": windows[window, 1],
+        "region": [f"区域{h + 1}" for h in hotspot],
+    })
+
+    agent_hotspot = np.arange(n_agents) % n_hotspots
+    agent_offsets = hotspots[agent_hotspot] + rng.normal(0, spread_km, size=(n_agents, 2))
+    agents = pd.DataFrame({
+        "id": np.arange(1, n_agents + 1),
+        "name": [f"销售{i}" for i in range(1, n_agents + 1)],
+        "start_lat": lat0 + agent_offsets[:, 0] / KM_PER_DEGREE_LAT,
+        "start_lon": lon0 + agent_offsets[:, 1] / km_per_degree_lon,
+        "max_visits_per_day": math.ceil(1.25 * n_customers / n_agents),
+    })
+    return customers, agents
+
+# 规则模板：前几类能被知识库模式命中，最后一类只能靠语义或关键词匹配
+RULE_TEMPLATES = [
+    "每个销售每天最多拜访{n}个客户",
+    "每名代表不能超过{n}个客户",
+    "每天最多跑{n}家",
+    "{kind}客户必须在{start}-{end}点拜访",
+    "{kind}必须在{end}点前完成",
+    "优先拜访{priority}类客户",
+    "{priority}类客户优先安排",
+    "尽量安排{region}的{kind}",
+    "{region}的{kind}最好由同一个销售负责",
+]
+
+def synthetic_rules(n_rules, seed=0):
+    """生成可复现的业务规则语料"""
+    rng = np.random.default_rng(seed)
+    rules = []
+    for _ in range(n_rules):
+        template = RULE_TEMPLATES[rng.integers(len(RULE_TEMPLATES))]
+        start = int(rng.integers(8, 14))
+        rules.append(template.format(
+            n=int(rng.integers(4, 20)),
+            kind=CUSTOMER_TYPES[rng.integers(len(CUSTOMER_TYPES))],
+            start=start,
+            end=start + int(rng.integers(2, 6)),
+            priority=list(PRIORITY_WEIGHTS)[rng.integers(len(PRIORITY_WEIGHTS))],
+            region=f"区域{int(rng.integers(1, 10))}",
+        ))
+    return rules
+
+def synthetic_knowledge_base(n_extra_items, patterns_per_item=4, kb_path=None):
+    """在内置知识库基础上追加 n_extra_items 个模式，用于测量检索随知识库规模的变化"""
+    if kb_path is None:
+        kb_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base.json")
+    with open(kb_path, encoding="utf-8") as f:
+        kb = json.load(f)
+    kb = copy.deepcopy(kb)
+    for i in range(n_extra_items):
+        kb["semantic_patterns"].append({
+            "id": f"synthetic_{i}",
+            "description": f"合成规则 {i}",
+            "patterns": [
+                f"区域{i}的.*{SYNTHETIC_PATTERN_VERBS[j % len(SYNTHETIC_PATTERN_VERBS)]}{j}号"
+                for j in range(patterns_per_item)
+            ],
+            "intent": f"synthetic_{i}",
+            "parameters": [],
+            "math_form": "",
+            "or_tools_template": f"# synthetic_{i}",
+        })
+    return kb
+
+class _StubLLMHandler(BaseHTTPRequestHandler):
+    """OpenAI 兼容的 /v1/chat/completions，按固定节奏流式返回预设代码"""
+    first_token_seconds = 0.0
+    token_seconds = 0.0
+    code = STUB_CODE
+    requests = 0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        type(self).requests += 1
+        tokens = [self.code[i:i + 8] for i in range(0, len(self.code), 8)]
+
+        if not body.get("stream"):
+            time.sleep(self.first_token_seconds + self.token_seconds * len(tokens))
+            data = json.dumps({
+                "id": "stub", "object": "chat.completion", "created": 0, "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": self.code},
+                             "finish_reason": "stop"}],
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        time.sleep(self.first_token_seconds)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.token_seconds)
+            self._send_chunk(body, {"content": token}, None)
+        self._send_chunk(body, {}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_chunk(self, body, delta, finish_reason):
+        chunk = {
+            "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+class StubLLMServer:
+    """
+    离线测量代码生成延迟用的本地模型替身
+    first_token_seconds 为首个片段前的延迟，token_seconds 为片段间隔
+    """
+    def __init__(self, first_token_seconds=0.05, token_seconds=0.005, code=STUB_CODE, port=0):
+        self.handler = type("BoundStubLLMHandler", (_StubLLMHandler,), {
+            "first_token_seconds": first_token_seconds,
+            "token_seconds": token_seconds,
+            "code": code,
+        })
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self.handler)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    @property
+    def requests(self):
+        return self.handler.requests
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def current_rss_bytes():
+    """当前常驻内存；无法读取 /proc 时退回进程峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 计，macOS 以字节计
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+class PeakRSS:
+    """后台线程定时采样常驻内存，记录阶段内的峰值"""
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = current_rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+    @property
+    def peak_mb(self):
+        return round(self.peak / (1024 * 1024), 1)
+
+def _measure(case, stage, fn):
+    """
+    运行一个基准阶段，记录墙钟时间、峰值内存，以及期间的追踪记录（阶段耗时与计数）
+    fn 返回要并入结果的指标字典
+    """
+    tracer = get_default_tracer()
+    exporter = tracer.add_exporter(InMemoryExporter())
+    try:
+        with PeakRSS() as rss:
+            start = time.perf_counter()
+            metrics = fn() or {}
+            wall_seconds = time.perf_counter() - start
+    finally:
+        tracer.remove_exporter(exporter)
+    result = {
+        "case": case,
+        "stage": stage,
+        "wall_seconds": round(wall_seconds, 4),
+        "peak_rss_mb": rss.peak_mb,
+        "spans": {name: round(stats["total"], 4) for name, stats in exporter.summary().items()},
+        "counters": dict(exporter.counters),
+    }
+    result.update(metrics)
+    return result
+
+def bench_retrieval(n_rules=200, n_extra_patterns=0, seed=0, cache_dir=None):
+    """检索基准：合成知识库建索引 + 批量检索合成规则"""
+    from .rag_retriever import TopprismRAG
+
+    rules = synthetic_rules(n_rules, seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        kb_path = os.path.join(tmp, "knowledge_base.json")
+        with open(kb_path, "w", encoding="utf-8") as f:
+            json.dump(synthetic_knowledge_base(n_extra_patterns), f, ensure_ascii=False)
+        holder = {}
+
+        def build():
+            holder["retriever"] = TopprismRAG(kb_path=kb_path, cache_dir=cache_dir or tmp)
+            return {"patterns": len(holder["retriever"].pattern_strings)}
+
+        def retrieve():
+            start = time.perf_counter()
+            matches = holder["retriever"].retrieve_many(rules, k=1)
+            seconds = time.perf_counter() - start
+            return {
+                "queries": len(rules),
+                "matched": sum(bool(m) for m in matches),
+                "queries_per_second": round(len(rules) / max(seconds, 1e-9), 1),
+            }
+
+        case = f"retrieval/kb{n_extra_patterns}"
+        return [_measure(case + "/build", "retrieval", build), _measure(case + "/query", "retrieval", retrieve)]
+
+def synthetic_embeddings(n_vectors, dim=384, n_clusters=100, n_queries=200, seed=0):
+    """
+    成簇分布的合成句向量与查询（查询为已有向量加噪声），用于比较索引的召回率与延迟，
+    不依赖句向量模型
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    vectors = centers[rng.integers(0, n_clusters, n_vectors)] + rng.normal(scale=0.6, size=(n_vectors, dim))
+    queries = vectors[rng.integers(0, n_vectors, n_queries)] + rng.normal(scale=0.3, size=(n_queries, dim))
+    return vectors.astype(np.float32), queries.astype(np.float32)
+
+def bench_index(n_vectors=5000, dim=384, n_queries=200, k=5, index_types=None, metric="cosine", seed=0):
+    """
+    索引基准：各索引类型相对精确搜索（flat）的 recall@k、单条查询延迟、构建时间与索引大小
+    """
+    import faiss
+    from .rag_retriever import INDEX_TYPES, build_faiss_index, prepare_vectors
+
+    vectors, queries = synthetic_embeddings(n_vectors, dim, n_queries=n_queries, seed=seed)
+    vectors = prepare_vectors(vectors, metric)
+    queries = prepare_vectors(queries, metric)
+    exact = build_faiss_index(vectors, "flat", metric)
+    _, truth = exact.search(queries, k)
+
+    results = []
+    for index_type in index_types or INDEX_TYPES:
+        holder = {}
+
+        def run():
+            start = time.perf_counter()
+            index = build_faiss_index(vectors, index_type, metric)
+            build_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            _, found = index.search(queries, k)
+            search_seconds = time.perf_counter() - start
+            holder["found"] = found
+            return {
+                "index_type": index_type,
+                "vectors": n_vectors,
+                "build_seconds": round(build_seconds, 4),
+                "ms_per_query": round(1000 * search_seconds / n_queries, 4),
+                "index_mb": round(len(faiss.serialize_index(index)) / (1024 * 1024), 2),
+            }
+
+        measured = _measure(f"index/{index_type}-n{n_vectors}", "index", run)
+        found = holder["found"]
+        measured["recall_at_k"] = round(float(np.mean([
+            len(set(row) & set(expected)) / k for row, expected in zip(found, truth)
+        ])), 4)
+        results.append(measured)
+    return results
+
+def bench_generation(n_requests=8, concurrency=4, first_token_seconds=0.05, token_seconds=0.005, seed=0):
+    """
+    代码生成基准：知识库直接生成，以及经由本地模型替身的流式生成
+    每次请求的规则不同，不会命中响应缓存
+    """
+    from .llm_generator import AsyncLLMService, ResponseCache, generate_model_code
+
+    rule_sets = [synthetic_rules(3, seed + i) for i in range(n_requests)]
+    context = [{"intent": "limit_visit_count", "or_tools_template":
+                "routing.AddConstantDimension(1, {max_count}, True, 'VisitCount')",
+                "description": "每个代理最多访问若干客户"}]
+
+    def knowledge():
+        for rules in rule_sets:
+            generate_model_code(rules, context * len(rules))
+        return {"requests": n_requests}
+
+    results = [_measure("generation/knowledge", "generation", knowledge)]
+    with StubLLMServer(first_token_seconds, token_seconds) as stub:
+        service = AsyncLLMService(base_url=stub.base_url, model="stub", max_concurrency=concurrency,
+                                  cache=ResponseCache())
+
+        def llm():
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                codes = list(pool.map(lambda rules: generate_model_code(rules, [], service=service), rule_sets))
+            seconds = time.perf_counter() - start
+            return {
+                "requests": n_requests,
+                "llm_requests": stub.requests,
+                "fallbacks": sum("简化版本" in code for code in codes),
+                "requests_per_second": round(n_requests / max(seconds, 1e-9), 2),
+            }
+
+        try:
+            results.append(_measure(f"generation/llm-c{concurrency}", "generation", llm))
+        finally:
+            service.close()
+    return results
+
+def bench_solve(n_customers, n_agents=None, time_limit_seconds=DEFAULT_TIME_LIMIT_SECONDS, seed=0, rules=None):
+    """求解基准：合成实例单模型求解，记录目标值与每秒找到的解（路线方案）数"""
+    from .or_solver import solve_visit_scheduling
+
+    customers, agents = synthetic_instance(n_customers, n_agents, seed)
+    options = {"time_limit_seconds": time_limit_seconds, "stall_seconds": None}
+
+    def solve():
+        result = solve_visit_scheduling(customers, agents, rules or [], "", search_options=options,
+                                        use_cache=False)
+        return {"result": result}
+
+    measured = _measure(f"solve/n{n_customers}-m{len(agents)}", "solve", solve)
+    result = measured.pop("result")
+    solutions = measured["counters"].get("solve.solutions", 0)
+    measured.update({
+        "customers": n_customers,
+        "agents": len(agents),
+        "solved": result["solved"],
+        "objective": result["objective"],
+        "build_seconds": result["build_seconds"],
+        "search_seconds": result["search_seconds"],
+        "routes_per_second": round(solutions / max(result["search_seconds"], 1e-9), 1),
+    })
+    return [measured]
+
+def bench_render(n_customers, n_agents=None, seed=0):
+    """可视化基准：地图与时间线的构建时间和发送到浏览器的数据量"""
+    from .utils import plot_map, plot_schedule_timeline
+
+    customers, agents = synthetic_instance(n_customers, n_agents, seed)
+    # 按经度排序后轮流分配，得到空间上大致连续的路线
+    order = customers["id"].to_numpy()[np.argsort(customers["lon"].to_numpy())]
+    routes = {agent_id: order[i::len(agents)].tolist() for i, agent_id in enumerate(agents["id"])}
+
+    def render():
+        map_json = plot_map(customers, routes=routes, agents_df=agents).to_json()
+        timeline_json = plot_schedule_timeline(None, customers, routes=routes, agents_df=agents).to_json()
+        return {"payload_kb": round((len(map_json) + len(timeline_json)) / 1024, 1)}
+
+    return [_measure(f"render/n{n_customers}", "render", render)]
+
+def run_benchmarks(sizes=DEFAULT_SIZES, time_limit_seconds=DEFAULT_TIME_LIMIT_SECONDS, n_rules=200,
+                   n_extra_patterns=(0, 500), n_requests=8, n_vectors=5000, seed=0,
+                   stages=("retrieval", "generation", "solve")):
+    """依次运行各阶段基准，返回结果列表（每项一个 case）；"index" 阶段较慢，需显式指定"""
+    results = []
+    if "retrieval" in stages:
+        for n_extra in n_extra_patterns:
+            results.extend(bench_retrieval(n_rules, n_extra, seed))
+    if "index" in stages:
+        results.extend(bench_index(n_vectors, seed=seed))
+    if "generation" in stages:
+        results.extend(bench_generation(n_requests, seed=seed))
+    if "solve" in stages:
+        for n in sizes:
+            results.extend(bench_solve(n, time_limit_seconds=time_limit_seconds, seed=seed))
+    if "render" in stages:
+        for n in sizes:
+            results.extend(bench_render(n, seed=seed))
+    return results
+
+def save_baseline(results, path):
+    """把结果保存为基线：{"environment": ..., "cases": {case: 指标}}"""
+    baseline = {
+        "environment": {"python": platform.python_version(), "machine": platform.machine(),
+                        "cpus": os.cpu_count()},
+        "cases": {item["case"]: {key: value for key, value in item.items() if key != "case"} for item in results},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2, default=str)
+    return baseline
+
+def load_baseline(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def compare_to_baseline(results, baseline, tolerances=None):
+    """
+    与基线比较，返回回归列表 [{"case", "metric", "baseline", "current", "change"}]
+    耗时、内存与目标值越小越好，超过基线 (1 + 容忍幅度) 倍即视为回归；基线中没有的 case 忽略
+    """
+    tolerances = dict(DEFAULT_TOLERANCES, **(tolerances or {}))
+    regressions = []
+    for item in results:
+        reference = baseline.get("cases", {}).get(item["case"])
+        if reference is None:
+            continue
+        if reference.get("solved") and item.get("solved") is False:
+            regressions.append({"case": item["case"], "metric": "solved", "baseline": True,
+                                "current": False, "change": None})
+        for metric, tolerance in tolerances.items():
+            old, new = reference.get(metric), item.get(metric)
+            if old is None or new is None or old <= 0:
+                continue
+            change = (new - old) / old
+            if change > tolerance:
+                regressions.append({"case": item["case"], "metric": metric, "baseline": old,
+                                    "current": new, "change": round(change, 3)})
+    return regressions
+
+def format_results(results):
+    """结果表格（用于命令行输出）"""
+    columns = ["case", "wall_seconds", "peak_rss_mb", "objective", "routes_per_second",
+               "queries_per_second", "requests_per_second", "recall_at_k", "ms_per_query", "index_mb", "payload_kb"]
+    table = pd.DataFrame([{column: item.get(column) for column in columns} for item in results])
+    # 只保留至少有一个 case 记录了的指标
+    table = table.dropna(axis=1, how="all")
+    return table.to_string(index=False, na_rep="-")
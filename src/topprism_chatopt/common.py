@@ -0,0 +1,29 @@
+# common.py
+# Topprism-ChatOpt | 求解与可视化共用的常量与小工具
+# 只依赖 numpy，可视化模块导入时不加载 OR-Tools
+import numpy as np
+
+EARTH_RADIUS_METERS = 6371000.0
+DEFAULT_SPEED_KMH = 30.0  # 城市内平均行驶速度
+# 客户表的时间窗以小时为单位，模型中的时间以分钟为单位
+MINUTES_PER_HOUR = 60
+
+def entity_ids(df):
+    """客户/销售代表的业务编号，没有 id 列时使用行号"""
+    return df["id"].tolist() if "id" in df.columns else list(range(len(df)))
+
+def window_minutes(customers_df):
+    """客户时间窗的开始、结束（从零点起的分钟数）"""
+    start = customers_df["time_window_start"].to_numpy(dtype=np.int64) * MINUTES_PER_HOUR
+    end = customers_df["time_window_end"].to_numpy(dtype=np.int64) * MINUTES_PER_HOUR
+    return start, end
+
+def haversine_meters(lat1, lon1, lat2, lon2):
+    """两组点（弧度，可广播）之间的大圆距离（米）"""
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def travel_minutes(distance_meters, speed_kmh=DEFAULT_SPEED_KMH):
+    """行驶分钟数，向上取整"""
+    return np.ceil(np.asarray(distance_meters) / (speed_kmh * 1000.0 / 60.0)).astype(np.int64)
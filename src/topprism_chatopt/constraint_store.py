@@ -0,0 +1,158 @@
+# constraint_store.py
+# Topprism-ChatOpt | 约束代码的校验、编译与缓存
+import ast
+import builtins
+import hashlib
+import threading
+from collections import OrderedDict
+from ortools.constraint_solver import pywrapcp
+
+# 生成代码可直接使用的变量及其对应的 OR-Tools 类型
+NAMESPACE_TYPES = {
+    "routing": pywrapcp.RoutingModel,
+    "manager": pywrapcp.RoutingIndexManager,
+    "time_dimension": pywrapcp.RoutingDimension,
+    "customers_df": None,
+    "agents_df": None,
+    "customer_arrays": None,
+    "node_indices": None,
+}
+ALLOWED_IMPORTS = {"pandas", "numpy", "math"}
+# 不允许出现的名字：不只是直接调用，赋给别的变量（f = __import__）或作为参数传递同样拒绝；
+# getattr 一类可以用字符串绕过双下划线属性检查
+FORBIDDEN_NAMES = {
+    "exec", "eval", "compile", "open", "__import__", "globals", "locals", "vars", "input", "breakpoint",
+    "getattr", "setattr", "delattr",
+}
+
+class ConstraintCodeError(ValueError):
+    """生成的约束代码未通过校验"""
+
+class ConstraintArtifact:
+    """编译好的约束代码：代码对象 + 使用到的 OR-Tools API"""
+    def __init__(self, code_hash, source, code, apis):
+        self.code_hash = code_hash
+        self.source = source
+        self.code = code
+        self.apis = apis
+
+def code_hash(source):
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+def _bound_names(tree):
+    """代码中自行定义的名字（赋值、循环变量、导入别名、函数/类定义等）"""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, ast.alias):
+            names.add((node.asname or node.name).split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+    return names
+
+def validate(source, namespace_types=NAMESPACE_TYPES):
+    """
+    静态校验约束代码，返回使用到的 OR-Tools API 集合
+    校验项：语法、导入白名单、危险名字（无论是否直接调用）、双下划线名字与属性、未定义名字、不存在的 OR-Tools 方法
+    """
+    try:
+        tree = ast.parse(source, mode="exec")
+    except SyntaxError as e:
+        raise ConstraintCodeError(f"语法错误（第 {e.lineno} 行）: {e.msg}") from e
+
+    known = set(namespace_types) | _bound_names(tree) | set(dir(builtins))
+    apis = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name.split(".")[0] not in ALLOWED_IMPORTS:
+                    raise ConstraintCodeError(f"不允许导入模块: {alias.name}")
+        elif isinstance(node, ast.ImportFrom):
+            if (node.module or "").split(".")[0] not in ALLOWED_IMPORTS:
+                raise ConstraintCodeError(f"不允许导入模块: {node.module}")
+        elif isinstance(node, ast.Name) and (node.id in FORBIDDEN_NAMES or node.id.startswith("__")):
+            # 包括 __builtins__、__loader__ 等双下划线名字
+            raise ConstraintCodeError(f"不允许使用: {node.id}")
+        elif isinstance(node, ast.Attribute):
+            if node.attr.startswith("__"):
+                raise ConstraintCodeError(f"不允许访问属性: {node.attr}")
+            if isinstance(node.value, ast.Name) and node.value.id in namespace_types:
+                api_type = namespace_types[node.value.id]
+                if api_type is not None:
+                    if not hasattr(api_type, node.attr):
+                        raise ConstraintCodeError(f"{node.value.id} 没有方法 {node.attr}")
+                    apis.add(f"{node.value.id}.{node.attr}")
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in known:
+            raise ConstraintCodeError(f"未定义的名字: {node.id}")
+    return tree, apis
+
+class ConstraintStore:
+    """
+    约束代码产物仓库，按代码哈希缓存编译结果（包括校验失败的结果）
+    相同的代码只解析、校验、编译一次
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def get(self, source):
+        """返回编译好的 ConstraintArtifact；代码未通过校验时抛出 ConstraintCodeError"""
+        key = code_hash(source)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is None:
+            entry = self._build(key, source)
+            with self._lock:
+                self.misses += 1
+                if isinstance(entry, ConstraintCodeError):
+                    self.rejected += 1
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        if isinstance(entry, ConstraintCodeError):
+            raise entry
+        return entry
+
+    @staticmethod
+    def _build(key, source):
+        try:
+            tree, apis = validate(source)
+            code = compile(tree, f"<constraint-{key[:12]}>", "exec")
+        except ConstraintCodeError as e:
+            return e
+        return ConstraintArtifact(key, source, code, frozenset(apis))
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "rejected": self.rejected,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+            }
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_default_store():
+    """进程级默认约束代码仓库"""
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = ConstraintStore()
+    return _default_store
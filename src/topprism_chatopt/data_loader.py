@@ -0,0 +1,280 @@
+# data_loader.py
+# Topprism-ChatOpt | 客户与销售代表数据的校验、列式快照与分块加载
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from .rag_retriever import default_cache_dir
+
+PRIORITY_DTYPE = pd.CategoricalDtype(["A", "B", "C"], ordered=True)
+DEFAULT_CHUNKSIZE = 100_000
+SNAPSHOT_VERSION = 1
+
+# 列名 -> 类型（"str" 表示字符串列）；required 缺失时报错，optional 存在时才校验
+TABLES = {
+    "customers": {
+        "required": {
+            "id": "int64",
+            "name": "str",
+            "lat": "float32",
+            "lon": "float32",
+            "priority": PRIORITY_DTYPE,
+            "service_time_minutes": "int32",
+            "time_window_start": "int16",
+            "time_window_end": "int16",
+        },
+        "optional": {
+            "visit_frequency": "int16",
+            "available_days": "str",
+            "region": "str",
+        },
+        "coords": ("lat", "lon"),
+        "defaults": {"visit_frequency": 1},
+    },
+    "agents": {
+        "required": {
+            "id": "int64",
+            "name": "str",
+            "start_lat": "float32",
+            "start_lon": "float32",
+            "max_visits_per_day": "int32",
+        },
+        "optional": {
+            "end_lat": "float32",
+            "end_lon": "float32",
+            "region": "str",
+        },
+        "coords": ("start_lat", "start_lon"),
+        "defaults": {},
+    },
+}
+
+class SchemaError(ValueError):
+    """数据文件不符合约定的列与类型"""
+
+def validate_table(df, kind, source="数据"):
+    """
+    按 TABLES[kind] 校验并转换列类型，返回新的 DataFrame
+    约定的列排在前面，其余列原样保留
+    """
+    table = TABLES[kind]
+    missing = [column for column in table["required"] if column not in df.columns]
+    if missing:
+        raise SchemaError(f"{source} 缺少列: {', '.join(missing)}")
+
+    schema = dict(table["required"])
+    schema.update({c: t for c, t in table["optional"].items() if c in df.columns})
+    columns = {}
+    for column, dtype in schema.items():
+        series = df[column]
+        if column in table["defaults"]:
+            series = series.fillna(table["defaults"][column])
+        if dtype == "str":
+            columns[column] = series.fillna("").astype(str)
+            continue
+        if series.isna().any():
+            raise SchemaError(f"{source} 列 {column} 有 {int(series.isna().sum())} 个空值")
+        if isinstance(dtype, pd.CategoricalDtype):
+            invalid = ~series.isin(dtype.categories)
+            if invalid.any():
+                raise SchemaError(f"{source} 列 {column} 含有无效取值: {sorted(set(series[invalid].astype(str)))[:5]}")
+        try:
+            columns[column] = series.astype(dtype)
+        except (TypeError, ValueError) as e:
+            raise SchemaError(f"{source} 列 {column} 无法转换为 {dtype}: {str(e)}") from e
+
+    lat_column, lon_column = table["coords"]
+    for column, limit in ((lat_column, 90), (lon_column, 180)):
+        if (columns[column].abs() > limit).any():
+            raise SchemaError(f"{source} 列 {column} 超出经纬度范围")
+    if kind == "customers":
+        if ((columns["time_window_start"] < 0) | (columns["time_window_end"] > 24)
+                | (columns["time_window_start"] > columns["time_window_end"])).any():
+            raise SchemaError(f"{source} 时间窗口必须满足 0 <= time_window_start <= time_window_end <= 24")
+        if (columns["service_time_minutes"] < 0).any():
+            raise SchemaError(f"{source} 列 service_time_minutes 不能为负数")
+
+    result = pd.DataFrame(columns, index=df.index)
+    for column in df.columns:
+        if column not in result.columns:
+            result[column] = df[column]
+    return result.reset_index(drop=True)
+
+def _filter_mask(columns, coords, bbox, regions, n_rows):
+    """
+    按区域筛选：bbox=(min_lat, min_lon, max_lat, max_lon)，regions 匹配 region 列
+    columns 可以是 DataFrame 或 {列名: 数组}（快照的内存映射数组）
+    """
+    mask = np.ones(n_rows, dtype=bool)
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        lat = np.asarray(columns[coords[0]])
+        lon = np.asarray(columns[coords[1]])
+        mask &= (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+    if regions is not None:
+        if "region" not in columns:
+            raise SchemaError("按 regions 筛选需要 region 列")
+        mask &= np.isin(np.asarray(columns["region"]).astype(str), [str(r) for r in regions])
+    return mask
+
+def _iter_csv_chunks(path, kind, chunksize):
+    """分块读取 CSV，逐块校验后返回"""
+    table = TABLES[kind]
+    str_columns = {c: str for c, t in {**table["required"], **table["optional"]}.items() if t == "str"}
+    offset = 0
+    empty = True
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype=str_columns, keep_default_na=True):
+        source = f"{os.path.basename(path)}（第 {offset + 1} 行起）"
+        offset += len(chunk)
+        empty = False
+        yield validate_table(chunk, kind, source)
+    if empty:
+        yield validate_table(pd.read_csv(path, dtype=str_columns), kind, os.path.basename(path))
+
+def _read_csv_chunks(path, kind, chunksize, bbox=None, regions=None):
+    """分块读取 CSV，逐块校验并筛选，只保留需要的行"""
+    coords = TABLES[kind]["coords"]
+    frames = []
+    for chunk in _iter_csv_chunks(path, kind, chunksize):
+        if bbox is not None or regions is not None:
+            chunk = chunk[_filter_mask(chunk, coords, bbox, regions, len(chunk))]
+        frames.append(chunk)
+    return pd.concat(frames, ignore_index=True)
+
+def snapshot_dir(path, cache_dir=None):
+    """数据文件对应的快照目录，按文件绝对路径区分"""
+    cache_dir = cache_dir or os.path.join(default_cache_dir(), "data")
+    path = os.path.abspath(path)
+    digest = hashlib.sha1(path.encode("utf-8")).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{stem}-{digest}")
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+def _read_snapshot_meta(directory, path):
+    """快照有效时返回元数据；源文件的修改时间或大小变化时快照失效"""
+    try:
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != SNAPSHOT_VERSION or meta.get("source") != _source_stamp(path):
+        return None
+    return meta
+
+def save_snapshot(df, path, cache_dir=None):
+    """
+    把校验后的表按列保存为 .npy 快照，df 也可以是分块读取的 DataFrame 列表（逐列拼接，不合并整表）
+    数值列原样保存，分类列保存编码，字符串列保存为定长 Unicode 数组，都可以内存映射
+    meta.json 最后写入，作为快照完整的标记
+    """
+    chunks = df if isinstance(df, list) else [df]
+    directory = snapshot_dir(path, cache_dir)
+    stamp = _source_stamp(path)
+    tmp_suffix = f".{os.getpid()}.tmp"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        columns = []
+        for i, column in enumerate(chunks[0].columns):
+            series = chunks[0][column]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                values = np.concatenate([chunk[column].cat.codes.to_numpy() for chunk in chunks])
+                entry = {"name": column, "kind": "category",
+                         "categories": [str(c) for c in series.cat.categories],
+                         "ordered": bool(series.cat.ordered)}
+            elif pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+                values = np.concatenate([chunk[column].to_numpy() for chunk in chunks])
+                entry = {"name": column, "kind": "numeric"}
+            else:
+                values = np.concatenate([chunk[column].fillna("").astype(str).to_numpy().astype(str)
+                                         for chunk in chunks])
+                entry = {"name": column, "kind": "str"}
+            file_name = f"{i}.npy"
+            with open(os.path.join(directory, file_name + tmp_suffix), "wb") as f:
+                np.save(f, values)
+            os.replace(os.path.join(directory, file_name + tmp_suffix), os.path.join(directory, file_name))
+            entry["file"] = file_name
+            columns.append(entry)
+        meta = {"version": SNAPSHOT_VERSION, "source": stamp, "rows": sum(len(chunk) for chunk in chunks),
+                "columns": columns}
+        with open(meta_path + tmp_suffix, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(meta_path + tmp_suffix, meta_path)
+    except Exception as e:
+        print(f"数据快照写入失败: {str(e)}")
+
+def _load_snapshot(directory, meta, coords, bbox=None, regions=None):
+    """
+    以内存映射方式读取快照，先按区域筛选再只复制需要的行
+    不筛选时数值列直接使用内存映射（写时复制，修改不会写回文件），不复制到内存
+    """
+    arrays = {c["name"]: np.load(os.path.join(directory, c["file"]), mmap_mode="c") for c in meta["columns"]}
+    rows = None
+    if bbox is not None or regions is not None:
+        rows = np.flatnonzero(_filter_mask(arrays, coords, bbox, regions, meta["rows"]))
+
+    data = {}
+    for column in meta["columns"]:
+        values = arrays[column["name"]]
+        if rows is not None:
+            values = values[rows]
+        if column["kind"] == "category":
+            dtype = pd.CategoricalDtype(column["categories"], ordered=column["ordered"])
+            data[column["name"]] = pd.Categorical.from_codes(values, dtype=dtype)
+        elif column["kind"] == "str":
+            data[column["name"]] = values.astype(object)
+        else:
+            data[column["name"]] = values
+    return pd.DataFrame(data, copy=False)
+
+def load_table(path, kind, bbox=None, regions=None, cache_dir=None, use_snapshot=True,
+               chunksize=DEFAULT_CHUNKSIZE):
+    """
+    读取并校验数据表
+    use_snapshot 时优先读取内存映射的列式快照，快照不存在或源文件已修改时分块读取 CSV 后重建；
+    否则直接分块读取 CSV，只保留 bbox/regions 范围内的行
+    """
+    coords = TABLES[kind]["coords"]
+    if not use_snapshot:
+        return _read_csv_chunks(path, kind, chunksize, bbox, regions)
+
+    directory = snapshot_dir(path, cache_dir)
+    meta = _read_snapshot_meta(directory, path)
+    if meta is not None:
+        return _load_snapshot(directory, meta, coords, bbox, regions)
+
+    # 快照不存在或已失效：分块读取时即按区域筛选，同时保留完整分块重建快照
+    chunks = []
+    frames = []
+    filtering = bbox is not None or regions is not None
+    for chunk in _iter_csv_chunks(path, kind, chunksize):
+        chunks.append(chunk)
+        if filtering:
+            frames.append(chunk[_filter_mask(chunk, coords, bbox, regions, len(chunk))])
+    save_snapshot(chunks, path, cache_dir)
+    if filtering:
+        return pd.concat(frames, ignore_index=True)
+    # 不筛选时返回刚写入的内存映射快照，与之后的读取一致；写入失败时才合并分块
+    meta = _read_snapshot_meta(directory, path)
+    if meta is not None:
+        return _load_snapshot(directory, meta, coords)
+    return pd.concat(chunks, ignore_index=True)
+
+def load_customers(path, bbox=None, regions=None, **kwargs):
+    """读取客户数据，参数见 load_table"""
+    return load_table(path, "customers", bbox=bbox, regions=regions, **kwargs)
+
+def load_agents(path, bbox=None, regions=None, **kwargs):
+    """读取销售代表数据，参数见 load_table"""
+    return load_table(path, "agents", bbox=bbox, regions=regions, **kwargs)
+
+def clear_snapshot(path, cache_dir=None):
+    """删除数据文件对应的快照"""
+    shutil.rmtree(snapshot_dir(path, cache_dir), ignore_errors=True)
@@ -0,0 +1,181 @@
+# decomposition.py
+# Topprism-ChatOpt | 大规模客户的地理聚类分解求解
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .common import entity_ids
+from .or_solver import agent_capacities, solve_visit_scheduling
+from .search_monitor import polled_stop
+from .solve_result import merge_results
+
+DEFAULT_CLUSTER_SIZE = 200  # 每个子问题的目标客户数
+
+def _planar_coords(lat, lon):
+    """把经纬度投影到近似等距的平面坐标，便于按欧氏距离聚类"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    scale = np.cos(np.radians(lat.mean())) if len(lat) else 1.0
+    return np.column_stack([lat, lon * scale])
+
+def kmeans(points, n_clusters, n_iter=50, seed=0):
+    """
+    NumPy 实现的 k-means（k-means++ 初始化）
+    返回 (每个点的簇编号, 簇中心)
+    """
+    n_points = len(points)
+    n_clusters = max(1, min(n_clusters, n_points))
+    rng = np.random.default_rng(seed)
+
+    centers = [points[rng.integers(n_points)]]
+    for _ in range(1, n_clusters):
+        d2 = ((points[:, None, :] - np.array(centers)[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+        total = d2.sum()
+        if total == 0:
+            centers.append(points[rng.integers(n_points)])
+        else:
+            centers.append(points[rng.choice(n_points, p=d2 / total)])
+    centers = np.array(centers)
+
+    labels = None
+    for _ in range(n_iter):
+        d2 = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        new_labels = d2.argmin(axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for c in range(n_clusters):
+            members = points[labels == c]
+            if len(members):
+                centers[c] = members.mean(axis=0)
+    return labels, centers
+
+def assign_agents_to_clusters(cluster_demand, cluster_centers, agents_df):
+    """
+    按容量把销售代表分配到各簇：
+    每次取容量最大的未分配代表，分给剩余需求最大的簇（需求相同时取离出发点最近的簇）
+    保证每个有客户的簇至少分到一名代表
+    """
+    capacities = agent_capacities(agents_df)
+    if {"start_lat", "start_lon"} <= set(agents_df.columns):
+        agent_points = _planar_coords(agents_df["start_lat"], agents_df["start_lon"])
+    else:
+        agent_points = np.zeros((len(agents_df), 2))
+
+    remaining = np.asarray(cluster_demand, dtype=np.float64).copy()
+    assignment = [[] for _ in range(len(cluster_demand))]
+    order = np.argsort(-capacities, kind="stable")
+    for agent in order:
+        dist = np.sqrt(((cluster_centers - agent_points[agent]) ** 2).sum(axis=1))
+        unserved = [c for c in range(len(assignment)) if not assignment[c] and cluster_demand[c] > 0]
+        candidates = unserved if unserved else range(len(assignment))
+        cluster = min(candidates, key=lambda c: (-remaining[c], dist[c]))
+        assignment[cluster].append(int(agent))
+        remaining[cluster] -= capacities[agent]
+    return assignment
+
+def _solve_cluster(args):
+    customers_df, agents_df, rules, generated_code, search_options, should_stop = args
+    # should_stop 通常是跨进程 Event 的 is_set，改为在后台线程中轮询，搜索中只读取本地标志
+    with polled_stop(should_stop) as stopped:
+        return solve_visit_scheduling(customers_df, agents_df, rules, generated_code,
+                                      search_options=search_options, use_cache=False, should_stop=stopped)
+
+def _repair_overloaded(labels, points, centers, cluster_capacity):
+    """
+    边界修复：超出容量的簇把离自身中心最远、离邻簇最近的客户移给有剩余容量的邻簇
+    """
+    labels = labels.copy()
+    load = np.bincount(labels, minlength=len(centers))
+    moved = set()
+    d2 = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    for c in np.argsort(-(load - cluster_capacity)):
+        while load[c] > cluster_capacity[c]:
+            spare = np.flatnonzero(load < cluster_capacity)
+            if len(spare) == 0:
+                return labels, moved
+            members = np.flatnonzero(labels == c)
+            # 代价 = 移到邻簇增加的距离，越小越靠近簇边界
+            extra = d2[members][:, spare] - d2[members, c][:, None]
+            i, j = np.unravel_index(np.argmin(extra), extra.shape)
+            node, target = members[i], spare[j]
+            labels[node] = target
+            load[c] -= 1
+            load[target] += 1
+            moved.update((int(c), int(target)))
+    return labels, moved
+
+def solve_decomposed(customers_df, agents_df, rules, generated_code="", cluster_size=DEFAULT_CLUSTER_SIZE,
+                     search_options=None, max_workers=None, max_repair_rounds=2, seed=0, should_stop=None):
+    """
+    大规模客户的分解求解
+    1. 按经纬度把客户聚成若干簇，簇数不超过销售代表数
+    2. 按容量（max_visits_per_day）把代表分配到各簇
+    3. 各簇子问题通过 solve_visit_scheduling 并行求解
+    4. 对超载或求解失败的簇做边界修复：把边界客户移到有余量的邻簇后重新求解受影响的簇
+    返回与 solve_visit_scheduling 相同结构的结果
+    should_stop: 无参回调（需可 pickle，如 multiprocessing 的 Event.is_set），返回 True 时各簇提前结束搜索
+    """
+    n_customers = len(customers_df)
+    n_agents = len(agents_df)
+    if n_customers <= cluster_size or n_agents <= 1:
+        with polled_stop(should_stop) as stopped:
+            return solve_visit_scheduling(customers_df, agents_df, rules, generated_code,
+                                          search_options=search_options, should_stop=stopped)
+
+    points = _planar_coords(customers_df["lat"], customers_df["lon"])
+    n_clusters = min(n_agents, math.ceil(n_customers / cluster_size))
+    labels, centers = kmeans(points, n_clusters, seed=seed)
+    demand = np.bincount(labels, minlength=len(centers))
+    agent_groups = assign_agents_to_clusters(demand, centers, agents_df)
+    capacities = agent_capacities(agents_df)
+    cluster_capacity = np.array([capacities[g].sum() for g in agent_groups])
+
+    # 先按容量做一次边界修复，避免明显超载的子问题
+    labels, _ = _repair_overloaded(labels, points, centers, cluster_capacity)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    results = {}
+    to_solve = set(range(len(centers)))
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(centers))) as executor:
+        for round_ in range(max_repair_rounds + 1):
+            tasks = {}
+            for c in sorted(to_solve):
+                members = np.flatnonzero(labels == c)
+                if len(members) == 0 or not agent_groups[c]:
+                    results[c] = None
+                    continue
+                sub_customers = customers_df.iloc[members].reset_index(drop=True)
+                sub_agents = agents_df.iloc[agent_groups[c]].reset_index(drop=True)
+                tasks[c] = executor.submit(_solve_cluster, (sub_customers, sub_agents, rules,
+                                                            generated_code, search_options, should_stop))
+            for c, future in tasks.items():
+                results[c] = future.result()
+
+            failed = [c for c, r in results.items() if r is not None and not r["solved"]]
+            if not failed or round_ == max_repair_rounds or (should_stop is not None and should_stop()):
+                break
+            # 求解失败的簇视为超载：按实际客户数收紧容量后把边界客户移走
+            load = np.bincount(labels, minlength=len(centers))
+            tightened = cluster_capacity.copy()
+            for c in failed:
+                tightened[c] = max(0, load[c] - max(1, load[c] // 10))
+            labels, moved = _repair_overloaded(labels, points, centers, tightened)
+            to_solve = moved | set(failed)
+
+    return _merge_results(results, agent_groups, customers_df, agents_df, labels)
+
+def _merge_results(results, agent_groups, customers_df, agents_df, labels):
+    """把各簇结果按销售代表原顺序拼接成 SolveResult，客户与代表的行号映射回完整问题"""
+    parts = [(results[c], np.flatnonzero(labels == c), agent_groups[c], 0) for c in sorted(results)]
+    solved = all(result is None or result["solved"] for result in results.values())
+    fields = {
+        "status": "success",
+        "solved": solved,
+        "objective": sum(r["objective"] for r in results.values() if r is not None) if solved else None,
+        "warm_started": False,
+        "from_cache": False,
+        "clusters": labels.tolist(),
+    }
+    return merge_results(fields, parts, entity_ids(customers_df), customers_df["name"].tolist(),
+                         entity_ids(agents_df), agents_df["name"].tolist())
@@ -0,0 +1,223 @@
+# horizon.py
+# Topprism-ChatOpt | 多日/周期排程：客户分配到各天后按天并行求解
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .common import entity_ids
+from .decomposition import _planar_coords
+from .or_solver import (
+    DEFAULT_SEARCH_OPTIONS,
+    _copy_result,
+    agent_capacities,
+    solve_visit_scheduling,
+)
+from .search_monitor import default_stall_window, default_time_limit
+from .solve_cache import solve_fingerprint
+from .solve_result import SolveResult, empty_arrays, merge_results
+
+DAY_NAMES = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+DEFAULT_N_DAYS = 5
+PRIORITY_ORDER = {"A": 0, "B": 1, "C": 2}
+
+def _visit_frequency(customers_df, n_days):
+    """每个客户在周期内的拜访次数（visit_frequency 列，缺省为 1，不超过天数）"""
+    if "visit_frequency" in customers_df.columns:
+        frequency = customers_df["visit_frequency"].fillna(1).to_numpy(dtype=np.int64)
+    else:
+        frequency = np.ones(len(customers_df), dtype=np.int64)
+    return np.clip(frequency, 1, n_days)
+
+def _available_days(value, n_days):
+    """available_days 列的取值（如 "0,2,4"），为空时所有天都可以"""
+    if value is None or (isinstance(value, float) and np.isnan(value)) or str(value).strip() == "":
+        return set(range(n_days))
+    days = {int(day) for day in str(value).replace("，", ",").split(",") if day.strip() != ""}
+    return {day for day in days if 0 <= day < n_days}
+
+def day_patterns(frequency, n_days):
+    """拜访 frequency 次时可选的日期组合：在周期内均匀间隔，起始日依次平移"""
+    patterns = []
+    for offset in range(n_days):
+        days = tuple(sorted({(offset + (k * n_days) // frequency) % n_days for k in range(frequency)}))
+        if days not in patterns:
+            patterns.append(days)
+    return patterns
+
+def assign_days(customers_df, agents_df, n_days=DEFAULT_N_DAYS, previous_assignment=None):
+    """
+    把客户分配到周期内的各天，返回 {客户id: [日期序号, ...]}
+    - 拜访次数取 visit_frequency，日期在周期内均匀间隔
+    - 只在 available_days 允许的日期拜访
+    - 优先选择负载最低的日期组合，负载相同时选离当天已分配客户中心最近的组合
+    - 提供 previous_assignment 时，拜访次数未变且日期仍可用的客户保持原来的日期
+    A 类客户与拜访次数多的客户先分配；每天的负载上限为所有销售代表的拜访上限之和，
+    超出上限时仍分配到负载最低的组合
+    """
+    customer_ids = entity_ids(customers_df)
+    frequency = _visit_frequency(customers_df, n_days)
+    points = _planar_coords(customers_df["lat"], customers_df["lon"])
+    day_capacity = int(agent_capacities(agents_df).sum()) if len(agents_df) else 0
+    if "available_days" in customers_df.columns:
+        available = [_available_days(v, n_days) for v in customers_df["available_days"]]
+    else:
+        available = [set(range(n_days))] * len(customers_df)
+
+    load = np.zeros(n_days, dtype=np.int64)
+    coord_sum = np.zeros((n_days, 2))
+    assignment = {}
+    pending = []
+    previous_assignment = previous_assignment or {}
+    for node, customer_id in enumerate(customer_ids):
+        days = previous_assignment.get(customer_id)
+        if days is not None and len(days) == frequency[node] and set(days) <= available[node]:
+            assignment[customer_id] = sorted(days)
+            for day in days:
+                load[day] += 1
+                coord_sum[day] += points[node]
+        else:
+            pending.append(node)
+
+    if "priority" in customers_df.columns:
+        priority_rank = customers_df["priority"].map(PRIORITY_ORDER).fillna(len(PRIORITY_ORDER)).to_numpy()
+    else:
+        priority_rank = np.zeros(len(customers_df))
+    pending.sort(key=lambda node: (priority_rank[node], -frequency[node], node))
+
+    for node in pending:
+        patterns = [p for p in day_patterns(int(frequency[node]), n_days) if set(p) <= available[node]]
+        if not patterns:
+            # 可用日期不足以均匀间隔时，直接取可用日期中负载最低的几天
+            days = sorted(available[node] or range(n_days), key=lambda d: (load[d], d))
+            patterns = [tuple(sorted(days[:frequency[node]]))]
+        best = None
+        for pattern in patterns:
+            pattern_load = load[list(pattern)]
+            over = int(np.maximum(pattern_load + 1 - day_capacity, 0).sum()) if day_capacity else 0
+            distance = 0.0
+            for day in pattern:
+                if load[day]:
+                    distance += float(np.sqrt(((coord_sum[day] / load[day] - points[node]) ** 2).sum()))
+            key = (over, int(pattern_load.max()), distance)
+            if best is None or key < best[0]:
+                best = (key, pattern)
+        pattern = best[1]
+        assignment[customer_ids[node]] = list(pattern)
+        for day in pattern:
+            load[day] += 1
+            coord_sum[day] += points[node]
+    return assignment
+
+def _day_members(customers_df, assignment, day):
+    """当天拜访的客户行号"""
+    customer_ids = entity_ids(customers_df)
+    return np.array([node for node, cid in enumerate(customer_ids) if day in assignment.get(cid, ())],
+                    dtype=np.int32)
+
+def _solve_day(args):
+    customers_df, agents_df, rules, generated_code, search_options, initial_routes = args
+    return solve_visit_scheduling(customers_df, agents_df, rules, generated_code,
+                                  search_options=search_options, use_cache=False,
+                                  initial_routes=initial_routes)
+
+def _empty_day_result(agents_df):
+    fields = {
+        "status": "success",
+        "solved": True,
+        "objective": 0,
+        "solver_status": "ROUTING_SUCCESS",
+        "trajectory": [],
+        "stop_reason": "empty",
+        "build_seconds": 0.0,
+        "search_seconds": 0.0,
+        "warm_started": False,
+        "from_cache": False,
+    }
+    return SolveResult(fields, empty_arrays(len(agents_df)), [], [],
+                       entity_ids(agents_df), agents_df["name"].tolist())
+
+def plan_horizon(customers_df, agents_df, rules, generated_code="", n_days=DEFAULT_N_DAYS,
+                 search_options=None, max_workers=None, previous_plan=None, changed_days=None):
+    """
+    周期排程
+    1. assign_days 把客户按拜访次数与可用日期分配到各天
+    2. 各天的路线问题通过 solve_visit_scheduling 在多个进程中并行求解，模型只按天构建
+    滚动模式：传入上一轮的计划作为 previous_plan 时，客户尽量保持原来的日期，
+    只有客户集合或参数发生变化的日期（以及 changed_days 中指定的日期）重新求解，
+    重新求解时以上一轮当天的路线热启动；其余日期直接复用上一轮的结果
+    """
+    options = dict(DEFAULT_SEARCH_OPTIONS)
+    options.update(search_options or {})
+    previous_assignment = previous_plan["assignment"] if previous_plan else None
+    assignment = assign_days(customers_df, agents_df, n_days, previous_assignment)
+
+    # 每天的子问题指纹，与上一轮相同的日期不再求解
+    day_members = [_day_members(customers_df, assignment, day) for day in range(n_days)]
+    day_frames = [customers_df.iloc[members].reset_index(drop=True) for members in day_members]
+    day_keys = []
+    for day, frame in enumerate(day_frames):
+        day_options = dict(options)
+        if day_options["time_limit_seconds"] is None:
+            day_options["time_limit_seconds"] = default_time_limit(len(frame))
+        if day_options["stall_seconds"] == "auto":
+            day_options["stall_seconds"] = default_stall_window(day_options["time_limit_seconds"])
+        day_keys.append(solve_fingerprint(frame, agents_df, rules, generated_code, day_options))
+
+    forced = set(changed_days or ())
+    results = [None] * n_days
+    to_solve = []
+    for day in range(n_days):
+        if len(day_frames[day]) == 0:
+            results[day] = _empty_day_result(agents_df)
+        elif (previous_plan is not None and day not in forced and day < len(previous_plan["day_keys"])
+              and previous_plan["day_keys"][day] == day_keys[day]):
+            results[day] = _copy_result(previous_plan["days"][day], from_cache=True)
+        else:
+            to_solve.append(day)
+
+    if to_solve:
+        tasks = []
+        for day in to_solve:
+            initial_routes = None
+            if previous_plan is not None and day < len(previous_plan["days"]):
+                previous_day = previous_plan["days"][day]
+                if previous_day["solved"] and any(previous_day["routes"].values()):
+                    initial_routes = previous_day["routes"]
+            tasks.append((day_frames[day], agents_df, rules, generated_code, search_options, initial_routes))
+        max_workers = max_workers or os.cpu_count() or 1
+        if max_workers == 1 or len(tasks) == 1:
+            solved = [_solve_day(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+                solved = list(executor.map(_solve_day, tasks))
+        for day, result in zip(to_solve, solved):
+            results[day] = result
+
+    return _merge_days(results, day_members, customers_df, agents_df, assignment, day_keys, to_solve)
+
+def _day_label(day, n_days):
+    return DAY_NAMES[day % len(DAY_NAMES)] if n_days <= len(DAY_NAMES) else f"第{day + 1}天"
+
+def _merge_days(results, day_members, customers_df, agents_df, assignment, day_keys, reoptimized_days):
+    """
+    把各天结果拼接成一个 SolveResult：第 day 天第 v 位代表的路线为第 day * 代表数 + v 条，
+    客户行号映射回完整的客户表，排程表带日期列，routes 为每位代表按日期顺序连接的拜访客户
+    """
+    n_days = len(results)
+    n_agents = len(agents_df)
+    agent_rows = np.arange(n_agents)
+    parts = [(result, day_members[day], agent_rows, day * n_agents) for day, result in enumerate(results)]
+    solved = all(result["solved"] for result in results)
+    fields = {
+        "status": "success",
+        "solved": solved,
+        "objective": sum(result["objective"] for result in results) if solved else None,
+        "warm_started": False,
+        "from_cache": False,
+        "days": results,
+        "day_labels": [_day_label(day, n_days) for day in range(n_days) for _ in range(n_agents)],
+        "assignment": assignment,
+        "day_keys": day_keys,
+        "reoptimized_days": list(reoptimized_days),
+    }
+    return merge_results(fields, parts, entity_ids(customers_df), customers_df["name"].tolist(),
+                         entity_ids(agents_df) * n_days, agents_df["name"].tolist() * n_days, n_agents=n_agents)
@@ -0,0 +1,309 @@
+# jobs.py
+# Topprism-ChatOpt | 后台求解任务队列
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from .decomposition import solve_decomposed
+from .or_solver import _cacheable, _copy_result, resolve_search_options, solve_key, solve_visit_scheduling
+from .search_monitor import polled_stop
+from .solve_cache import get_default_cache
+from .tracing import get_default_tracer
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = {DONE, FAILED, CANCELLED}
+
+DEFAULT_MAX_QUEUE = 16
+DEFAULT_HISTORY = 100
+PROGRESS_POLL_SECONDS = 0.2
+
+class JobQueueFull(RuntimeError):
+    """排队中的任务数已达上限"""
+
+class SolveJob:
+    """一个求解任务的状态，由后台线程更新，界面通过 snapshot() 轮询"""
+    def __init__(self, job_id, key, cancel_event):
+        self.id = job_id
+        self.key = key
+        self.cancel_event = cancel_event
+        self.status = QUEUED
+        self.progress = []  # [(秒, 目标值)]
+        self.best_objective = None
+        self.best_routes = None
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def _on_progress(self, kind, payload):
+        with self._lock:
+            if self.status in FINISHED:
+                return
+            if kind == "started":
+                self.status = RUNNING
+                self.started_at = payload
+            elif kind == "solution":
+                elapsed, objective, routes = payload
+                self.progress.append((elapsed, objective))
+                self.best_objective = objective
+                self.best_routes = routes
+
+    def _finish(self, status, result=None, error=None):
+        with self._lock:
+            if self.status in FINISHED:
+                return
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+            if result is not None and result.get("objective") is not None:
+                self.best_objective = result["objective"]
+                self.best_routes = result["routes"]
+        self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """等待任务结束，超时返回 False"""
+        return self._done.wait(timeout)
+
+    def snapshot(self):
+        """当前状态的副本，供界面渲染"""
+        with self._lock:
+            now = self.finished_at or time.time()
+            return {
+                "id": self.id,
+                "status": self.status,
+                "progress": list(self.progress),
+                "best_objective": self.best_objective,
+                "best_routes": self.best_routes,
+                "result": self.result,
+                "error": self.error,
+                "elapsed": round(now - (self.started_at or self.submitted_at), 3),
+            }
+
+def _run_job(job_id, customers_df, agents_df, rules, generated_code, options, initial_routes,
+             progress_queue, cancel_event, cluster_size=None):
+    """在 worker 进程中执行，进度通过 progress_queue 发回主进程；cluster_size 不为空时分解求解"""
+    if cancel_event.is_set():
+        return None
+    progress_queue.put((job_id, "started", time.time()))
+    start = time.monotonic()
+
+    def on_routes(objective, routes):
+        progress_queue.put((job_id, "solution", (round(time.monotonic() - start, 3), objective, routes)))
+
+    # 各阶段的耗时与计数随结果交回主进程
+    with get_default_tracer().capture() as trace:
+        if cluster_size:
+            # 分解求解的各簇在子进程中搜索，不逐解发布进度；Event 代理可以传给子进程，由各簇自行轮询
+            result = solve_decomposed(customers_df, agents_df, rules, generated_code, cluster_size=cluster_size,
+                                      search_options=options, should_stop=cancel_event.is_set)
+        else:
+            # 取消信号在后台线程中轮询，搜索中只读取本地标志，不与 Manager 进程通信
+            with polled_stop(cancel_event.is_set) as cancelled:
+                result = solve_visit_scheduling(customers_df, agents_df, rules, generated_code,
+                                                search_options=options, use_cache=False,
+                                                initial_routes=initial_routes,
+                                                should_stop=cancelled, on_routes=on_routes)
+    result["trace"] = trace
+    return result
+
+class JobManager:
+    """
+    后台求解任务管理
+    - worker 进程数固定为 max_workers，排队任务超过 max_queue 时拒绝新任务（JobQueueFull）
+    - 相同指纹的任务在进行中时直接返回已有任务；求解缓存命中时任务立即完成
+    - 搜索中每找到更优解就发布目标值与路线，任务可随时取消（保留已找到的最好结果）
+    """
+    def __init__(self, max_workers=None, max_queue=DEFAULT_MAX_QUEUE, history=DEFAULT_HISTORY, cache=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.history = history
+        self.cache = cache
+        self._jobs = OrderedDict()
+        self._active = {}  # 指纹 -> 进行中的任务
+        self._lock = threading.Lock()
+        self._executor = None
+        self._mp_manager = None
+        self._progress_queue = None
+        self._pump = None
+        self._closed = False
+        self.deduplicated = 0
+        self.rejected = 0
+
+    def _start(self):
+        """首次提交任务时才启动 worker 进程与进度线程"""
+        if self._executor is None:
+            ctx = multiprocessing.get_context()
+            self._mp_manager = ctx.Manager()
+            self._progress_queue = self._mp_manager.Queue()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx)
+            self._pump = threading.Thread(target=self._pump_progress, daemon=True)
+            self._pump.start()
+
+    def _pump_progress(self):
+        while not self._closed:
+            try:
+                job_id, kind, payload = self._progress_queue.get(timeout=PROGRESS_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job._on_progress(kind, payload)
+
+    def pending(self):
+        """排队中与运行中的任务数"""
+        with self._lock:
+            return len(self._active)
+
+    def submit(self, customers_df, agents_df, rules, generated_code="", search_options=None, initial_routes=None,
+               cluster_size=None):
+        """
+        提交求解任务，返回任务 id
+        cluster_size 不为空时按地理聚类分解求解（见 decomposition.solve_decomposed），此时不热启动
+        """
+        if cluster_size:
+            initial_routes = None
+            options = resolve_search_options(search_options, min(len(customers_df), cluster_size))
+        else:
+            options = resolve_search_options(search_options, len(customers_df), warm_start=bool(initial_routes))
+        options["log_search"] = False
+        key_options = dict(options, cluster_size=cluster_size) if cluster_size else options
+        key = solve_key(customers_df, agents_df, rules, generated_code, key_options, initial_routes)
+        cache = self.cache if self.cache is not None else get_default_cache()
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("任务队列已关闭")
+            active = self._active.get(key)
+            if active is not None:
+                self.deduplicated += 1
+                return active.id
+
+            cached = cache.get(key)
+            if cached is not None:
+                job = SolveJob(uuid.uuid4().hex, key, None)
+                self._remember(job)
+                job._finish(DONE, _copy_result(cached, from_cache=True))
+                return job.id
+
+            if len(self._active) >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise JobQueueFull(f"求解任务过多（{len(self._active)} 个进行中），请稍后再试")
+
+            self._start()
+            job = SolveJob(uuid.uuid4().hex, key, self._mp_manager.Event())
+            self._remember(job)
+            self._active[key] = job
+            job.future = self._executor.submit(
+                _run_job, job.id, customers_df, agents_df, rules, generated_code, options,
+                initial_routes, self._progress_queue, job.cancel_event, cluster_size,
+            )
+        job.future.add_done_callback(lambda future: self._on_done(job, future, cache))
+        return job.id
+
+    def _remember(self, job):
+        self._jobs[job.id] = job
+        finished = [job_id for job_id, j in self._jobs.items() if j.done]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    def _on_done(self, job, future, cache):
+        with self._lock:
+            self._active.pop(job.key, None)
+        try:
+            result = future.result()
+        except CancelledError:
+            job._finish(CANCELLED)
+            return
+        except Exception as e:
+            job._finish(FAILED, error=str(e))
+            return
+        if result is None:
+            job._finish(CANCELLED)
+            return
+        get_default_tracer().replay(result.pop("trace", []))
+        if job.cancel_event.is_set():
+            # 取消时保留已找到的最好结果，但不写入缓存
+            job._finish(CANCELLED, result)
+        else:
+            if _cacheable(result):
+                cache.put(job.key, _copy_result(result))
+            job._finish(DONE, result)
+
+    def get(self, job_id):
+        """返回任务对象，不存在（或已被淘汰）时返回 None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id):
+        """任务状态快照，不存在时返回 None"""
+        job = self.get(job_id)
+        return job.snapshot() if job is not None else None
+
+    def cancel(self, job_id):
+        """取消任务：排队中的直接取消，运行中的通知搜索尽快停止"""
+        job = self.get(job_id)
+        if job is None or job.done:
+            return False
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            with self._lock:
+                self._active.pop(job.key, None)
+            job._finish(CANCELLED)
+        return True
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+            return {
+                "queued": statuses.count(QUEUED),
+                "running": statuses.count(RUNNING),
+                "finished": sum(status in FINISHED for status in statuses),
+                "deduplicated": self.deduplicated,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self, cancel_running=True):
+        """关闭 worker 进程；cancel_running 时先取消所有未完成的任务"""
+        if cancel_running:
+            for job_id in list(self._jobs):
+                self.cancel(job_id)
+        with self._lock:
+            self._closed = True
+            executor, mp_manager = self._executor, self._mp_manager
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+            if self._pump is not None:
+                self._pump.join()
+            mp_manager.shutdown()
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+def get_default_job_manager():
+    """进程级默认任务队列，所有会话共享同一组 worker 进程"""
+    global _default_manager
+    if _default_manager is None:
+        with _default_manager_lock:
+            if _default_manager is None:
+                _default_manager = JobManager()
+    return _default_manager
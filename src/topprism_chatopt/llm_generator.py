@@ -1,24 +1,192 @@
 # llm_generator.py
+import asyncio
+import concurrent.futures
+import hashlib
 import json
+import os
+import threading
+import time
+from collections import OrderedDict
 from typing import List
 import re
+from .singleflight import SingleFlight
+from .tracing import count, span
 
-# 延迟导入OpenAI，避免初始化错误
-client = None
+LLM_BASE_URL = os.environ.get("TOPPRISM_LLM_BASE_URL", "http://localhost:1234/v1")
+LLM_MODEL = os.environ.get("TOPPRISM_LLM_MODEL", "gemma-3")
+LLM_TIMEOUT_SECONDS = 60.0
+LLM_TEMPERATURE = 0.1
+LLM_MAX_TOKENS = 512
+SYSTEM_PROMPT = "You are Topprism-ChatOpt, a precise optimization modeling assistant. Output only code. Do not include import statements or function definitions. Use the provided variables directly: routing, manager, time_dimension, customers_df, agents_df, customer_arrays, node_indices."
 
-def get_openai_client():
-    global client
-    if client is None:
-        try:
-            from openai import OpenAI
-            client = OpenAI(
-                base_url="http://localhost:1234/v1",
-                api_key="not-needed"
+class LLMUnavailableError(RuntimeError):
+    """本地模型客户端无法创建"""
+
+class ResponseCache:
+    """
+    LLM 响应缓存：按提示词哈希缓存，条目超过 TTL 失效，超过容量时淘汰最久未使用的条目
+    """
+    def __init__(self, max_entries=256, ttl_seconds=3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+def prompt_hash(model, messages, temperature=LLM_TEMPERATURE, max_tokens=LLM_MAX_TOKENS):
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class AsyncLLMService:
+    """
+    异步 LLM 调用服务
+    所有请求在同一个后台事件循环上执行，共享一个 AsyncOpenAI 客户端（连接池），
+    因此不同线程中的 Streamlit 会话也复用同一组连接。
+    同步调用方用 complete()，异步调用方用 acomplete()，两者都先查响应缓存，
+    相同提示词的并发请求合并为一次生成（只有首个请求收到 on_token 回调）。
+    """
+    def __init__(self, base_url=LLM_BASE_URL, model=LLM_MODEL, timeout=LLM_TIMEOUT_SECONDS,
+                 max_concurrency=4, cache=None):
+        self.base_url = base_url
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.cache = cache if cache is not None else ResponseCache()
+        self.flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._semaphore = None
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="topprism-llm", daemon=True)
+                thread.start()
+                self._loop = loop
+                self._thread = thread
+            return self._loop
+
+    def _get_client(self):
+        # 只在服务事件循环内调用，无需加锁
+        if self._client is None:
+            try:
+                from openai import AsyncOpenAI
+            except Exception as e:
+                raise LLMUnavailableError(f"OpenAI客户端初始化失败: {str(e)}") from e
+            self._client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key="not-needed",
+                timeout=self.timeout,
+                max_retries=0
             )
-        except Exception as e:
-            print(f"OpenAI客户端初始化失败: {str(e)}")
-            client = None
-    return client
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def _stream_completion(self, messages, on_token):
+        llm_client = self._get_client()
+        async with self._semaphore:
+            stream = await llm_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=LLM_TEMPERATURE,
+                max_tokens=LLM_MAX_TOKENS,
+                stream=True
+            )
+            parts = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if token:
+                    parts.append(token)
+                    if on_token is not None:
+                        on_token(token)
+        return "".join(parts).strip()
+
+    async def _complete(self, messages, key, on_token):
+        with span("llm.stream", model=self.model):
+            text = await asyncio.wait_for(self._stream_completion(messages, on_token), self.timeout)
+        self.cache.put(key, text)
+        return text
+
+    def submit(self, messages, on_token=None):
+        """提交请求，返回 concurrent.futures.Future；缓存命中时直接返回已完成的 Future"""
+        key = prompt_hash(self.model, messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            count("llm.cache_hits")
+            future = concurrent.futures.Future()
+            future.set_result(cached)
+            return future
+        count("llm.requests")
+        return self.flight.join(
+            key,
+            lambda: asyncio.run_coroutine_threadsafe(self._complete(messages, key, on_token), self._ensure_loop())
+        )
+
+    def complete(self, messages, on_token=None):
+        """同步调用，阻塞直到生成完成或超时"""
+        return self.submit(messages, on_token).result(timeout=self.timeout + 1)
+
+    async def acomplete(self, messages, on_token=None):
+        """异步调用，可在任意事件循环中 await"""
+        return await asyncio.wrap_future(self.submit(messages, on_token))
+
+    def close(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._client is not None:
+            asyncio.run_coroutine_threadsafe(self._client.close(), loop).result(timeout=5)
+            self._client = None
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=5)
+        loop.close()
+
+_llm_service = None
+_llm_service_lock = threading.Lock()
+
+def get_llm_service():
+    """进程级共享的 LLM 服务"""
+    global _llm_service
+    if _llm_service is None:
+        with _llm_service_lock:
+            if _llm_service is None:
+                _llm_service = AsyncLLMService()
+    return _llm_service
 
 def parse_rule_parameters(rule: str, pattern_item: dict) -> dict:
     """
@@ -43,7 +211,8 @@ def parse_rule_parameters(rule: str, pattern_item: dict) -> dict:
     
     # 处理优先级规则
     if "A类客户优先安排" in rule:
-        parameters["penalty"] = "1000"  # 高优先级客户的低惩罚值
+        # 未拜访惩罚已按距离单位换算（见 or_solver.drop_penalty_unit），惩罚越大越不会被放弃
+        parameters["penalty"] = "int(customer_arrays['penalty'].max())"
     
     return parameters
 
@@ -53,6 +222,7 @@ def generate_model_code_with_knowledge(rules: List[str], context_items: list, cu
     """
     code_lines = [
         "# Topprism-ChatOpt 自动生成的约束代码",
+        "import numpy as np",
         "import pandas as pd",
         ""
     ]
@@ -69,11 +239,11 @@ def generate_model_code_with_knowledge(rules: List[str], context_items: list, cu
         if context_item.get("intent") == "service_time_window":
             # 添加时间窗口约束代码
             code_lines.append("# 添加时间窗口约束")
-            code_lines.append("for i, customer in customers_df.iterrows():")
-            code_lines.append("    if customer['priority'] == 'A':  # 以A类客户为例")
-            code_lines.append("        index = manager.NodeToIndex(i)")
-            code_lines.append("        if index != -1:")
-            code_lines.append("            time_dimension.CumulVar(index).SetRange(int(customer['time_window_start']) * 60, int(customer['time_window_end']) * 60)")
+            code_lines.append("window_nodes = np.flatnonzero((customer_arrays['priority'] == 'A') & (node_indices != -1))  # 以A类客户为例")
+            code_lines.append("for index, start, end in zip(node_indices[window_nodes].tolist(),")
+            code_lines.append("                             customer_arrays['window_start'][window_nodes].tolist(),")
+            code_lines.append("                             customer_arrays['window_end'][window_nodes].tolist()):")
+            code_lines.append("    time_dimension.CumulVar(index).SetRange(start, end)")
             code_lines.append("")
         # 特殊处理访问次数约束
         elif context_item.get("intent") == "limit_visit_count":
@@ -84,21 +254,16 @@ def generate_model_code_with_knowledge(rules: List[str], context_items: list, cu
         elif context_item.get("intent") == "maximize_priority":
             code_lines.append("# 添加优先级约束")
             code_lines.append("# 优先安排A类客户")
-            code_lines.append("for i, customer in customers_df.iterrows():")
-            code_lines.append("    if customer['priority'] == 'A':")
-            code_lines.append("        index = manager.NodeToIndex(i)")
-            code_lines.append("        if index != -1:")
-            code_lines.append("            routing.AddDisjunction([index], 1000)  # 低惩罚值表示高优先级")
+            code_lines.append("priority_nodes = np.flatnonzero((customer_arrays['penalty'] > 0) & (node_indices != -1))")
+            code_lines.append("for index, penalty in zip(node_indices[priority_nodes].tolist(),")
+            code_lines.append("                          customer_arrays['penalty'][priority_nodes].tolist()):")
+            code_lines.append("    routing.AddDisjunction([index], penalty)  # 惩罚高于任何绕路距离，只有无法安排时才放弃")
             code_lines.append("")
     
     return "\n".join(code_lines)
 
-def generate_model_code(rules: List[str], context_items: list, customers_df=None, agents_df=None) -> str:
-    """
-    使用本地模型生成 OR-Tools 建模代码
-    支持 Topprism-ChatOpt 知识库增强
-    """
-    # 首先尝试基于知识库直接生成代码
+def _knowledge_based_code(rules, context_items, customers_df, agents_df):
+    """基于知识库直接生成代码，失败时返回 None"""
     if context_items:
         try:
             knowledge_based_code = generate_model_code_with_knowledge(rules, context_items, customers_df, agents_df)
@@ -106,8 +271,10 @@ def generate_model_code(rules: List[str], context_items: list, customers_df=None
                 return knowledge_based_code
         except Exception as e:
             print(f"基于知识库生成代码失败: {str(e)}")
-    
-    # 如果知识库方法失败，则使用LLM生成
+    return None
+
+def build_llm_messages(rules: List[str], context_items: list) -> list:
+    """构造发送给本地模型的消息"""
     context = "\n".join([
         f"Pattern: {item['description']}\nTemplate: {item['or_tools_template']}"
         for item in context_items
@@ -130,29 +297,59 @@ def generate_model_code(rules: List[str], context_items: list, customers_df=None
 - 仅包含约束定义
 - 不要包含导入语句或函数定义
 - 直接使用提供的变量：routing, manager, time_dimension, customers_df, agents_df
+- 逐客户的约束优先使用 customer_arrays（window_start/window_end/service_minutes/priority/penalty 数组，penalty 为已按距离换算的未拜访惩罚）和 node_indices（客户对应的路由索引，-1 表示仓库），避免 iterrows
 """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
 
-    # 获取OpenAI客户端
-    client = get_openai_client()
-    if client is None:
-        # 如果LLM不可用，返回基于知识库的简化版本
-        fallback_code = generate_fallback_code(rules, context_items)
-        return f"# Topprism-ChatOpt: 本地模型不可用，使用简化版本\n{fallback_code}"
+def generate_model_code(rules: List[str], context_items: list, customers_df=None, agents_df=None,
+                        service=None) -> str:
+    """
+    使用本地模型生成 OR-Tools 建模代码
+    支持 Topprism-ChatOpt 知识库增强
+    """
+    with span("llm.generate", profile=True, rules=len(rules)) as attrs:
+        # 首先尝试基于知识库直接生成代码
+        knowledge_based_code = _knowledge_based_code(rules, context_items, customers_df, agents_df)
+        if knowledge_based_code:
+            attrs["source"] = "knowledge"
+            return knowledge_based_code
+
+        # 如果知识库方法失败，则使用LLM生成
+        service = service or get_llm_service()
+        try:
+            attrs["source"] = "llm"
+            return service.complete(build_llm_messages(rules, context_items))
+        except LLMUnavailableError:
+            # 如果LLM不可用，返回基于知识库的简化版本
+            attrs["source"] = "fallback"
+            fallback_code = generate_fallback_code(rules, context_items)
+            return f"# Topprism-ChatOpt: 本地模型不可用，使用简化版本\n{fallback_code}"
+        except Exception as e:
+            # 如果LLM调用失败，返回基于知识库的简化版本
+            attrs["source"] = "fallback"
+            fallback_code = generate_fallback_code(rules, context_items)
+            return f"# Topprism-ChatOpt: 本地模型调用失败，使用简化版本\n{fallback_code}"
 
+async def agenerate_model_code(rules: List[str], context_items: list, customers_df=None, agents_df=None,
+                               service=None, on_token=None) -> str:
+    """
+    generate_model_code 的异步版本，生成过程中不阻塞调用方的事件循环
+    on_token 在流式输出每个片段时调用（在 LLM 服务线程中执行）
+    """
+    knowledge_based_code = _knowledge_based_code(rules, context_items, customers_df, agents_df)
+    if knowledge_based_code:
+        return knowledge_based_code
+
+    service = service or get_llm_service()
     try:
-        completion = client.chat.completions.create(
-            model="gemma-3",
-            messages=[
-                {"role": "system", "content": "You are Topprism-ChatOpt, a precise optimization modeling assistant. Output only code. Do not include import statements or function definitions. Use the provided variables directly: routing, manager, time_dimension, customers_df, agents_df."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,
-            max_tokens=512,
-            stop=None
-        )
-        return completion.choices[0].message.content.strip()
+        return await service.acomplete(build_llm_messages(rules, context_items), on_token=on_token)
+    except LLMUnavailableError:
+        fallback_code = generate_fallback_code(rules, context_items)
+        return f"# Topprism-ChatOpt: 本地模型不可用，使用简化版本\n{fallback_code}"
     except Exception as e:
-        # 如果LLM调用失败，返回基于知识库的简化版本
         fallback_code = generate_fallback_code(rules, context_items)
         return f"# Topprism-ChatOpt: 本地模型调用失败，使用简化版本\n{fallback_code}"
 
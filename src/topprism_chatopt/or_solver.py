@@ -1,51 +1,367 @@
 # or_solver.py
 # Topprism-ChatOpt | OR-Tools 求解引擎
-import pandas as pd
+import time
+import numpy as np
 from ortools.constraint_solver import pywrapcp, routing_enums_pb2
-import json
+from .common import (
+    DEFAULT_SPEED_KMH,
+    MINUTES_PER_HOUR,
+    entity_ids,
+    haversine_meters,
+    travel_minutes,
+    window_minutes,
+)
+from .constraint_store import ConstraintCodeError, get_default_store
+from .search_monitor import ObjectiveMonitor, default_stall_window, default_time_limit
+from .singleflight import SingleFlight
+from .solve_cache import get_default_cache, solve_fingerprint
+from .solve_result import SolveResult, empty_arrays
+from .tracing import count, span
 
-def solve_visit_scheduling(customers_df, agents_df, rules, generated_code=""):
+# 默认搜索参数，策略名对应 routing_enums_pb2 中的枚举名
+DEFAULT_SEARCH_OPTIONS = {
+    "first_solution_strategy": "PATH_CHEAPEST_ARC",
+    "local_search_metaheuristic": "GUIDED_LOCAL_SEARCH",
+    "time_limit_seconds": None,  # None 时按客户数自适应
+    "stall_seconds": "auto",  # 目标值停滞多久后停止；"auto" 按时间上限推算，None 不启用
+    "min_relative_improvement": 0.001,  # 小于该相对幅度的改进不算改进
+    "gap_threshold": None,  # 与 lower_bound 的相对差距达到该值时停止
+    "lower_bound": None,
+    # 原生改进率限制（improvement_limit_parameters）：最近若干个解的改进率低于最佳改进率的该倍数时停止
+    "improvement_rate_coefficient": None,
+    "improvement_rate_solutions_distance": 100,
+    # 搜索扰动参数（并行求解时各 worker 取不同的值），None 时使用 OR-Tools 的默认值
+    "guided_local_search_lambda_coefficient": None,
+    "heuristic_close_nodes_lns_num_nodes": None,
+    "use_full_propagation": None,
+    "log_search": False,
+}
+# 热启动时只做短时间的改进搜索
+WARM_START_TIME_LIMIT_SECONDS = 1
+
+# 相同指纹的并发求解只执行一次
+solve_flight = SingleFlight()
+
+DEFAULT_VISITS_PER_DAY = 4
+
+# 按优先级设置的未拜访惩罚倍数（AddDisjunction），未列出的优先级不设置
+# 实际惩罚 = 倍数 × drop_penalty_unit(distance_matrix)，与弧代价同为米；惩罚越大越不会被放弃
+PRIORITY_DISJUNCTION_PENALTY = {"A": 1}
+
+def drop_penalty_unit(distance_matrix):
+    """
+    单位未拜访惩罚：任何路线的总距离都不超过 最大单段距离 × 节点数，
+    惩罚大于该值时，只有无法安排（时间窗、容量不可行）的客户才会被放弃
+    """
+    return int(np.max(distance_matrix, initial=0)) * len(distance_matrix) + 1
+
+def extract_customer_arrays(customers_df, penalty_unit=1):
+    """
+    建模阶段一次性把客户属性转换为 NumPy 数组，后续约束直接从数组读取
+    时间窗口单位为分钟；penalty 为 PRIORITY_DISJUNCTION_PENALTY 倍数 × penalty_unit
+    """
     n_customers = len(customers_df)
+    if "priority" in customers_df.columns:
+        priority = customers_df["priority"].astype(str).to_numpy()
+        weight = customers_df["priority"].astype(str).map(PRIORITY_DISJUNCTION_PENALTY).fillna(0)
+        penalty = weight.to_numpy(dtype=np.int64) * int(penalty_unit)
+    else:
+        priority = np.full(n_customers, "", dtype=object)
+        penalty = np.zeros(n_customers, dtype=np.int64)
+    window_start, window_end = window_minutes(customers_df)
+    return {
+        "window_start": window_start,
+        "window_end": window_end,
+        "service_minutes": customers_df["service_time_minutes"].to_numpy(dtype=np.int64),
+        "priority": priority,
+        "penalty": penalty,
+    }
+
+def customer_node_indices(manager, n_customers):
+    """每个客户节点对应的路由索引，作为仓库的节点为 -1"""
+    return np.array([manager.NodeToIndex(node) for node in range(n_customers)], dtype=np.int64)
+
+def build_travel_matrices(customers_df, agents_df, speed_kmh=DEFAULT_SPEED_KMH):
+    """
+    一次性向量化计算距离矩阵（米）和时间矩阵（分钟）
+
+    节点编号：0..n_customers-1 为客户，其后依次为各销售代表的出发点，
+    提供 end_lat/end_lon 时再依次为各销售代表的返回点（见 depot_nodes）。
+    时间矩阵中已包含起点节点的服务时长，可直接作为时间维度的转移值。
+    """
+    lat = [customers_df["lat"].to_numpy(dtype=np.float64)]
+    lon = [customers_df["lon"].to_numpy(dtype=np.float64)]
+    for lat_column, lon_column in (("start_lat", "start_lon"), ("end_lat", "end_lon")):
+        if {lat_column, lon_column} <= set(agents_df.columns):
+            lat.append(agents_df[lat_column].to_numpy(dtype=np.float64))
+            lon.append(agents_df[lon_column].to_numpy(dtype=np.float64))
+    lat = np.radians(np.concatenate(lat))
+    lon = np.radians(np.concatenate(lon))
+
+    # Haversine 公式，一次计算所有点对
+    distance = haversine_meters(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+    distance_matrix = np.rint(distance).astype(np.int64)
+
+    travel = travel_minutes(distance, speed_kmh)
+    service = np.zeros(len(lat), dtype=np.int64)
+    service[:len(customers_df)] = customers_df["service_time_minutes"].to_numpy(dtype=np.int64)
+    time_matrix = travel + service[:, None]
+    np.fill_diagonal(time_matrix, 0)
+
+    return distance_matrix, time_matrix
+
+def depot_nodes(n_customers, agents_df):
+    """
+    各销售代表的出发/返回节点编号，与 build_travel_matrices 的节点编号一致
+    没有 end_lat/end_lon 时返回出发点；没有出发点坐标时返回 (None, None)，所有人从 0 号节点出发
+    """
+    columns = set(agents_df.columns)
+    if not {"start_lat", "start_lon"} <= columns:
+        return None, None
     n_agents = len(agents_df)
+    starts = list(range(n_customers, n_customers + n_agents))
+    if {"end_lat", "end_lon"} <= columns:
+        ends = list(range(n_customers + n_agents, n_customers + 2 * n_agents))
+    else:
+        ends = starts
+    return starts, ends
 
-    manager = pywrapcp.RoutingIndexManager(n_customers, n_agents, 0)
-    routing = pywrapcp.RoutingModel(manager)
+def agent_capacities(agents_df):
+    """每个销售代表的每日拜访上限，没有 max_visits_per_day 时使用默认值"""
+    if "max_visits_per_day" in agents_df.columns:
+        return agents_df["max_visits_per_day"].to_numpy(dtype=np.int64)
+    return np.full(len(agents_df), DEFAULT_VISITS_PER_DAY, dtype=np.int64)
+
+def make_search_parameters(search_options):
+    """根据搜索参数字典构造 RoutingSearchParameters"""
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = (
+        getattr(routing_enums_pb2.FirstSolutionStrategy, search_options["first_solution_strategy"])
+    )
+    search_parameters.local_search_metaheuristic = (
+        getattr(routing_enums_pb2.LocalSearchMetaheuristic, search_options["local_search_metaheuristic"])
+    )
+    search_parameters.time_limit.FromMilliseconds(int(float(search_options["time_limit_seconds"]) * 1000))
+    if search_options.get("improvement_rate_coefficient") is not None:
+        limit = search_parameters.improvement_limit_parameters
+        limit.improvement_rate_coefficient = float(search_options["improvement_rate_coefficient"])
+        limit.improvement_rate_solutions_distance = int(search_options["improvement_rate_solutions_distance"])
+    for name in ("guided_local_search_lambda_coefficient", "heuristic_close_nodes_lns_num_nodes",
+                 "use_full_propagation"):
+        if search_options.get(name) is not None:
+            setattr(search_parameters, name, search_options[name])
+    search_parameters.log_search = bool(search_options["log_search"])
+    return search_parameters
 
-    # 距离回调（简化）
-    def distance_callback(from_index, to_index):
-        # 简化的距离计算，实际应根据经纬度计算真实距离
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        if from_node == to_node:
-            return 0
-        return 1
+def warm_start_routes(initial_routes, customers_df, agents_df, distance_matrix, start_nodes, end_nodes):
+    """
+    将上一轮的路线（{销售代表id: [客户id, ...]}）映射为当前模型的节点路线
+    已删除的客户被剔除，新增客户按最小增加距离插入，尽量不超过每人的拜访上限
+    返回 (保留的路线片段, 插入新增客户后的完整路线)
+    """
+    customer_nodes = {cid: node for node, cid in enumerate(entity_ids(customers_df))}
+    agent_ids = entity_ids(agents_df)
+    fixed_nodes = set(start_nodes) | set(end_nodes)
+    if "max_visits_per_day" in agents_df.columns:
+        capacities = [int(v) for v in agents_df["max_visits_per_day"]]
+    else:
+        capacities = [len(customers_df)] * len(agent_ids)
 
-    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
-    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+    routes = []
+    assigned = set()
+    for agent_id in agent_ids:
+        route = []
+        for cid in initial_routes.get(agent_id, []):
+            node = customer_nodes.get(cid)
+            if node is None or node in fixed_nodes or node in assigned:
+                continue
+            route.append(node)
+            assigned.add(node)
+        routes.append(route)
+    kept_routes = [list(route) for route in routes]
+
+    for node in range(len(customers_df)):
+        if node in assigned or node in fixed_nodes:
+            continue
+        best = None
+        for vehicle, route in enumerate(routes):
+            path = [start_nodes[vehicle]] + route + [end_nodes[vehicle]]
+            for pos in range(1, len(path)):
+                prev_node, next_node = path[pos - 1], path[pos]
+                delta = (distance_matrix[prev_node][node] + distance_matrix[node][next_node]
+                         - distance_matrix[prev_node][next_node])
+                over = len(route) >= capacities[vehicle]
+                key = (over, delta)
+                if best is None or key < best[0]:
+                    best = (key, vehicle, pos - 1)
+        if best is not None:
+            routes[best[1]].insert(best[2], node)
+            assigned.add(node)
+
+    return kept_routes, routes
+
+def resolve_search_options(search_options, n_customers, warm_start=False):
+    """合并默认搜索参数，并按问题规模确定时间上限与停滞窗口"""
+    options = dict(DEFAULT_SEARCH_OPTIONS)
+    if warm_start:
+        options["time_limit_seconds"] = WARM_START_TIME_LIMIT_SECONDS
+    options.update(search_options or {})
+    if options["time_limit_seconds"] is None:
+        options["time_limit_seconds"] = default_time_limit(n_customers)
+    if options["stall_seconds"] == "auto":
+        options["stall_seconds"] = default_stall_window(options["time_limit_seconds"])
+    return options
+
+def solve_key(customers_df, agents_df, rules, generated_code, options, initial_routes=None):
+    """求解结果缓存与请求合并使用的指纹，options 为 resolve_search_options 的结果"""
+    fingerprint_options = dict(options)
+    if initial_routes:
+        fingerprint_options["initial_routes"] = sorted(
+            (str(agent_id), [str(cid) for cid in route]) for agent_id, route in initial_routes.items()
+        )
+    return solve_fingerprint(customers_df, agents_df, rules, generated_code, fingerprint_options)
+
+def solve_visit_scheduling(customers_df, agents_df, rules, generated_code="",
+                           search_options=None, cache=None, use_cache=True, initial_routes=None,
+                           matrices=None, should_stop=None, on_solution=None, on_routes=None):
+    """
+    求解拜访排程
+    相同的规则、约束代码、数据和搜索参数直接返回缓存结果，不再重新搜索
+    传入上一轮结果的 routes 作为 initial_routes 时，从该解热启动并只做短时间改进
+
+    matrices: 预先计算好的 (distance_matrix, time_matrix)，省略时按数据计算
+    should_stop: 无参回调，返回 True 时提前结束搜索
+    on_solution: 每找到一个解时以目标值调用
+    on_routes: 每找到一个更优解时以 (目标值, {销售代表id: [客户id, ...]}) 调用
+
+    返回 SolveResult：路线、每个拜访点的开始时间范围、未拜访客户为整数数组，
+    schedule（展示用 DataFrame）与 routes 在首次读取时生成
+    """
+    options = resolve_search_options(search_options, len(customers_df), warm_start=bool(initial_routes))
+
+    def run():
+        return _solve(customers_df, agents_df, generated_code, options, initial_routes,
+                      matrices=matrices, should_stop=should_stop, on_solution=on_solution,
+                      on_routes=on_routes)
+
+    if not use_cache:
+        return run()
+
+    cache = cache if cache is not None else get_default_cache()
+    key = solve_key(customers_df, agents_df, rules, generated_code, options, initial_routes)
+    cached = cache.get(key)
+    if cached is not None:
+        count("solve.cache_hits")
+        return _copy_result(cached, from_cache=True)
+    count("solve.cache_misses")
+
+    def run_and_store():
+        result = run()
+        if _cacheable(result):
+            cache.put(key, _copy_result(result))
+        return result
+
+    # 带回调的请求（取消、进度）单独求解：合并后等待方的回调不会被调用
+    if should_stop is not None or on_solution is not None or on_routes is not None:
+        return run_and_store()
 
-    # 添加时间维度（用于时间窗口约束）
-    def service_time_callback(from_index):
-        from_node = manager.IndexToNode(from_index)
-        if from_node < len(customers_df):
-            return int(customers_df.iloc[from_node]["service_time_minutes"])
-        return 0
+    # 多个会话同时提交相同的模型时，只有一个真正求解，其余等待并复用结果
+    result, shared = solve_flight.do(key, run_and_store)
+    if shared:
+        count("solve.deduplicated")
+        return _copy_result(result)
+    return result
 
-    service_time_callback_index = routing.RegisterUnaryTransitCallback(service_time_callback)
+def _cacheable(result):
+    """
+    可以写入求解缓存的结果：求解失败（如超时未找到可行解）与被外部停止（取消）打断的结果不缓存，
+    下次重新搜索；拼接结果的 stop_reason 以逗号连接各子问题的原因
+    """
+    return bool(result["solved"]) and "external" not in str(result.get("stop_reason", "")).split(",")
+
+def _copy_result(result, from_cache=False):
+    """缓存存取与合并请求共享结果时的副本（SolveResult.copy 共享只读数组）"""
+    return result.copy(from_cache=from_cache)
+
+def _vehicle_routes(routing, manager, n_agents, value):
+    """按车辆取出路线上的节点（不含起点和终点），value 为取 NextVar 取值的函数"""
+    routes = []
+    for vehicle_id in range(n_agents):
+        index = value(routing.NextVar(routing.Start(vehicle_id)))
+        nodes = []
+        while not routing.IsEnd(index):
+            nodes.append(manager.IndexToNode(index))
+            index = value(routing.NextVar(index))
+        routes.append(nodes)
+    return routes
+
+def _solve(customers_df, agents_df, generated_code, options, initial_routes=None,
+           matrices=None, should_stop=None, on_solution=None, on_routes=None):
+    with span("solve", profile=True, customers=len(customers_df), agents=len(agents_df)) as attrs:
+        result = _solve_model(customers_df, agents_df, generated_code, options, initial_routes,
+                              matrices, should_stop, on_solution, on_routes)
+        attrs["solved"] = result["solved"]
+        attrs["build_seconds"] = result["build_seconds"]
+        attrs["search_seconds"] = result["search_seconds"]
+        return result
+
+def _solve_model(customers_df, agents_df, generated_code, options, initial_routes,
+                 matrices, should_stop, on_solution, on_routes):
+    """建模、执行约束代码、搜索并整理结果；各阶段的耗时记录在 solve.* 中"""
+    build_start = time.perf_counter()
+    n_customers = len(customers_df)
+    n_agents = len(agents_df)
+
+    # 生成代码在建模之前完成校验与编译，相同代码直接复用编译产物
+    artifact = None
+    if generated_code and not generated_code.startswith("# Topprism-ChatOpt: 本地模型调用失败"):
+        try:
+            with span("solve.compile_constraints"):
+                artifact = get_default_store().get(generated_code)
+        except ConstraintCodeError as e:
+            print(f"生成代码校验失败，使用默认约束: {str(e)}")
+
+    # 预先计算的距离/时间矩阵，弧代价由 C++ 侧直接查表，不再回调 Python
+    if matrices is None:
+        with span("solve.matrices", nodes=n_customers + n_agents):
+            matrices = build_travel_matrices(customers_df, agents_df)
+    distance_matrix, time_matrix = matrices
+    n_nodes = len(distance_matrix)
+    customer_arrays = extract_customer_arrays(customers_df, penalty_unit=drop_penalty_unit(distance_matrix))
+
+    # 多仓库：每个销售代表从自己的出发点出发、回到返回点，仓库节点不需要拜访
+    starts, ends = depot_nodes(n_customers, agents_df)
+    if starts is not None:
+        manager = pywrapcp.RoutingIndexManager(n_nodes, n_agents, starts, ends)
+    else:
+        manager = pywrapcp.RoutingIndexManager(n_nodes, n_agents, 0)
+    routing = pywrapcp.RoutingModel(manager)
+    node_indices = customer_node_indices(manager, n_customers)
+
+    transit_callback_index = routing.RegisterTransitMatrix(distance_matrix.tolist())
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+
+    # 时间转移值 = 起点服务时长 + 路上行驶时间
+    time_callback_index = routing.RegisterTransitMatrix(time_matrix.tolist())
     
     # 添加时间维度
-    horizon = 24 * 60  # 一天的分钟数
-    time = "Time"
+    horizon = 24 * MINUTES_PER_HOUR  # 一天的分钟数
+    time_name = "Time"
     routing.AddDimension(
-        service_time_callback_index,
+        time_callback_index,
         horizon,  # allow waiting time
         horizon,  # maximum time per vehicle
         False,  # Don't force start cumul to zero.
-        time
+        time_name
     )
-    time_dimension = routing.GetDimensionOrDie(time)
+    time_dimension = routing.GetDimensionOrDie(time_name)
+
+    # 拜访计数：客户节点计 1，仓库节点计 0
+    visit_transit = [1] * n_customers + [0] * (n_nodes - n_customers)
+    visit_callback_index = routing.RegisterUnaryTransitVector(visit_transit)
 
     # 根据LLM生成的代码动态添加约束
-    if generated_code and not generated_code.startswith("# Topprism-ChatOpt: 本地模型调用失败"):
+    if artifact is not None:
         try:
             # 准备命名空间
             namespace = {
@@ -53,73 +369,203 @@ def solve_visit_scheduling(customers_df, agents_df, rules, generated_code=""):
                 "manager": manager,
                 "time_dimension": time_dimension,
                 "customers_df": customers_df,
-                "agents_df": agents_df
+                "agents_df": agents_df,
+                "customer_arrays": customer_arrays,
+                "node_indices": node_indices
             }
             
-            # 执行生成的代码
-            exec(generated_code, namespace)
+            # 执行编译好的约束代码
+            with span("solve.exec_constraints"):
+                exec(artifact.code, namespace)
         except Exception as e:
             print(f"执行生成代码时出错: {str(e)}")
             # 添加默认约束
             add_default_constraints(routing, agents_df)
 
-    # 如果没有生成代码或执行失败，添加默认约束
+    # 如果没有生成代码、校验未通过或执行失败，添加默认约束
     else:
         add_default_constraints(routing, agents_df)
 
     # 添加时间窗口约束（基于数据）
-    add_time_window_constraints(routing, manager, time_dimension, customers_df)
+    add_time_window_constraints(routing, manager, time_dimension, customers_df,
+                                customer_arrays=customer_arrays, node_indices=node_indices)
+
+    # 添加每人的拜访上限（基于数据）
+    if "max_visits_per_day" in agents_df.columns:
+        add_capacity_constraints(routing, agents_df, visit_callback_index)
 
     # 求解
-    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-    search_parameters.first_solution_strategy = (
-        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-    )
-    search_parameters.local_search_metaheuristic = (
-        routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+    search_parameters = make_search_parameters(options)
+
+    # 热启动：把上一轮路线映射到当前模型作为初始解
+    initial_assignment = None
+    warm_started = False
+    if initial_routes:
+        routing.CloseModelWithParameters(search_parameters)
+        start_nodes = [manager.IndexToNode(routing.Start(v)) for v in range(n_agents)]
+        end_nodes = [manager.IndexToNode(routing.End(v)) for v in range(n_agents)]
+        kept_routes, node_routes = warm_start_routes(initial_routes, customers_df, agents_df,
+                                                     distance_matrix, start_nodes, end_nodes)
+        initial_assignment = routing.ReadAssignmentFromRoutes(node_routes, True)
+        if initial_assignment is not None:
+            warm_started = True
+        else:
+            # 插入新增客户后不可行（超出容量、时间窗等），锁定保留的路线片段，由首解策略补全
+            warm_started = routing.ApplyLocksToAllVehicles(kept_routes, False)
+            if not warm_started:
+                print("上一轮路线无法映射到当前模型，改为从头求解")
+
+    # 记录目标值轨迹，停滞或达到差距阈值时提前结束搜索
+    monitor = ObjectiveMonitor(
+        stall_seconds=options["stall_seconds"],
+        min_relative_improvement=options["min_relative_improvement"],
+        gap_threshold=options["gap_threshold"],
+        lower_bound=options["lower_bound"],
+        external_stop=should_stop,
     )
-    search_parameters.time_limit.FromSeconds(30)
-    search_parameters.log_search = True
 
-    solution = routing.SolveWithParameters(search_parameters)
-    schedule = []
+    customer_ids = entity_ids(customers_df)
+    agent_ids = entity_ids(agents_df)
+    n_solutions = [0]
+
+    def at_solution():
+        n_solutions[0] += 1
+        objective = routing.CostVar().Value()
+        improved = monitor.best is None or objective < monitor.best
+        if monitor.on_solution(objective):
+            # 停滞或达到差距阈值：保留当前最优解并结束搜索
+            routing.solver().FinishCurrentSearch()
+        if on_solution is not None:
+            on_solution(objective)
+        if on_routes is not None and improved:
+            node_routes = _vehicle_routes(routing, manager, n_agents, lambda var: var.Value())
+            on_routes(objective, {
+                agent_ids[v]: [customer_ids[node] for node in nodes if node < n_customers]
+                for v, nodes in enumerate(node_routes)
+            })
+
+    # 只有需要外部停止（任务取消、组合求解中其他策略已完成）时才安装逐次回调的 CustomLimit
+    if should_stop is not None:
+        routing.AddSearchMonitor(routing.solver().CustomLimit(monitor.should_stop))
+    routing.AddAtSolutionCallback(at_solution)
+    build_seconds = time.perf_counter() - build_start
+    monitor.start()
 
+    with span("solve.search", warm_started=warm_started) as search_attrs:
+        if initial_assignment is not None:
+            solution = routing.SolveFromAssignmentWithParameters(initial_assignment, search_parameters)
+        else:
+            solution = routing.SolveWithParameters(search_parameters)
+        search_attrs["stop_reason"] = monitor.stop_reason or "limit"
+    search_seconds = monitor.elapsed()
+    # 回调次数在搜索结束后一次性计数，搜索过程中不增加开销
+    count("solve.solutions", n_solutions[0])
+    count("solve.limit_checks", monitor.calls)
     if solution:
-        for vehicle_id in range(n_agents):
-            index = routing.Start(vehicle_id)
-            route = []
-            while not routing.IsEnd(index):
-                customer_id = manager.IndexToNode(index)
-                if customer_id < len(customers_df):
-                    route.append(customers_df.iloc[customer_id]["name"])
-                index = solution.Value(routing.NextVar(index))
-            if len(route) > 0:
-                schedule.append({"销售代表": agents_df.iloc[vehicle_id]["name"], "拜访客户": " → ".join(route)})
-            else:
-                schedule.append({"销售代表": agents_df.iloc[vehicle_id]["name"], "拜访客户": "无"})
+        arrays = extract_solution_arrays(routing, manager, time_dimension, solution, n_customers, n_agents)
     else:
-        schedule.append({"销售代表": "无", "拜访客户": "求解失败"})
+        arrays = empty_arrays(n_agents, n_customers)
 
-    return {"status": "success", "schedule": pd.DataFrame(schedule)}
+    fields = {
+        "status": "success",
+        "solved": bool(solution),
+        "objective": solution.ObjectiveValue() if solution else None,
+        "solver_status": solver_status(routing),
+        "trajectory": monitor.trajectory,
+        "stop_reason": monitor.stop_reason or "limit",
+        "build_seconds": round(build_seconds, 3),
+        "search_seconds": round(search_seconds, 3),
+        "warm_started": warm_started,
+        "from_cache": False,
+    }
+    return SolveResult(fields, arrays, customer_ids, customers_df["name"].tolist(),
+                       agent_ids, agents_df["name"].tolist())
+
+def solver_status(routing):
+    """RoutingModel.status() 的枚举名，如 ROUTING_SUCCESS、ROUTING_FAIL_TIMEOUT"""
+    status = routing.status()
+    try:
+        return routing_enums_pb2.RoutingSearchStatus.Value.Name(status)
+    except (AttributeError, ValueError):
+        return str(status)
+
+def extract_solution_arrays(routing, manager, time_dimension, solution, n_customers, n_agents):
+    """
+    遍历一次解，取出各路线的客户行号与时间维度累计值范围（见 solve_result.ARRAY_FIELDS）
+    """
+    offsets = np.zeros(n_agents + 1, dtype=np.int32)
+    nodes, cumul_min, cumul_max = [], [], []
+    start_nodes = np.zeros(n_agents, dtype=np.int32)
+    end_nodes = np.zeros(n_agents, dtype=np.int32)
+    # 每行依次为 depart_min、depart_max、return_min、return_max
+    depot_cumuls = np.zeros((4, n_agents), dtype=np.int32)
+    for vehicle_id in range(n_agents):
+        index = routing.Start(vehicle_id)
+        start_nodes[vehicle_id] = manager.IndexToNode(index)
+        cumul = time_dimension.CumulVar(index)
+        depot_cumuls[0, vehicle_id] = solution.Min(cumul)
+        depot_cumuls[1, vehicle_id] = solution.Max(cumul)
+        index = solution.Value(routing.NextVar(index))
+        while not routing.IsEnd(index):
+            cumul = time_dimension.CumulVar(index)
+            nodes.append(manager.IndexToNode(index))
+            cumul_min.append(solution.Min(cumul))
+            cumul_max.append(solution.Max(cumul))
+            index = solution.Value(routing.NextVar(index))
+        end_nodes[vehicle_id] = manager.IndexToNode(index)
+        cumul = time_dimension.CumulVar(index)
+        depot_cumuls[2, vehicle_id] = solution.Min(cumul)
+        depot_cumuls[3, vehicle_id] = solution.Max(cumul)
+        offsets[vehicle_id + 1] = len(nodes)
+
+    route_nodes = np.asarray(nodes, dtype=np.int32)
+    visited = np.zeros(n_customers, dtype=bool)
+    visited[route_nodes] = True
+    # 充当仓库的客户不算未拜访
+    visited[start_nodes[start_nodes < n_customers]] = True
+    visited[end_nodes[end_nodes < n_customers]] = True
+    return {
+        "route_offsets": offsets,
+        "route_nodes": route_nodes,
+        "cumul_min": np.asarray(cumul_min, dtype=np.int32),
+        "cumul_max": np.asarray(cumul_max, dtype=np.int32),
+        "start_nodes": start_nodes,
+        "end_nodes": end_nodes,
+        "depart_min": depot_cumuls[0],
+        "depart_max": depot_cumuls[1],
+        "return_min": depot_cumuls[2],
+        "return_max": depot_cumuls[3],
+        "dropped": np.flatnonzero(~visited).astype(np.int32),
+    }
 
 def add_default_constraints(routing, agents_df):
     """添加默认约束"""
-    # 默认约束：每个销售最多访问4个客户
-    if len(agents_df) > 0 and "max_visits_per_day" in agents_df.columns:
-        max_visits = agents_df["max_visits_per_day"].max()
-        routing.AddConstantDimension(
-            1, max_visits, True, "VisitCount"
-        )
-    else:
+    # 默认约束：没有拜访上限数据时，每个销售最多访问4个客户
+    # 有 max_visits_per_day 时由 add_capacity_constraints 按人设置
+    if "max_visits_per_day" not in agents_df.columns:
         routing.AddConstantDimension(
-            1, 4, True, "VisitCount"
+            1, DEFAULT_VISITS_PER_DAY, True, "VisitCount"
         )
 
-def add_time_window_constraints(routing, manager, time_dimension, customers_df):
+def add_capacity_constraints(routing, agents_df, visit_callback_index):
+    """按销售代表分别设置每日拜访上限（每辆车一个容量）"""
+    routing.AddDimensionWithVehicleCapacity(
+        visit_callback_index,
+        0,  # no slack
+        [int(c) for c in agent_capacities(agents_df)],
+        True,
+        "AgentCapacity"
+    )
+
+def add_time_window_constraints(routing, manager, time_dimension, customers_df,
+                                customer_arrays=None, node_indices=None):
     """添加时间窗口约束"""
-    for i, customer in customers_df.iterrows():
-        index = manager.NodeToIndex(i)
-        if index != -1:  # 确保索引有效
-            start_time = int(customer["time_window_start"]) * 60  # 转换为分钟
-            end_time = int(customer["time_window_end"]) * 60
-            time_dimension.CumulVar(index).SetRange(start_time, end_time)
\ No newline at end of file
+    if customer_arrays is None:
+        customer_arrays = extract_customer_arrays(customers_df)
+    if node_indices is None:
+        node_indices = customer_node_indices(manager, len(customers_df))
+    valid = np.flatnonzero(node_indices != -1)  # 确保索引有效
+    for index, start_time, end_time in zip(node_indices[valid].tolist(),
+                                           customer_arrays["window_start"][valid].tolist(),
+                                           customer_arrays["window_end"][valid].tolist()):
+        time_dimension.CumulVar(index).SetRange(start_time, end_time)
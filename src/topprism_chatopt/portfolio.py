@@ -0,0 +1,150 @@
+# portfolio.py
+# Topprism-ChatOpt | 多策略并行求解
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .or_solver import DEFAULT_SEARCH_OPTIONS, build_travel_matrices, solve_visit_scheduling
+from .tracing import count
+
+# 按经验优先级排列的首解策略与元启发式组合，worker 数较少时取前几个
+FIRST_SOLUTION_STRATEGIES = [
+    "PATH_CHEAPEST_ARC",
+    "PARALLEL_CHEAPEST_INSERTION",
+    "SAVINGS",
+    "LOCAL_CHEAPEST_INSERTION",
+    "CHRISTOFIDES",
+    "GLOBAL_CHEAPEST_ARC",
+    "PATH_MOST_CONSTRAINED_ARC",
+    "LOCAL_CHEAPEST_ARC",
+]
+METAHEURISTICS = [
+    "GUIDED_LOCAL_SEARCH",
+    "SIMULATED_ANNEALING",
+    "TABU_SEARCH",
+    "GENERIC_TABU_SEARCH",
+]
+
+# RoutingSearchParameters 没有随机种子，组合重复时按扰动序号依次改变以下参数，
+# 第 0 号扰动为 OR-Tools 的默认值
+GLS_LAMBDA_COEFFICIENTS = [0.1, 0.05, 0.2, 0.3]
+CLOSE_NODES_LNS_SIZES = [5, 3, 8, 12]
+
+def search_variant(variant):
+    """第 variant 号搜索扰动：GLS 惩罚系数、邻近节点 LNS 的规模、是否完全约束传播"""
+    return {
+        "guided_local_search_lambda_coefficient": GLS_LAMBDA_COEFFICIENTS[variant % len(GLS_LAMBDA_COEFFICIENTS)],
+        "heuristic_close_nodes_lns_num_nodes":
+            CLOSE_NODES_LNS_SIZES[(variant // len(GLS_LAMBDA_COEFFICIENTS)) % len(CLOSE_NODES_LNS_SIZES)],
+        "use_full_propagation": (variant // (len(GLS_LAMBDA_COEFFICIENTS) * len(CLOSE_NODES_LNS_SIZES))) % 2 == 1,
+    }
+
+def portfolio_configs(n_workers, seed=0):
+    """
+    生成 n_workers 组互不相同的搜索配置
+    先让每种首解策略搭配不同的元启发式，再补齐剩余组合；
+    组合用尽后重复的组合取下一个扰动（search_variant），seed 整体平移扰动序号
+    """
+    combos = []
+    for round_ in range(len(METAHEURISTICS)):
+        for i, strategy in enumerate(FIRST_SOLUTION_STRATEGIES):
+            metaheuristic = METAHEURISTICS[(i + round_) % len(METAHEURISTICS)]
+            combos.append({
+                "first_solution_strategy": strategy,
+                "local_search_metaheuristic": metaheuristic,
+            })
+    configs = []
+    for worker in range(n_workers):
+        config = dict(combos[worker % len(combos)])
+        config.update(search_variant(seed + worker // len(combos)))
+        configs.append(config)
+    return configs
+
+# worker 进程内的共享状态，由 initializer 在进程启动时设置
+_worker_state = {}
+
+def _init_worker(stop_event, customers_df, agents_df, matrices):
+    _worker_state["stop_event"] = stop_event
+    _worker_state["customers_df"] = customers_df
+    _worker_state["agents_df"] = agents_df
+    _worker_state["matrices"] = matrices
+
+def _solve_worker(rules, generated_code, search_options, target_objective):
+    stop_event = _worker_state["stop_event"]
+
+    def on_solution(objective):
+        # 达到目标值后通知其它 worker 停止
+        if target_objective is not None and objective <= target_objective:
+            stop_event.set()
+
+    return solve_visit_scheduling(
+        _worker_state["customers_df"],
+        _worker_state["agents_df"],
+        rules,
+        generated_code,
+        search_options=search_options,
+        use_cache=False,
+        matrices=_worker_state["matrices"],
+        should_stop=stop_event.is_set,
+        on_solution=on_solution,
+    )
+
+def solve_portfolio(customers_df, agents_df, rules, generated_code="", n_workers=None,
+                    time_limit_seconds=None, target_objective=None, search_options=None, seed=0):
+    """
+    在多个进程中以不同的首解策略与元启发式并行求解，返回目标值最小的 SolveResult
+    （附带 best_config 与各 worker 的 portfolio 汇总）
+    距离/时间矩阵只计算一次并分发给所有 worker；
+    任一 worker 达到 target_objective 时其余 worker 提前停止；seed 改变各 worker 的搜索扰动
+    出错的 worker 计入 portfolio.worker_errors，并以 error 记录在 portfolio 汇总中
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    configs = portfolio_configs(n_workers, seed=seed)
+
+    base_options = dict(DEFAULT_SEARCH_OPTIONS)
+    base_options.update(search_options or {})
+    base_options["log_search"] = False
+    if time_limit_seconds is not None:
+        base_options["time_limit_seconds"] = time_limit_seconds
+
+    matrices = build_travel_matrices(customers_df, agents_df)
+    ctx = multiprocessing.get_context()
+    stop_event = ctx.Event()
+
+    runs = []
+    with ProcessPoolExecutor(
+        max_workers=len(configs),
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(stop_event, customers_df, agents_df, matrices),
+    ) as executor:
+        futures = {}
+        for config in configs:
+            options = dict(base_options)
+            options.update(config)
+            future = executor.submit(_solve_worker, rules, generated_code, options, target_objective)
+            futures[future] = config
+
+        errors = []
+        for future in as_completed(futures):
+            config = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                count("portfolio.worker_errors", error=str(e), **config)
+                errors.append(dict(config, solved=False, objective=None, error=str(e)))
+                continue
+            runs.append((config, result))
+
+    summary = [
+        dict(config, solved=result["solved"], objective=result["objective"])
+        for config, result in runs
+    ] + errors
+    solved = [(config, result) for config, result in runs if result["solved"]]
+    if solved:
+        best_config, best = min(solved, key=lambda run: run[1]["objective"])
+    elif runs:
+        best_config, best = runs[0]
+    else:
+        raise RuntimeError("所有并行求解 worker 均失败")
+
+    return best.copy(best_config=best_config, portfolio=summary)
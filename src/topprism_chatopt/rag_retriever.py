@@ -1,45 +1,302 @@
 # rag_retriever.py
 import json
+import hashlib
 import numpy as np
-import faiss
 import re
 import os
+import threading
+from .tracing import count, span
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+# faiss 与 sentence_transformers 只在语义检索路径中导入，纯正则匹配时不加载
+
+def default_cache_dir():
+    """索引缓存目录，可通过环境变量 TOPPRISM_CACHE_DIR 覆盖"""
+    return os.environ.get(
+        "TOPPRISM_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".cache", "topprism_chatopt")
+    )
+
+INDEX_TYPES = ("flat", "sq8", "hnsw", "ivf", "ivf_sq8", "ivf_pq")
+METRICS = ("cosine", "l2")
+# 按模式数自动选择索引类型：(模式数上限, 类型)，超过最后一档使用 ivf_pq
+AUTO_INDEX_THRESHOLDS = [(10000, "flat"), (200000, "hnsw"), (2000000, "ivf_sq8")]
+HNSW_NEIGHBORS = 32
+DEFAULT_EF_SEARCH = 128
+DEFAULT_NPROBE = 16
+# 训练 IVF/PQ 时最多使用的向量数
+MAX_TRAINING_VECTORS = 50000
+# 8 位 PQ 每个子量化器有 256 个中心，训练向量少于此数时改用 ivf_sq8
+PQ_MIN_TRAINING_VECTORS = 1024
+# 相似度阈值：余弦相似度不低于 0.5，等价于单位向量的 L2 距离平方小于 1.0
+MIN_COSINE_SIMILARITY = 0.5
+MAX_L2_DISTANCE = 1.0
+
+def choose_index_type(n_patterns):
+    """按模式数选择索引：小知识库精确搜索，大知识库用近似搜索与量化压缩"""
+    for limit, index_type in AUTO_INDEX_THRESHOLDS:
+        if n_patterns <= limit:
+            return index_type
+    return "ivf_pq"
+
+def ivf_nlist(n_vectors):
+    """IVF 倒排列表数：约 4·√n，且保证每个列表至少有 39 个训练向量"""
+    return max(1, min(int(4 * np.sqrt(n_vectors)), n_vectors // 39))
+
+def _pq_subquantizers(dim):
+    """PQ 子量化器数：每个约 8 维，且必须整除维度"""
+    for m in range(max(1, dim // 8), 0, -1):
+        if dim % m == 0:
+            return m
+
+def index_factory_string(index_type, n_vectors, dim):
+    """索引类型对应的 faiss.index_factory 描述"""
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "sq8":
+        return "SQ8"
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_NEIGHBORS}"
+    nlist = ivf_nlist(n_vectors)
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivf_sq8":
+        return f"IVF{nlist},SQ8"
+    if index_type == "ivf_pq":
+        return f"IVF{nlist},PQ{_pq_subquantizers(dim)}"
+    raise ValueError(f"不支持的索引类型: {index_type}，可选 {', '.join(INDEX_TYPES)}")
+
+def prepare_vectors(vectors, metric="cosine"):
+    """转换为连续的 float32 矩阵；余弦度量下归一化为单位向量（内积即余弦相似度）"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if metric == "cosine":
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = np.ascontiguousarray(vectors / np.maximum(norms, 1e-12), dtype=np.float32)
+    return vectors
+
+def build_faiss_index(vectors, index_type="flat", metric="cosine", nprobe=None, ef_search=None):
+    """
+    构建 FAISS 索引，vectors 应已经过 prepare_vectors 处理
+    IVF/PQ 在（最多 MAX_TRAINING_VECTORS 个）向量上训练；向量太少无法训练 PQ 时改用 ivf_sq8
+    """
+    import faiss
+
+    n_vectors, dim = vectors.shape
+    if index_type == "ivf_pq" and n_vectors < PQ_MIN_TRAINING_VECTORS:
+        index_type = "ivf_sq8"
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "cosine" else faiss.METRIC_L2
+    index = faiss.index_factory(dim, index_factory_string(index_type, n_vectors, dim), faiss_metric)
+    if hasattr(index, "do_polysemous_training"):
+        # 只用 PQ 编码做距离估计，跳过代价很高的 polysemous 训练
+        index.do_polysemous_training = False
+    if not index.is_trained:
+        training = vectors
+        if n_vectors > MAX_TRAINING_VECTORS:
+            rng = np.random.default_rng(0)
+            training = vectors[np.sort(rng.choice(n_vectors, MAX_TRAINING_VECTORS, replace=False))]
+        index.train(training)
+    index.add(vectors)
+    configure_search(index, nprobe, ef_search)
+    return index
+
+def configure_search(index, nprobe=None, ef_search=None):
+    """设置近似索引的搜索参数（IVF 探测的列表数、HNSW 的候选集大小），这些参数不随索引保存"""
+    import faiss
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(ivf.nlist, nprobe or DEFAULT_NPROBE)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search or DEFAULT_EF_SEARCH
+
+CJK_KEYWORD_RE = re.compile(r'[\u4e00-\u9fff]+')
+
+class PatternMatcher:
+    """
+    知识库模式匹配器，在构建索引时一次性编译
+    - 精确匹配：所有模式合并为一个交替正则
+    - 关键词匹配：中文关键词到模式的倒排索引，查询只触及候选模式
+    """
+    def __init__(self, pattern_strings):
+        self.n_patterns = len(pattern_strings)
+        self.exact_regex = self._compile_alternation(pattern_strings)
+
+        # 关键词 -> [(模式序号, 该关键词在模式中出现的次数)]
+        postings = {}
+        for idx, pattern_str in enumerate(pattern_strings):
+            counts = {}
+            for keyword in CJK_KEYWORD_RE.findall(pattern_str):
+                counts[keyword] = counts.get(keyword, 0) + 1
+            for keyword, count in counts.items():
+                postings.setdefault(keyword, []).append((idx, count))
+        self.keyword_postings = postings
+        self.max_keyword_len = max((len(k) for k in postings), default=0)
+
+    @staticmethod
+    def _compile_alternation(pattern_strings):
+        """
+        每个分支用前瞻判断模式能否在查询任意位置命中，分支按知识库顺序尝试，
+        因此命中的分支与逐个 re.search 的第一个命中模式一致
+        """
+        if not pattern_strings:
+            return None
+        branches = [
+            rf"(?=[\s\S]*?(?:{p}))(?P<_p{i}>)"
+            for i, p in enumerate(pattern_strings)
+        ]
+        return re.compile("|".join(branches))
+
+    def exact_match(self, query):
+        """返回第一个在查询中命中的模式序号"""
+        if self.exact_regex is None:
+            return None
+        m = self.exact_regex.match(query)
+        if m is None:
+            return None
+        return int(m.lastgroup[2:])
+
+    def _present_keywords(self, query):
+        """
+        找出查询中出现的所有关键词
+        关键词只由中文字符组成，只需枚举查询中中文片段的子串，与知识库规模无关
+        """
+        present = set()
+        for run in CJK_KEYWORD_RE.findall(query):
+            for start in range(len(run)):
+                stop = min(len(run), start + self.max_keyword_len)
+                for end in range(start + 1, stop + 1):
+                    candidate = run[start:end]
+                    if candidate in self.keyword_postings:
+                        present.add(candidate)
+        return present
+
+    def keyword_match(self, query):
+        """
+        按模式中关键词在查询中出现的个数打分，返回得分最高的模式序号
+        同分时取知识库中靠前的模式；没有任何关键词命中时返回 None
+        """
+        scores = {}
+        for keyword in self._present_keywords(query):
+            for idx, count in self.keyword_postings[keyword]:
+                scores[idx] = scores.get(idx, 0) + count
+        if not scores:
+            return None
+        return min(scores, key=lambda idx: (-scores[idx], idx))
 
 class TopprismRAG:
     """
     Topprism-ChatOpt 的语义检索器
     负责将自然语言规则匹配到建模知识库
+
+    index_type: "auto"（按模式数选择，见 choose_index_type）或 INDEX_TYPES 之一
+    metric: "cosine"（归一化内积）或 "l2"
+    nprobe / ef_search: IVF 与 HNSW 的搜索参数，越大召回越高、查询越慢
     """
-    def __init__(self, kb_path=None):
+    def __init__(self, kb_path=None, cache_dir=None, model_name=MODEL_NAME, index_type="auto",
+                 metric="cosine", nprobe=None, ef_search=None):
         # 如果没有指定路径，使用默认路径
         if kb_path is None:
             # 获取当前文件所在目录
             current_dir = os.path.dirname(os.path.abspath(__file__))
             kb_path = os.path.join(current_dir, "knowledge_base.json")
         
-        with open(kb_path, encoding='utf-8') as f:
-            self.kb = json.load(f)
+        with open(kb_path, 'rb') as f:
+            kb_bytes = f.read()
+        self.kb = json.loads(kb_bytes.decode('utf-8'))
+        self.model_name = model_name
+        if metric not in METRICS:
+            raise ValueError(f"不支持的相似度度量: {metric}，可选 {', '.join(METRICS)}")
+        if index_type == "auto":
+            index_type = choose_index_type(sum(len(item["patterns"]) for item in self.kb["semantic_patterns"]))
+        elif index_type not in INDEX_TYPES:
+            raise ValueError(f"不支持的索引类型: {index_type}，可选 {', '.join(INDEX_TYPES)}")
+        self.index_type = index_type
+        self.metric = metric
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        # 缓存键：知识库内容 + 模型名 + 索引类型与度量，任一变化时自动失效
+        index_spec = f"{model_name}|{index_type}|{metric}".encode('utf-8')
+        self.cache_key = hashlib.sha256(kb_bytes + index_spec).hexdigest()[:16]
+        self.cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
         self.model = None
+        self._model_load_failed = False
+        self._model_lock = threading.Lock()
         self.index = None
         self.pattern_to_item = []
         self.pattern_strings = []
+        self.matcher = None
         self.build_index()
 
     def _load_model(self):
         """延迟加载模型，避免初始化错误"""
-        if self.model is None:
+        if self.model is not None or self._model_load_failed:
+            return
+        # 多个会话共享同一检索器时，只允许一个线程加载模型
+        with self._model_lock:
+            if self.model is not None or self._model_load_failed:
+                return
             try:
-                from sentence_transformers import SentenceTransformer
-                self.model = SentenceTransformer('all-MiniLM-L6-v2')
+                with span("rag.load_model", model=self.model_name):
+                    from sentence_transformers import SentenceTransformer
+                    self.model = SentenceTransformer(self.model_name)
             except Exception as e:
                 print(f"模型加载失败: {str(e)}")
                 print("将使用基于正则表达式的匹配方法")
                 self.model = None
+                self._model_load_failed = True
 
-    def build_index(self):
-        # 加载模型
+    def warm_up(self):
+        """预热：加载模型并完成一次编码，避免首个请求承担初始化开销"""
+        if self.index is None:
+            return
         self._load_model()
-        
+        if self.model is not None:
+            try:
+                self.model.encode(["预热"])
+            except Exception as e:
+                print(f"模型预热失败: {str(e)}")
+
+    def _cache_path(self):
+        return os.path.join(self.cache_dir, f"kb_index_{self.cache_key}.faiss")
+
+    def _load_cached_index(self):
+        """从磁盘缓存以内存映射方式加载索引，命中时无需重新编码"""
+        index_path = self._cache_path()
+        if not os.path.exists(index_path):
+            return False
+        try:
+            import faiss
+            try:
+                index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+            except Exception:
+                index = faiss.read_index(index_path)
+            # 向量数与模式数不一致时缓存无效
+            if index.ntotal != len(self.pattern_strings):
+                return False
+            configure_search(index, self.nprobe, self.ef_search)
+        except Exception as e:
+            print(f"索引缓存读取失败: {str(e)}")
+            return False
+        self.index = index
+        return True
+
+    def _save_cached_index(self):
+        """原子写入索引缓存，写入失败不影响检索；只保存索引本身，不另存原始向量"""
+        index_path = self._cache_path()
+        try:
+            import faiss
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = index_path + f".{os.getpid()}.tmp"
+            faiss.write_index(self.index, tmp_path)
+            os.replace(tmp_path, index_path)
+        except Exception as e:
+            print(f"索引缓存写入失败: {str(e)}")
+
+    def build_index(self):
+        with span("rag.build_index") as attrs:
+            self._build_index(attrs)
+
+    def _build_index(self, attrs):
         sentences = []
         self.pattern_to_item = []
         self.pattern_strings = []
@@ -48,13 +305,28 @@ class TopprismRAG:
                 sentences.append(p)
                 self.pattern_to_item.append(item)
                 self.pattern_strings.append(p)
+        self.matcher = PatternMatcher(self.pattern_strings)
         
+        # 优先使用磁盘缓存，命中时模型推迟到首次语义查询时再加载
+        if sentences and self._load_cached_index():
+            attrs["cache_hit"] = True
+            return
+        attrs["cache_hit"] = False
+
+        # 加载模型
+        self._load_model()
+
         # 如果模型加载成功，构建语义索引
         if self.model is not None and sentences:
             try:
-                embeddings = self.model.encode(sentences)
-                self.index = faiss.IndexFlatL2(embeddings.shape[1])
-                self.index.add(np.array(embeddings))
+                with span("rag.encode", sentences=len(sentences)):
+                    embeddings = prepare_vectors(self.model.encode(sentences), self.metric)
+                with span("rag.train_index", index_type=self.index_type, vectors=len(embeddings)):
+                    self.index = build_faiss_index(embeddings, self.index_type, self.metric,
+                                                   self.nprobe, self.ef_search)
+                # 原始 float32 向量已写入（量化）索引，不再保留，量化索引的内存占用才会降低
+                del embeddings
+                self._save_cached_index()
             except Exception as e:
                 print(f"索引构建失败: {str(e)}")
                 self.index = None
@@ -63,77 +335,88 @@ class TopprismRAG:
             self.index = None
 
     def retrieve(self, query, k=3):
+        return self.retrieve_many([query], k=k)[0]
+
+    def retrieve_many(self, queries, k=3):
+        """
+        批量检索：所有未精确命中的查询一次性编码，并通过一次 FAISS 搜索完成
+        返回与输入顺序一致的结果列表
+        """
+        with span("rag.retrieve", profile=True, queries=len(queries)):
+            return self._retrieve_many(queries, k)
+
+    def _retrieve_many(self, queries, k):
+        results = [None] * len(queries)
+
         # 首先尝试精确匹配
-        exact_match = self._exact_match(query)
-        if exact_match:
-            return [exact_match]
-        
+        pending = []
+        for qi, query in enumerate(queries):
+            exact_match = self._exact_match(query)
+            if exact_match:
+                results[qi] = [exact_match]
+            else:
+                pending.append(qi)
+        count("rag.exact_hits", len(queries) - len(pending))
+
         # 如果没有精确匹配，且模型可用，使用语义搜索
-        if self.index is not None and self.model is not None:
+        if pending and self.index is not None:
+            self._load_model()
+        if pending and self.index is not None and self.model is not None:
             try:
-                query_vec = self.model.encode([query])
-                scores, indices = self.index.search(query_vec, k)
-                
-                # 过滤掉低相似度的结果
-                results = []
-                for i, score in zip(indices[0], scores[0]):
-                    # 相似度阈值，可以根据需要调整
-                    if score < 1.0:  # faiss L2距离，越小越相似
-                        results.append(self.pattern_to_item[i])
-                
-                if results:
-                    return results
+                with span("rag.encode", sentences=len(pending)):
+                    query_vecs = prepare_vectors(self.model.encode([queries[qi] for qi in pending]), self.metric)
+                with span("rag.faiss_search", queries=len(pending)):
+                    scores, indices = self.index.search(query_vecs, k)
+                count("rag.semantic_queries", len(pending))
+
+                for row, qi in enumerate(pending):
+                    # 过滤掉低相似度的结果
+                    matched = []
+                    for i, score in zip(indices[row], scores[row]):
+                        # 近似索引结果不足 k 个时以 -1 补齐
+                        if i >= 0 and self._is_similar(score):
+                            matched.append(self.pattern_to_item[i])
+                    if matched:
+                        results[qi] = matched
             except Exception as e:
                 print(f"语义搜索失败: {str(e)}")
-        
-        # 如果语义搜索不可用或没有找到结果，使用基于正则表达式的匹配
-        regex_match = self._regex_match(query)
-        if regex_match:
-            return [regex_match]
-        
-        # 如果没有找到匹配的结果，返回默认匹配
-        if self.kb["semantic_patterns"]:
-            # 默认返回第一个模式
-            return [self.kb["semantic_patterns"][0]]
-        
-        return []
+
+        for qi in pending:
+            if results[qi] is not None:
+                continue
+            # 如果语义搜索不可用或没有找到结果，使用基于正则表达式的匹配
+            regex_match = self._regex_match(queries[qi])
+            if regex_match:
+                count("rag.keyword_hits")
+                results[qi] = [regex_match]
+            # 如果没有找到匹配的结果，返回默认匹配
+            elif self.kb["semantic_patterns"]:
+                # 默认返回第一个模式
+                results[qi] = [self.kb["semantic_patterns"][0]]
+            else:
+                results[qi] = []
+
+        return results
+
+    def _is_similar(self, score):
+        """相似度阈值：余弦相似度越大越相似，L2 距离（平方）越小越相似"""
+        if self.metric == "cosine":
+            return score >= MIN_COSINE_SIMILARITY
+        return score < MAX_L2_DISTANCE
 
     def _exact_match(self, query):
         """
         尝试精确匹配规则
         """
-        for item, pattern_str in zip(self.pattern_to_item, self.pattern_strings):
-            # 将模式中的.*替换为匹配任何字符的正则表达式
-            regex_pattern = pattern_str.replace(".*", ".*")
-            if re.search(regex_pattern, query):
-                return item
-        return None
+        idx = self.matcher.exact_match(query)
+        return self.pattern_to_item[idx] if idx is not None else None
 
     def _regex_match(self, query):
         """
-        使用正则表达式进行模式匹配
+        使用关键词倒排索引进行模式匹配
         """
-        # 为每个模式计算匹配度分值
-        best_match = None
-        best_score = 0
-        
-        for item, pattern_str in zip(self.pattern_to_item, self.pattern_strings):
-            # 计算匹配度分值
-            score = 0
-            
-            # 如果模式中的关键词在查询中出现，增加分值
-            # 简化的评分方法：计算模式中的关键词在查询中出现的次数
-            keywords = re.findall(r'[\u4e00-\u9fff]+', pattern_str)  # 提取中文关键词
-            for keyword in keywords:
-                if keyword in query:
-                    score += 1
-            
-            # 如果当前模式得分更高，更新最佳匹配
-            if score > best_score:
-                best_score = score
-                best_match = item
-        
-        return best_match if best_score > 0 else None
+        idx = self.matcher.keyword_match(query)
+        return self.pattern_to_item[idx] if idx is not None else None
 
     def get_all_patterns(self):
         """
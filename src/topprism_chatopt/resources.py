@@ -0,0 +1,54 @@
+# resources.py
+# Topprism-ChatOpt | 进程级共享资源
+import os
+import threading
+from .data_loader import load_agents, load_customers
+from .rag_retriever import TopprismRAG
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+_lock = threading.Lock()
+_retriever = None
+_datasets = {}
+
+def get_retriever():
+    """
+    获取进程内唯一的检索器（模型、FAISS 索引只加载一次）
+    首次调用时完成预热，之后所有会话共享同一实例
+    """
+    global _retriever
+    if _retriever is None:
+        with _lock:
+            if _retriever is None:
+                retriever = TopprismRAG()
+                retriever.warm_up()
+                _retriever = retriever
+    return _retriever
+
+def load_datasets(data_dir=None):
+    """
+    读取客户与销售代表数据（校验后的列式数据，见 data_loader），按文件修改时间缓存
+    返回的 DataFrame 在会话间共享，调用方不应原地修改
+    """
+    data_dir = data_dir or DATA_DIR
+    customers_path = os.path.join(data_dir, "customers.csv")
+    agents_path = os.path.join(data_dir, "agents.csv")
+    stamp = (os.path.getmtime(customers_path), os.path.getmtime(agents_path))
+
+    cached = _datasets.get(data_dir)
+    if cached is not None and cached[0] == stamp:
+        return cached[1], cached[2]
+
+    with _lock:
+        cached = _datasets.get(data_dir)
+        if cached is None or cached[0] != stamp:
+            customers = load_customers(customers_path)
+            agents = load_agents(agents_path)
+            cached = (stamp, customers, agents)
+            _datasets[data_dir] = cached
+    return cached[1], cached[2]
+
+def warm_up(data_dir=None):
+    """启动时预加载检索器与数据集"""
+    get_retriever()
+    load_datasets(data_dir)
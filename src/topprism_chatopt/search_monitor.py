@@ -0,0 +1,120 @@
+# search_monitor.py
+# Topprism-ChatOpt | 搜索过程监控与提前停止
+import threading
+import time
+from contextlib import contextmanager
+
+MIN_TIME_LIMIT_SECONDS = 2.0
+MAX_TIME_LIMIT_SECONDS = 30.0
+SECONDS_PER_CUSTOMER = 0.05
+# 跨进程停止信号的轮询间隔（polled_stop）
+STOP_POLL_SECONDS = 0.2
+
+def default_time_limit(n_customers):
+    """按问题规模估算时间上限：小规模实例不再占满 30 秒"""
+    limit = MIN_TIME_LIMIT_SECONDS + SECONDS_PER_CUSTOMER * n_customers
+    return min(MAX_TIME_LIMIT_SECONDS, limit)
+
+def default_stall_window(time_limit_seconds):
+    """默认停滞窗口：时间上限的四分之一，至少 1 秒"""
+    return max(1.0, 0.25 * time_limit_seconds)
+
+class ObjectiveMonitor:
+    """
+    记录目标值随时间的变化，并在以下情况下请求停止搜索：
+    - stall_seconds 内没有足够的改进（相对改进小于 min_relative_improvement 不计）
+    - 提供 lower_bound 时，最优值与下界的相对差距不超过 gap_threshold
+    - 外部回调 external_stop 返回 True
+    停滞与差距只在找到新解时检查（on_solution），不需要求解器反复回调 Python；
+    只有外部停止需要通过 CustomLimit 轮询 should_stop
+    """
+    # should_stop 会被求解器频繁调用，每隔若干次才真正调用 external_stop
+    CHECK_EVERY = 64
+
+    def __init__(self, stall_seconds=None, min_relative_improvement=0.0, gap_threshold=None,
+                 lower_bound=None, external_stop=None, clock=time.monotonic):
+        self.stall_seconds = stall_seconds
+        self.min_relative_improvement = min_relative_improvement
+        self.gap_threshold = gap_threshold
+        self.lower_bound = lower_bound
+        self.external_stop = external_stop
+        self.clock = clock
+        self.trajectory = []
+        self.best = None
+        self.stop_reason = None
+        self._start = clock()
+        self._last_improvement = self._start
+        self._calls = 0
+
+    @property
+    def calls(self):
+        """should_stop 被调用的次数"""
+        return self._calls
+
+    def start(self):
+        self._start = self.clock()
+        self._last_improvement = self._start
+
+    def elapsed(self):
+        return self.clock() - self._start
+
+    def on_solution(self, objective):
+        """每找到一个解时调用，只记录严格改进；返回 True 表示应当停止搜索"""
+        now = self.clock()
+        if self.best is None or objective < self.best:
+            if self.best is None or self.best - objective > self.min_relative_improvement * abs(self.best):
+                self._last_improvement = now
+            self.best = objective
+            self.trajectory.append((round(now - self._start, 3), objective))
+
+        if (self.gap_threshold is not None and self.lower_bound is not None and self.best > 0
+                and (self.best - self.lower_bound) / self.best <= self.gap_threshold):
+            self.stop_reason = "gap"
+        elif self.stall_seconds is not None and now - self._last_improvement > self.stall_seconds:
+            self.stop_reason = "stall"
+        return self.stop_reason is not None
+
+    def should_stop(self):
+        """供 CustomLimit 轮询外部停止回调"""
+        if self.stop_reason is not None:
+            return True
+        self._calls += 1
+        if self._calls % self.CHECK_EVERY:
+            return False
+        if self.external_stop is not None and self.external_stop():
+            self.stop_reason = "external"
+        return self.stop_reason is not None
+
+@contextmanager
+def polled_stop(should_stop, interval=STOP_POLL_SECONDS):
+    """
+    把开销较大的停止回调（如 Manager().Event() 代理的 is_set，每次调用都是一次进程间通信）
+    复制为本进程内的标志：后台线程每隔 interval 秒调用一次 should_stop，
+    返回的回调只读取本地标志，供 CustomLimit 在搜索中频繁轮询
+    should_stop 为 None 时返回 None（不安装 CustomLimit）
+    """
+    if should_stop is None:
+        yield None
+        return
+    stopped = threading.Event()
+    finished = threading.Event()
+
+    def watch():
+        while True:
+            try:
+                if should_stop():
+                    stopped.set()
+                    return
+            except (EOFError, OSError):
+                # 信号所在的进程已退出，不再轮询
+                return
+            if finished.wait(interval):
+                return
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        yield stopped.is_set
+    finally:
+        finished.set()
+        watcher.join()
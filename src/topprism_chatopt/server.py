@@ -0,0 +1,165 @@
+# server.py
+# Topprism-ChatOpt | 本地 HTTP 服务（与批量求解共用同一条流水线）
+import json
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+from .batch import confine_path, prepare_model, result_to_dict
+from .data_loader import load_agents, load_customers, validate_table
+from .jobs import FINISHED, JobManager, JobQueueFull
+from .resources import load_datasets
+from .tracing import PrometheusExporter, get_default_tracer
+
+JOB_PATH_RE = re.compile(r"^/jobs/([0-9a-f]+)$")
+DEFAULT_WAIT_SECONDS = 120
+
+def resolve_data_path(data_root, path):
+    """
+    把请求中的文件路径解析到 data_root 之下（相对路径相对于 data_root）
+    未配置 data_root 或路径（含符号链接）指向目录之外时抛出 PermissionError
+    """
+    if not data_root:
+        raise PermissionError("服务未配置数据目录（--data-root），不能按路径读取数据")
+    return confine_path(data_root, path)
+
+def _load_request_data(body, data_root=None):
+    """
+    请求中的数据：customers/agents 为记录列表，或 data_root 下的 customers_path/agents_path，
+    缺省使用示例数据
+    """
+    customers, agents = None, None
+    if "customers" in body:
+        customers = validate_table(pd.DataFrame(body["customers"]), "customers", "customers")
+    elif "customers_path" in body:
+        customers = load_customers(resolve_data_path(data_root, body["customers_path"]))
+    if "agents" in body:
+        agents = validate_table(pd.DataFrame(body["agents"]), "agents", "agents")
+    elif "agents_path" in body:
+        agents = load_agents(resolve_data_path(data_root, body["agents_path"]))
+    if customers is None or agents is None:
+        default_customers, default_agents = load_datasets()
+        customers = default_customers if customers is None else customers
+        agents = default_agents if agents is None else agents
+    return customers, agents
+
+def _job_payload(snapshot):
+    payload = {key: value for key, value in snapshot.items() if key != "result"}
+    payload["best_routes"] = (
+        {str(agent_id): route for agent_id, route in snapshot["best_routes"].items()}
+        if snapshot["best_routes"] is not None else None
+    )
+    if snapshot["result"] is not None:
+        payload["result"] = result_to_dict(snapshot["result"])
+    return payload
+
+class TopprismHandler(BaseHTTPRequestHandler):
+    """
+    GET    /health        服务状态
+    GET    /metrics       各阶段耗时与计数（Prometheus 文本格式）
+    POST   /jobs          提交求解任务，body: {"rules": [...], "customers": [...], "agents": [...],
+                          "search_options": {...}, "wait": false, "timeout": 120}
+                          customers_path/agents_path 只能指向 data_root 下的文件
+    GET    /jobs/<id>     查询任务状态与（中间）结果
+    DELETE /jobs/<id>     取消任务
+    """
+    jobs = None
+    metrics = None
+    data_root = None
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "jobs": self.jobs.stats()})
+            return
+        if self.path == "/metrics":
+            body = self.metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        match = JOB_PATH_RE.match(self.path)
+        snapshot = self.jobs.status(match.group(1)) if match else None
+        if snapshot is None:
+            self._send_json(404, {"error": "任务不存在"})
+            return
+        self._send_json(200, _job_payload(snapshot))
+
+    def do_DELETE(self):
+        match = JOB_PATH_RE.match(self.path)
+        if match is None or self.jobs.get(match.group(1)) is None:
+            self._send_json(404, {"error": "任务不存在"})
+            return
+        self._send_json(200, {"cancelled": self.jobs.cancel(match.group(1))})
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            self._send_json(404, {"error": "接口不存在"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("请求体必须是 JSON 对象")
+            rules = [str(rule).strip() for rule in body.get("rules", []) if str(rule).strip()]
+            timeout = float(body.get("timeout", DEFAULT_WAIT_SECONDS))
+            customers, agents = _load_request_data(body, self.data_root)
+        except PermissionError as e:
+            self._send_json(403, {"error": str(e)})
+            return
+        except (ValueError, TypeError, KeyError, OSError) as e:
+            # SchemaError 与 JSON 解析错误都是 ValueError
+            self._send_json(400, {"error": str(e)})
+            return
+
+        try:
+            _, code = prepare_model(rules, customers, agents)
+            job_id = self.jobs.submit(customers, agents, rules, code, search_options=body.get("search_options"))
+        except JobQueueFull as e:
+            self._send_json(429, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": f"建模或提交任务失败: {str(e)}"})
+            return
+
+        job = self.jobs.get(job_id)
+        if body.get("wait"):
+            job.wait(timeout=timeout)
+        snapshot = job.snapshot()
+        self._send_json(200 if snapshot["status"] in FINISHED else 202, _job_payload(snapshot))
+
+    def log_message(self, format, *args):
+        pass
+
+def create_server(host="127.0.0.1", port=8765, jobs=None, max_workers=None, data_root=None):
+    """
+    创建 HTTP 服务（不启动），port 为 0 时自动分配端口
+    data_root: 允许按路径读取数据的目录，为空时只接受请求中的记录数据
+    """
+    handler = type("BoundTopprismHandler", (TopprismHandler,), {
+        "jobs": jobs if jobs is not None else JobManager(max_workers=max_workers),
+        "metrics": get_default_tracer().add_exporter(PrometheusExporter()),
+        "data_root": data_root,
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+def serve_forever(host="127.0.0.1", port=8765, max_workers=None, data_root=None):
+    """启动服务直到 Ctrl+C"""
+    server = create_server(host, port, max_workers=max_workers, data_root=data_root)
+    print(f"Topprism-ChatOpt 服务已启动: http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.RequestHandlerClass.jobs.shutdown()
+        get_default_tracer().remove_exporter(server.RequestHandlerClass.metrics)
@@ -0,0 +1,76 @@
+# singleflight.py
+# Topprism-ChatOpt | 相同请求合并执行
+import concurrent.futures
+import threading
+
+class SingleFlight:
+    """
+    同一指纹的并发请求只执行一次，其余请求等待并共享结果（或异常）
+    计算完成后立即移除，之后的请求重新执行（结果复用交给各级缓存）
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.executed = 0
+        self.deduplicated = 0
+
+    def do(self, key, fn):
+        """
+        阻塞执行 fn()，返回 (结果, 是否为合并的请求)
+        同一 key 已有计算在进行时，直接等待其结果
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.deduplicated += 1
+                shared = True
+            else:
+                future = concurrent.futures.Future()
+                self._in_flight[key] = future
+                self.executed += 1
+                shared = False
+
+        if shared:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def join(self, key, submit):
+        """
+        非阻塞版本：submit() 返回 concurrent.futures.Future
+        同一 key 已有进行中的 Future 时直接返回它
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.deduplicated += 1
+                return future
+            future = submit()
+            self._in_flight[key] = future
+            self.executed += 1
+
+        def _done(_):
+            with self._lock:
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+
+        future.add_done_callback(_done)
+        return future
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "deduplicated": self.deduplicated,
+                "in_flight": len(self._in_flight),
+            }
@@ -0,0 +1,182 @@
+# solve_cache.py
+# Topprism-ChatOpt | 求解结果缓存
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+def _normalize_rules(rules):
+    """去掉首尾及多余空白，忽略空行；规则顺序保留（代码生成按顺序对应）"""
+    normalized = []
+    for rule in rules or []:
+        rule = re.sub(r"\s+", " ", str(rule)).strip()
+        if rule:
+            normalized.append(rule)
+    return normalized
+
+def _normalize_code(code):
+    lines = [line.rstrip() for line in (code or "").strip().splitlines()]
+    return "\n".join(lines)
+
+def _hash_dataframe(h, df):
+    h.update(json.dumps([str(c) for c in df.columns], ensure_ascii=False).encode("utf-8"))
+    h.update(json.dumps([str(t) for t in df.dtypes], ensure_ascii=False).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+
+def solve_fingerprint(customers_df, agents_df, rules, generated_code, search_options=None):
+    """
+    求解模型的规范化指纹：规则、约束代码、数据内容、搜索参数任一变化都会改变指纹
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(_normalize_rules(rules), ensure_ascii=False).encode("utf-8"))
+    h.update(b"\0")
+    h.update(_normalize_code(generated_code).encode("utf-8"))
+    h.update(b"\0")
+    _hash_dataframe(h, customers_df)
+    h.update(b"\0")
+    _hash_dataframe(h, agents_df)
+    h.update(b"\0")
+    h.update(json.dumps(search_options or {}, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+class SolveCache:
+    """
+    两级求解结果缓存
+    - 内存层：LRU，按条目数淘汰
+    - 磁盘层（可选）：pickle 文件，按总字节数淘汰最久未使用的条目
+    """
+    def __init__(self, max_entries=128, disk_dir=None, max_disk_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return self._memory[key]
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._put_memory(key, value)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._put_memory(key, value)
+        self._write_disk(key, value)
+
+    def _put_memory(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)  # 更新访问时间，淘汰时按最久未使用排序
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"读取求解缓存失败: {str(e)}")
+            return None
+
+    def _write_disk(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self._evict_disk()
+        except Exception as e:
+            print(f"写入求解缓存失败: {str(e)}")
+
+    def _evict_disk(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                if name.endswith(".pkl"):
+                    os.remove(os.path.join(self.disk_dir, name))
+
+    def stats(self):
+        """命中/未命中计数，用于观察缓存效果"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_default_cache():
+    """
+    进程级默认缓存
+    设置环境变量 TOPPRISM_SOLVE_CACHE_DIR 时启用磁盘层
+    """
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = SolveCache(disk_dir=os.environ.get("TOPPRISM_SOLVE_CACHE_DIR"))
+    return _default_cache
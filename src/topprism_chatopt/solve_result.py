@@ -0,0 +1,285 @@
+# solve_result.py
+# Topprism-ChatOpt | 结构化求解结果
+import io
+import json
+from collections.abc import MutableMapping
+import numpy as np
+import pandas as pd
+
+# 结构化数组（均为一维 NumPy 数组，只读）
+# route_offsets: 各路线在 route_nodes 中的起止位置，长度为销售代表数 + 1
+# route_nodes: 按拜访顺序排列的客户行号，不含出发/返回点
+# cumul_min / cumul_max: 每个拜访点开始服务时间的可行范围（分钟，从 0 点起），差值为可推迟的松弛时间
+# start_nodes / end_nodes: 各路线出发/返回节点编号，小于客户数时为充当仓库的客户
+# depart_min / depart_max / return_min / return_max: 各路线出发、返回时间的可行范围
+# dropped: 未被拜访（AddDisjunction 放弃）的客户行号
+ARRAY_FIELDS = (
+    "route_offsets", "route_nodes", "cumul_min", "cumul_max",
+    "start_nodes", "end_nodes", "depart_min", "depart_max", "return_min", "return_max",
+    "dropped",
+)
+# 首次读取时由数组生成、不参与序列化的键
+DERIVED_FIELDS = ("schedule", "routes")
+# 拼接结果（merge_results）中的子结果列表，已合并到数组中，不参与序列化
+NESTED_FIELDS = ("days",)
+
+def _plain(value):
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return value
+
+def empty_arrays(n_agents, n_customers=0):
+    """没有可行解时的数组：所有路线为空，出发/返回节点取各销售代表自己的节点编号"""
+    arrays = {name: np.zeros(0, dtype=np.int32) for name in ARRAY_FIELDS}
+    arrays["route_offsets"] = np.zeros(n_agents + 1, dtype=np.int32)
+    arrays["start_nodes"] = np.arange(n_customers, n_customers + n_agents, dtype=np.int32)
+    arrays["end_nodes"] = arrays["start_nodes"].copy()
+    for name in ("depart_min", "depart_max", "return_min", "return_max"):
+        arrays[name] = np.zeros(n_agents, dtype=np.int32)
+    return arrays
+
+def _global_node(node, customer_rows, agent_rows, n_customers, n_agents):
+    """子问题的节点编号 → 完整问题的节点编号（客户、出发点、返回点依次编号）"""
+    if node < len(customer_rows):
+        return int(customer_rows[node])
+    depot = node - len(customer_rows)
+    if depot < len(agent_rows):
+        return n_customers + int(agent_rows[depot])
+    return n_customers + n_agents + int(agent_rows[depot - len(agent_rows)])
+
+def merge_results(fields, parts, customer_ids, customer_names, agent_ids, agent_names, n_agents=None):
+    """
+    把多个子问题（分解求解的各簇、周期排程的各天）的结果拼接为一个 SolveResult
+    parts: [(子结果, 客户行号, 销售代表行号, 路线偏移), ...]
+      行号数组把子问题的行映射到完整问题，子问题的第 v 条路线放在结果的第 路线偏移 + 销售代表行号[v] 条
+      子结果为 None 时对应路线为空；子结果为 None 或求解失败时，其客户计入 dropped，
+      求解失败的路线序号记录在 failed_vehicles 中，排程表中显示为“求解失败”
+    n_agents: 完整问题的销售代表数（返回点的编号偏移），默认为 len(agent_ids)
+    fields 中没有的 solver_status、trajectory、stop_reason 与耗时由子结果汇总
+    """
+    n_customers = len(customer_ids)
+    n_agents = len(agent_ids) if n_agents is None else n_agents
+    n_vehicles = len(agent_ids)
+    empty = np.zeros(0, dtype=np.int32)
+    vehicles = [None] * n_vehicles
+    dropped = [empty]
+    failed = []
+    solved_parts = []
+    for result, customer_rows, agent_rows, offset in parts:
+        customer_rows = np.asarray(customer_rows, dtype=np.int32)
+        solved = result is not None and bool(result["solved"])
+        if solved:
+            solved_parts.append(result)
+            dropped.append(customer_rows[result["dropped"]])
+        else:
+            dropped.append(customer_rows)
+        for vehicle, agent in enumerate(agent_rows):
+            position = offset + int(agent)
+            depot = n_customers + int(agent)
+            if not solved:
+                if result is not None:
+                    failed.append(position)
+                vehicles[position] = (empty, empty, empty, depot, depot, 0, 0, 0, 0)
+                continue
+            lo, hi = result["route_offsets"][vehicle], result["route_offsets"][vehicle + 1]
+            vehicles[position] = (
+                customer_rows[result["route_nodes"][lo:hi]],
+                result["cumul_min"][lo:hi],
+                result["cumul_max"][lo:hi],
+                _global_node(result["start_nodes"][vehicle], customer_rows, agent_rows, n_customers, n_agents),
+                _global_node(result["end_nodes"][vehicle], customer_rows, agent_rows, n_customers, n_agents),
+                result["depart_min"][vehicle], result["depart_max"][vehicle],
+                result["return_min"][vehicle], result["return_max"][vehicle],
+            )
+    for position, vehicle in enumerate(vehicles):
+        if vehicle is None:
+            depot = n_customers + position % max(n_agents, 1)
+            vehicles[position] = (empty, empty, empty, depot, depot, 0, 0, 0, 0)
+
+    columns = list(zip(*vehicles)) if vehicles else [()] * 9
+    lengths = [len(nodes) for nodes in columns[0]]
+    arrays = {
+        "route_offsets": np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int32),
+        "route_nodes": np.concatenate([empty, *columns[0]]).astype(np.int32),
+        "cumul_min": np.concatenate([empty, *columns[1]]).astype(np.int32),
+        "cumul_max": np.concatenate([empty, *columns[2]]).astype(np.int32),
+        "dropped": np.unique(np.concatenate(dropped)).astype(np.int32),
+    }
+    names = ("start_nodes", "end_nodes", "depart_min", "depart_max", "return_min", "return_max")
+    for name, values in zip(names, columns[3:]):
+        arrays[name] = np.asarray(values, dtype=np.int32)
+
+    fields = dict(fields)
+    fields["failed_vehicles"] = failed
+    results = [part[0] for part in parts if part[0] is not None]
+    statuses = [r.get("solver_status") for r in results if not r["solved"]] or \
+               [r.get("solver_status") for r in results]
+    fields.setdefault("solver_status", statuses[0] if statuses else "ROUTING_SUCCESS")
+    # 各子问题独立搜索，没有统一的收敛曲线，只记录最终目标值
+    fields.setdefault("trajectory", [(max([r.get("search_seconds", 0) for r in results], default=0),
+                                      fields["objective"])] if fields.get("objective") is not None else [])
+    fields.setdefault("stop_reason", ",".join(sorted({str(r.get("stop_reason")) for r in results})) or "empty")
+    # 子问题并行求解，耗时取最长的一个
+    for name in ("build_seconds", "search_seconds"):
+        fields.setdefault(name, max([r.get(name, 0) for r in results], default=0))
+    return SolveResult(fields, arrays, customer_ids, customer_names, agent_ids, agent_names)
+
+class SolveResult(MutableMapping):
+    """
+    结构化求解结果
+    路线、时间范围、未拜访客户保存为整数数组；schedule、routes 在首次读取时由数组生成
+    solved、objective、solver_status、耗时等标量与数组一样按键读取，标量可以写入和删除
+    """
+    def __init__(self, fields, arrays, customer_ids, customer_names, agent_ids, agent_names):
+        self._fields = dict(fields)
+        self._arrays = {}
+        for name in ARRAY_FIELDS:
+            array = np.asarray(arrays[name])
+            array.setflags(write=False)
+            self._arrays[name] = array
+        self.customer_ids = list(customer_ids)
+        self.customer_names = list(customer_names)
+        self.agent_ids = list(agent_ids)
+        self.agent_names = list(agent_names)
+        self._derived = {}
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            return self._fields[key]
+        if key in self._arrays:
+            return self._arrays[key]
+        if key in DERIVED_FIELDS:
+            if key not in self._derived:
+                self._derived[key] = self._schedule() if key == "schedule" else self._routes()
+            return self._derived[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._arrays:
+            raise KeyError(f"{key} 为只读数组")
+        # 写入 schedule/routes 时覆盖由数组生成的值
+        self._fields[key] = value
+
+    def __delitem__(self, key):
+        del self._fields[key]
+
+    def __iter__(self):
+        yield from self._fields
+        for key in DERIVED_FIELDS:
+            if key not in self._fields:
+                yield key
+        yield from self._arrays
+
+    def __len__(self):
+        return len(self._fields) + len([key for key in DERIVED_FIELDS if key not in self._fields]) + len(self._arrays)
+
+    def __repr__(self):
+        return (f"SolveResult(solved={self.get('solved')}, objective={self.get('objective')}, "
+                f"stops={len(self._arrays['route_nodes'])}, dropped={len(self._arrays['dropped'])})")
+
+    def __getstate__(self):
+        # 生成的 DataFrame 不随 pickle 传递（进程间、磁盘缓存），读取时重新生成
+        state = dict(self.__dict__)
+        state["_derived"] = {}
+        return state
+
+    def route(self, vehicle):
+        """第 vehicle 条路线拜访的客户行号"""
+        offsets = self._arrays["route_offsets"]
+        return self._arrays["route_nodes"][offsets[vehicle]:offsets[vehicle + 1]]
+
+    def _merged(self):
+        # merge_results 拼接的结果即使部分子问题失败，其余路线仍然有效
+        return "failed_vehicles" in self._fields
+
+    def _schedule(self):
+        if not self._fields.get("solved") and not self._merged():
+            return pd.DataFrame([{"销售代表": "无", "拜访客户": "求解失败"}])
+        n_customers = len(self.customer_names)
+        failed = set(self._fields.get("failed_vehicles", ()))
+        day_labels = self._fields.get("day_labels")
+        schedule = []
+        for vehicle, agent_name in enumerate(self.agent_names):
+            start = int(self._arrays["start_nodes"][vehicle])
+            # 没有出发点坐标时 0 号客户充当仓库，显示在路线开头
+            nodes = ([start] if start < n_customers else []) + self.route(vehicle).tolist()
+            route = [self.customer_names[node] for node in nodes]
+            row = {"销售代表": agent_name, "拜访客户": " → ".join(route) if route else "无"}
+            if vehicle in failed:
+                row["拜访客户"] = "求解失败"
+            if day_labels is not None:
+                row = {"日期": day_labels[vehicle], **row}
+            schedule.append(row)
+        return pd.DataFrame(schedule)
+
+    def _routes(self):
+        if not self._fields.get("solved") and not self._merged():
+            return {}
+        # 周期排程中同一销售代表有多条路线（每天一条），按日期顺序连接
+        routes = {}
+        for vehicle, agent_id in enumerate(self.agent_ids):
+            route = routes.setdefault(agent_id, [])
+            route.extend(self.customer_ids[node] for node in self.route(vehicle).tolist())
+        return routes
+
+    def stops(self):
+        """每个拜访点一行的列式表：销售代表行号、顺序、客户行号、开始时间范围与松弛时间"""
+        offsets = self._arrays["route_offsets"]
+        lengths = np.diff(offsets)
+        cumul_min = self._arrays["cumul_min"]
+        cumul_max = self._arrays["cumul_max"]
+        return pd.DataFrame({
+            "agent": np.repeat(np.arange(len(lengths), dtype=np.int32), lengths),
+            "sequence": np.arange(len(cumul_min), dtype=np.int32) - np.repeat(offsets[:-1], lengths),
+            "customer": self._arrays["route_nodes"],
+            "cumul_min": cumul_min,
+            "cumul_max": cumul_max,
+            "slack": cumul_max - cumul_min,
+        })
+
+    def copy(self, **fields):
+        """浅拷贝：共享只读数组，标量与覆盖值单独复制；fields 覆盖对应的标量"""
+        copied = SolveResult({}, self._arrays, self.customer_ids, self.customer_names,
+                             self.agent_ids, self.agent_names)
+        for key, value in self._fields.items():
+            if hasattr(value, "copy"):
+                value = value.copy()
+            copied._fields[key] = value
+        copied._fields.update(fields)
+        return copied
+
+    def to_bytes(self):
+        """序列化为 .npz：数组按列保存，标量与名称以 JSON 保存在 meta 中"""
+        meta = {
+            "fields": {key: value for key, value in self._fields.items()
+                       if not hasattr(value, "to_dict") and key not in NESTED_FIELDS},
+            "customer_ids": self.customer_ids,
+            "customer_names": self.customer_names,
+            "agent_ids": self.agent_ids,
+            "agent_names": self.agent_names,
+        }
+        meta = json.dumps(_plain(meta), ensure_ascii=False, default=str).encode("utf-8")
+        buffer = io.BytesIO()
+        np.savez(buffer, meta=np.frombuffer(meta, dtype=np.uint8), **self._arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+            meta = json.loads(archive["meta"].tobytes().decode("utf-8"))
+            arrays = {name: archive[name] for name in ARRAY_FIELDS}
+        return cls(meta["fields"], arrays, meta["customer_ids"], meta["customer_names"],
+                   meta["agent_ids"], meta["agent_names"])
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
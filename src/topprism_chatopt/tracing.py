@@ -0,0 +1,233 @@
+# tracing.py
+# Topprism-ChatOpt | 轻量级分阶段计时、计数与性能剖析
+import cProfile
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class InMemoryExporter:
+    """把记录保存在内存中，便于测试与界面展示"""
+    def __init__(self, max_spans=10000):
+        self.max_spans = max_spans
+        self.spans = []
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def export_span(self, record):
+        with self._lock:
+            self.spans.append(record)
+            if len(self.spans) > self.max_spans:
+                del self.spans[:len(self.spans) - self.max_spans]
+
+    def export_counter(self, record):
+        with self._lock:
+            self.counters[record["name"]] = self.counters.get(record["name"], 0) + record["value"]
+
+    def summary(self):
+        """按阶段汇总：{阶段: {"count", "total", "max"}}（秒）"""
+        result = OrderedDict()
+        with self._lock:
+            for record in self.spans:
+                stats = result.setdefault(record["name"], {"count": 0, "total": 0.0, "max": 0.0})
+                stats["count"] += 1
+                stats["total"] += record["duration"]
+                stats["max"] = max(stats["max"], record["duration"])
+        return result
+
+class JsonLinesExporter:
+    """每条记录追加一行 JSON，多进程可以写同一个文件"""
+    # worker 进程通过环境变量直接写同一个文件，replay 时不再重复写入
+    shared_across_processes = True
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def export_span(self, record):
+        self._write(record)
+
+    def export_counter(self, record):
+        self._write(record)
+
+class _Collector:
+    """原样收集记录，供 Tracer.capture 使用"""
+    def __init__(self):
+        self.records = []
+
+    def export_span(self, record):
+        self.records.append(record)
+
+    def export_counter(self, record):
+        self.records.append(record)
+
+_METRIC_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+class PrometheusExporter:
+    """聚合为 Prometheus 文本格式：阶段耗时为 summary，计数为 counter"""
+    def __init__(self, prefix="topprism"):
+        self.prefix = prefix
+        self._spans = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def export_span(self, record):
+        with self._lock:
+            stats = self._spans.setdefault(record["name"], [0, 0.0])
+            stats[0] += 1
+            stats[1] += record["duration"]
+
+    def export_counter(self, record):
+        with self._lock:
+            self._counters[record["name"]] = self._counters.get(record["name"], 0) + record["value"]
+
+    def render(self):
+        lines = []
+        with self._lock:
+            if self._spans:
+                metric = f"{self.prefix}_span_seconds"
+                lines.append(f"# TYPE {metric} summary")
+                for name, (count, total) in sorted(self._spans.items()):
+                    lines.append(f'{metric}_sum{{span="{name}"}} {total:.6f}')
+                    lines.append(f'{metric}_count{{span="{name}"}} {count}')
+            for name, value in sorted(self._counters.items()):
+                metric = f"{self.prefix}_{_METRIC_NAME_RE.sub('_', name)}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+class Tracer:
+    """
+    分阶段计时与计数
+    没有注册导出器时 span/count 只有很小的开销；
+    设置 profile_dir 后，标记了 profile=True 的最外层阶段会用 cProfile 记录并保存为 .prof 文件
+    （各阶段均为独立函数，也便于用 py-spy 直接附加进程采样）
+    """
+    def __init__(self, exporters=None, profile_dir=None):
+        self.exporters = list(exporters or [])
+        self.profile_dir = profile_dir
+        self._local = threading.local()
+
+    def add_exporter(self, exporter):
+        # 整体替换列表，其它线程正在遍历的旧列表不受影响
+        self.exporters = self.exporters + [exporter]
+        return exporter
+
+    def remove_exporter(self, exporter):
+        self.exporters = [e for e in self.exporters if e is not exporter]
+
+    @contextmanager
+    def span(self, name, profile=False, **attrs):
+        """
+        记录一个阶段的耗时，返回的字典可在阶段内补充属性（如 cache_hit）
+        """
+        profiler = None
+        if profile and self.profile_dir and not getattr(self._local, "profiling", False):
+            profiler = cProfile.Profile()
+            self._local.profiling = True
+            profiler.enable()
+        if not self.exporters and profiler is None:
+            yield attrs
+            return
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        wall_start = time.time()
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            if profiler is not None:
+                profiler.disable()
+                self._local.profiling = False
+                self._dump_profile(profiler, name)
+            record = {
+                "type": "span",
+                "name": name,
+                "start": wall_start,
+                "duration": duration,
+                "parent": parent,
+                "pid": os.getpid(),
+                "thread": threading.current_thread().name,
+                "attrs": attrs,
+            }
+            for exporter in self.exporters:
+                exporter.export_span(record)
+
+    def count(self, name, value=1, **attrs):
+        """累加计数（回调次数、缓存命中、找到的解等）"""
+        if not self.exporters or not value:
+            return
+        record = {"type": "counter", "name": name, "value": value, "pid": os.getpid(), "attrs": attrs}
+        for exporter in self.exporters:
+            exporter.export_counter(record)
+
+    @contextmanager
+    def capture(self):
+        """
+        临时收集期间产生的所有记录（列表），
+        用于在 worker 进程中收集后随结果交回主进程，再由 replay 交给主进程的导出器
+        """
+        collector = self.add_exporter(_Collector())
+        try:
+            yield collector.records
+        finally:
+            self.remove_exporter(collector)
+
+    def replay(self, records):
+        """把其它进程收集的记录交给本进程的导出器"""
+        exporters = [e for e in self.exporters if not getattr(e, "shared_across_processes", False)]
+        for record in records:
+            for exporter in exporters:
+                if record["type"] == "span":
+                    exporter.export_span(record)
+                else:
+                    exporter.export_counter(record)
+
+    def _dump_profile(self, profiler, name):
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"{name}-{os.getpid()}-{int(time.time() * 1000)}.prof")
+            profiler.dump_stats(path)
+        except OSError as e:
+            print(f"性能剖析结果写入失败: {str(e)}")
+
+_default_tracer = None
+_default_tracer_lock = threading.Lock()
+
+def get_default_tracer():
+    """
+    进程级默认追踪器
+    环境变量 TOPPRISM_TRACE_FILE 设置时自动写入 JSON lines；TOPPRISM_PROFILE_DIR 开启 cProfile
+    """
+    global _default_tracer
+    if _default_tracer is None:
+        with _default_tracer_lock:
+            if _default_tracer is None:
+                tracer = Tracer(profile_dir=os.environ.get("TOPPRISM_PROFILE_DIR") or None)
+                if os.environ.get("TOPPRISM_TRACE_FILE"):
+                    tracer.add_exporter(JsonLinesExporter(os.environ["TOPPRISM_TRACE_FILE"]))
+                _default_tracer = tracer
+    return _default_tracer
+
+def span(name, profile=False, **attrs):
+    """默认追踪器上的 span"""
+    return get_default_tracer().span(name, profile=profile, **attrs)
+
+def count(name, value=1, **attrs):
+    """默认追踪器上的 count"""
+    get_default_tracer().count(name, value, **attrs)
@@ -1,42 +1,398 @@
 # utils.py
-import plotly.express as px
+# Topprism-ChatOpt | 地图与时间线可视化
+# 几何计算只依赖 numpy；plotly 只在绘图时导入，求解与命令行路径不加载
+import math
+import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
+from .common import DEFAULT_SPEED_KMH, MINUTES_PER_HOUR, entity_ids, haversine_meters, travel_minutes, window_minutes
+from .solve_result import SolveResult
 
-def plot_map(customers_df, schedule_df=None):
+# 地图上最多发送的客户点数，超过时按缩放级别聚合
+MAX_MAP_POINTS = 2000
+# 聚合网格的边长（屏幕像素），同一格内的点合并为一个
+CELL_PIXELS = 8
+# 所有路线折线合计最多发送的顶点数
+MAX_ROUTE_VERTICES = 5000
+# 路线不超过该数量时每条一个 trace（图例显示姓名），否则按颜色合并为少量 trace
+MAX_ROUTE_TRACES = 20
+# 时间线最多显示的销售代表数
+MAX_TIMELINE_AGENTS = 50
+TILE_PIXELS = 256
+MAX_ZOOM = 18
+PRIORITY_COLORS = {"A": "#d62728", "B": "#ff7f0e", "C": "#1f77b4"}
+ROUTE_COLORS = ["#636efa", "#ef553b", "#00cc96", "#ab63fa", "#ffa15a",
+                "#19d3f3", "#ff6692", "#b6e880", "#ff97ff", "#fecb52"]
+
+def _world_pixels(lat, lon, zoom):
+    """经纬度 → Web 墨卡托世界像素坐标"""
+    scale = TILE_PIXELS * 2.0 ** zoom
+    lat = np.radians(np.clip(np.asarray(lat, dtype=np.float64), -85.05, 85.05))
+    x = (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0 * scale
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * scale
+    return x, y
+
+def fit_zoom(lat, lon, width=800, height=400):
+    """能完整显示所有点的缩放级别"""
+    if len(lat) == 0:
+        return 10.0
+    x, y = _world_pixels(lat, lon, 0)
+    span_x = max(float(np.ptp(x)), 1e-9)
+    span_y = max(float(np.ptp(y)), 1e-9)
+    zoom = min(math.log2(width / span_x), math.log2(height / span_y))
+    return float(np.clip(math.floor(zoom * 2) / 2, 0, MAX_ZOOM))
+
+def decimate_points(lat, lon, zoom, categories=None, max_points=MAX_MAP_POINTS, cell_pixels=CELL_PIXELS):
+    """
+    按缩放级别在服务端聚合客户点
+    点数不超过 max_points 时原样返回；否则同一网格（且同一类别）内的点合并为质心，
+    仍然过多时逐级降低缩放级别（网格变大）
+    返回 {"lat", "lon", "count", "category", "rows"}，rows 为单点对应的原始行号，聚合点为 -1
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    n = len(lat)
+    if categories is None:
+        codes, labels = np.zeros(n, dtype=np.int64), np.array([None], dtype=object)
+    else:
+        codes, labels = pd.factorize(pd.Series(categories).astype(str), sort=True)
+        labels = np.asarray(labels, dtype=object)
+
+    if n <= max_points:
+        return {
+            "lat": lat.astype(np.float32),
+            "lon": lon.astype(np.float32),
+            "count": np.ones(n, dtype=np.int32),
+            "category": labels[codes] if n else np.array([], dtype=object),
+            "rows": np.arange(n, dtype=np.int32),
+        }
+
+    zoom = float(zoom)
+    while True:
+        x, y = _world_pixels(lat, lon, zoom)
+        cells = np.stack([np.floor(x / cell_pixels), np.floor(y / cell_pixels), codes], axis=1).astype(np.int64)
+        keys, inverse = np.unique(cells, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        if len(keys) <= max_points or zoom <= 0:
+            break
+        zoom -= 1
+
+    count = np.bincount(inverse, minlength=len(keys))
+    rows = np.full(len(keys), -1, dtype=np.int32)
+    # 只含一个点的网格保留原始行号，悬停时显示客户名
+    single_points = np.flatnonzero(count[inverse] == 1)
+    rows[inverse[single_points]] = single_points
+    return {
+        "lat": (np.bincount(inverse, weights=lat, minlength=len(keys)) / count).astype(np.float32),
+        "lon": (np.bincount(inverse, weights=lon, minlength=len(keys)) / count).astype(np.float32),
+        "count": count.astype(np.int32),
+        "category": labels[keys[:, 2]],
+        "rows": rows,
+    }
+
+def simplify_polyline(lat, lon, zoom, cell_pixels=CELL_PIXELS, max_vertices=None):
+    """
+    按缩放级别简化折线：连续落在同一网格内的顶点只保留第一个（首尾始终保留）
+    仍超过 max_vertices 时等间隔抽取顶点
+    返回保留顶点的下标
+    """
+    n = len(lat)
+    if n <= 2:
+        return np.arange(n)
+    x, y = _world_pixels(lat, lon, zoom)
+    cx = np.floor(x / cell_pixels).astype(np.int64)
+    cy = np.floor(y / cell_pixels).astype(np.int64)
+    changed = np.ones(n, dtype=bool)
+    changed[1:] = (cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1])
+    changed[-1] = True
+    keep = np.flatnonzero(changed)
+    if max_vertices is not None and len(keep) > max(max_vertices, 2):
+        keep = keep[np.unique(np.linspace(0, len(keep) - 1, max(max_vertices, 2)).round().astype(np.int64))]
+    return keep
+
+def routes_from_schedule(schedule_df, customers_df, agents_df=None):
+    """
+    从排程表（销售代表, "客户1 → 客户2 → ..."）还原 {销售代表id: [客户id, ...]}
+    没有 agents_df 时以销售代表姓名为键
+    """
+    customer_ids = dict(zip(customers_df["name"].tolist(), entity_ids(customers_df)))
+    agent_ids = {}
+    if agents_df is not None:
+        agent_ids = dict(zip(agents_df["name"].tolist(), entity_ids(agents_df)))
+    routes = {}
+    for agent, visits in zip(schedule_df["销售代表"], schedule_df["拜访客户"]):
+        names = [name.strip() for name in str(visits).split("→")]
+        routes[agent_ids.get(agent, agent)] = [customer_ids[name] for name in names if name in customer_ids]
+    return routes
+
+def _route_rows(routes, customers_df, agents_df=None):
+    """[(显示名, 销售代表行号或 None, 客户行号数组)]"""
+    customer_rows = {cid: row for row, cid in enumerate(entity_ids(customers_df))}
+    agent_rows, agent_names = {}, []
+    if agents_df is not None:
+        agent_rows = {aid: row for row, aid in enumerate(entity_ids(agents_df))}
+        agent_names = agents_df["name"].tolist()
+    result = []
+    for agent_id, route in routes.items():
+        agent_row = agent_rows.get(agent_id)
+        label = agent_names[agent_row] if agent_row is not None else str(agent_id)
+        rows = np.array([customer_rows[cid] for cid in route if cid in customer_rows], dtype=np.int64)
+        result.append((label, agent_row, rows))
+    return result
+
+def route_geometry(routes, customers_df, agents_df=None):
+    """
+    每位销售代表的路线折线（出发点 → 客户 → 返回点），以紧凑数组表示：
+    {"labels": [...], "offsets": int32[m+1], "lat": float32, "lon": float32, "rows": int32}
+    第 i 条路线的顶点为 offsets[i]:offsets[i+1]，rows 为客户行号，出发/返回点为 -1
+    """
+    customer_lat = customers_df["lat"].to_numpy(dtype=np.float64)
+    customer_lon = customers_df["lon"].to_numpy(dtype=np.float64)
+    columns = set(agents_df.columns) if agents_df is not None else set()
+    labels, offsets, lat, lon, rows = [], [0], [], [], []
+    for label, agent_row, route_rows in _route_rows(routes, customers_df, agents_df):
+        path_lat = [customer_lat[route_rows]]
+        path_lon = [customer_lon[route_rows]]
+        path_rows = [route_rows]
+        if agent_row is not None and {"start_lat", "start_lon"} <= columns:
+            end = ("end_lat", "end_lon") if {"end_lat", "end_lon"} <= columns else ("start_lat", "start_lon")
+            path_lat = [[agents_df["start_lat"].iat[agent_row]]] + path_lat + [[agents_df[end[0]].iat[agent_row]]]
+            path_lon = [[agents_df["start_lon"].iat[agent_row]]] + path_lon + [[agents_df[end[1]].iat[agent_row]]]
+            path_rows = [[-1]] + path_rows + [[-1]]
+        labels.append(label)
+        lat.append(np.concatenate(path_lat))
+        lon.append(np.concatenate(path_lon))
+        rows.append(np.concatenate(path_rows))
+        offsets.append(offsets[-1] + len(lat[-1]))
+    return {
+        "labels": labels,
+        "offsets": np.array(offsets, dtype=np.int32),
+        "lat": np.concatenate(lat).astype(np.float32) if lat else np.array([], dtype=np.float32),
+        "lon": np.concatenate(lon).astype(np.float32) if lon else np.array([], dtype=np.float32),
+        "rows": np.concatenate(rows).astype(np.int32) if rows else np.array([], dtype=np.int32),
+    }
+
+def _leg_minutes(lat, lon, speed_kmh):
+    """折线相邻顶点间的行驶分钟数（与 build_travel_matrices 相同的 Haversine 与取整）"""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return travel_minutes(haversine_meters(lat[:-1], lon[:-1], lat[1:], lon[1:]), speed_kmh)
+
+TIMELINE_COLUMNS = ["销售代表", "客户", "优先级", "到达", "开始", "结束", "超出时间窗"]
+
+def result_timeline(result, customers_df, max_agents=None):
+    """
+    由求解结果的时间维度生成时间线（从零点起的分钟数），不重新推算行驶时间：
+    开始为 cumul_min（最早开始服务时间），最晚开始为 cumul_max，结束为开始加服务时长
+    只取前 max_agents 条路线；周期排程的结果在销售代表前加日期
+    返回 DataFrame：销售代表, 客户, 优先级, 到达, 开始, 最晚开始, 结束, 超出时间窗
+    """
+    stops = result.stops()
+    if max_agents is not None:
+        stops = stops[stops["agent"] < max_agents]
+    rows = stops["customer"].to_numpy()
+    labels = np.asarray(result.agent_names, dtype=object)
+    day_labels = result.get("day_labels")
+    if day_labels is not None:
+        labels = np.char.add(np.char.add(np.asarray(day_labels, dtype=str), " "), labels.astype(str)).astype(object)
+    start = stops["cumul_min"].to_numpy(dtype=np.int64)
+    window_end = customers_df["time_window_end"].to_numpy(dtype=np.int64)[rows] * MINUTES_PER_HOUR
+    service = customers_df["service_time_minutes"].to_numpy(dtype=np.int64)[rows]
+    priority = (customers_df["priority"].astype(str).to_numpy()[rows] if "priority" in customers_df.columns
+                else np.full(len(rows), ""))
+    return pd.DataFrame({
+        "销售代表": labels[stops["agent"].to_numpy()],
+        "客户": customers_df["name"].to_numpy()[rows],
+        "优先级": priority,
+        # 时间维度的累计值包含等待，到达时间不单独记录，与开始相同
+        "到达": start,
+        "开始": start,
+        "最晚开始": stops["cumul_max"].to_numpy(dtype=np.int64),
+        "结束": start + service,
+        "超出时间窗": start > window_end,
+    })
+
+def route_timeline(routes, customers_df, agents_df=None, speed_kmh=DEFAULT_SPEED_KMH):
+    """
+    由 {销售代表id: [客户id, ...]} 推算时间线（没有求解结果、只有排程表时使用）
+    按路线顺序推算每次拜访的时间（从零点起的分钟数）：
+    出发时间使首个客户恰好在时间窗开始时到达，之后依次到达、等待时间窗开始、服务
+    返回 DataFrame：销售代表, 客户, 优先级, 到达, 开始, 结束, 超出时间窗
+    """
+    geometry = route_geometry(routes, customers_df, agents_df)
+    names = customers_df["name"].tolist()
+    priority = customers_df["priority"].astype(str).tolist() if "priority" in customers_df.columns else None
+    window_start, window_end = window_minutes(customers_df)
+    service = customers_df["service_time_minutes"].to_numpy(dtype=np.int64)
+
+    records = []
+    for i, label in enumerate(geometry["labels"]):
+        lo, hi = geometry["offsets"][i], geometry["offsets"][i + 1]
+        rows = geometry["rows"][lo:hi]
+        legs = _leg_minutes(geometry["lat"][lo:hi], geometry["lon"][lo:hi], speed_kmh)
+        stops = np.flatnonzero(rows >= 0)
+        if len(stops) == 0:
+            continue
+        # legs[j] 为顶点 j → j+1 的行驶时间，到达第 k 个顶点前累计 legs[:k]
+        first = stops[0]
+        clock = max(0, int(window_start[rows[first]]) - int(legs[:first].sum()))
+        previous = 0
+        for vertex in stops:
+            clock += int(legs[previous:vertex].sum())
+            row = rows[vertex]
+            start = max(clock, int(window_start[row]))
+            end = start + int(service[row])
+            records.append({
+                "销售代表": label,
+                "客户": names[row],
+                "优先级": priority[row] if priority is not None else "",
+                "到达": clock,
+                "开始": start,
+                "结束": end,
+                "超出时间窗": start > window_end[row],
+            })
+            clock = end
+            previous = vertex
+    return pd.DataFrame(records, columns=TIMELINE_COLUMNS)
+
+def _map_trace():
+    """plotly ≥ 5.24 使用 MapLibre 的 Scattermap，旧版本使用 Scattermapbox（均为 WebGL 渲染）"""
+    import plotly.graph_objects as go
+
+    if hasattr(go, "Scattermap"):
+        return go.Scattermap, "map"
+    return go.Scattermapbox, "mapbox"
+
+def _format_minutes(minutes):
+    minutes = np.asarray(minutes, dtype=np.int64)
+    return [f"{m // 60:02d}:{m % 60:02d}" for m in minutes.tolist()]
+
+def plot_map(customers_df, schedule_df=None, routes=None, agents_df=None, zoom=None,
+             max_points=MAX_MAP_POINTS, max_route_vertices=MAX_ROUTE_VERTICES, height=400):
     """
     绘制客户分布地图
-    如果提供了schedule_df，则绘制路径
-    """
-    # 基础客户点
-    fig = px.scatter_mapbox(
-        customers_df,
-        lat="lat",
-        lon="lon",
-        color="priority",
-        text="name",
-        zoom=10,
-        height=400,
-        title="客户分布与拜访计划"
-    )
-    
-    # 如果有调度结果，绘制路径
-    if schedule_df is not None:
-        # 这里可以添加路径绘制逻辑
-        # 为了简化，我们只添加一个示例路径
-        pass
-    
-    fig.update_layout(mapbox_style="open-street-map")
-    fig.update_layout(margin={"r":0,"t":25,"l":0,"b":0})
+    提供 routes（求解结果中的 {销售代表id: [客户id, ...]}）或 schedule_df 时绘制每位销售代表的路线
+    客户点超过 max_points 时按缩放级别在服务端聚合，路线按同一网格简化（合计不超过 max_route_vertices 个顶点），
+    坐标以 float32 数组传给 plotly（新版本序列化为二进制类型数组），数据量与客户数无关
+    """
+    import plotly.graph_objects as go
+
+    trace_cls, map_key = _map_trace()
+    lat = customers_df["lat"].to_numpy(dtype=np.float64)
+    lon = customers_df["lon"].to_numpy(dtype=np.float64)
+    if zoom is None:
+        zoom = fit_zoom(lat, lon, height=height)
+    if routes is None and schedule_df is not None:
+        routes = routes_from_schedule(schedule_df, customers_df, agents_df)
+
+    fig = go.Figure()
+    if routes:
+        geometry = route_geometry(routes, customers_df, agents_df)
+        n_routes = len(geometry["labels"])
+        per_route = max_route_vertices // max(1, n_routes)
+        # 颜色序号 -> [(名称, 保留的顶点下标)]
+        groups = {}
+        for i, label in enumerate(geometry["labels"]):
+            lo, hi = geometry["offsets"][i], geometry["offsets"][i + 1]
+            if hi - lo < 2:
+                continue
+            keep = simplify_polyline(geometry["lat"][lo:hi], geometry["lon"][lo:hi], zoom,
+                                     max_vertices=per_route) + lo
+            groups.setdefault(i % len(ROUTE_COLORS) if n_routes > MAX_ROUTE_TRACES else i, []).append((label, keep))
+        for key, members in groups.items():
+            if len(members) == 1:
+                name, keep = members[0]
+                route_lat, route_lon = geometry["lat"][keep], geometry["lon"][keep]
+            else:
+                # 同色路线之间以 NaN 断开，合并为一个 trace
+                name = f"路线（{len(members)} 条）"
+                route_lat = np.concatenate([np.append(geometry["lat"][keep], np.nan) for _, keep in members])
+                route_lon = np.concatenate([np.append(geometry["lon"][keep], np.nan) for _, keep in members])
+            fig.add_trace(trace_cls(
+                lat=route_lat.astype(np.float32), lon=route_lon.astype(np.float32), mode="lines", name=name,
+                line={"width": 2, "color": ROUTE_COLORS[key % len(ROUTE_COLORS)]}, hoverinfo="name",
+            ))
+
+    categories = customers_df["priority"].astype(str) if "priority" in customers_df.columns else None
+    points = decimate_points(lat, lon, zoom, categories, max_points=max_points)
+    names = customers_df["name"].astype(str).to_numpy()
+    hover = np.where(points["rows"] >= 0, names[np.maximum(points["rows"], 0)],
+                     np.char.add(points["count"].astype(str), " 个客户"))
+    for category in pd.unique(points["category"]):
+        mask = points["category"] == category
+        fig.add_trace(trace_cls(
+            lat=points["lat"][mask], lon=points["lon"][mask], mode="markers",
+            name=f"{category}类客户" if category is not None else "客户",
+            marker={
+                "size": np.clip(6 + 2 * np.log2(points["count"][mask]), 6, 24).astype(np.float32),
+                "color": PRIORITY_COLORS.get(category, "#7f7f7f"),
+            },
+            hovertext=hover[mask], hoverinfo="text",
+        ))
+
+    fig.update_layout(**{map_key: {
+        "style": "open-street-map",
+        "zoom": zoom,
+        "center": {"lat": float(np.mean(lat)) if len(lat) else 0.0,
+                   "lon": float(np.mean(lon)) if len(lon) else 0.0},
+    }})
+    fig.update_layout(title="客户分布与拜访计划", height=height, margin={"r": 0, "t": 25, "l": 0, "b": 0})
     return fig
 
-def plot_schedule_timeline(schedule_df, customers_df):
+def _timeline_hover(timeline):
+    """横条的悬停文字：客户 开始-结束，有求解器时间范围时附上最晚开始时间"""
+    text = [f"{name} {start}-{end}" for name, start, end in
+            zip(timeline["客户"], _format_minutes(timeline["开始"]), _format_minutes(timeline["结束"]))]
+    if "最晚开始" in timeline.columns:
+        text = [f"{t}（最晚 {latest} 开始）" for t, latest in zip(text, _format_minutes(timeline["最晚开始"]))]
+    return text
+
+def plot_schedule_timeline(schedule_df, customers_df, routes=None, agents_df=None,
+                           max_agents=MAX_TIMELINE_AGENTS, result=None):
     """
-    绘制调度时间线
+    绘制调度时间线：每位销售代表一行，每次拜访一个横条（服务开始到结束），颜色表示优先级
+    同一优先级的所有横条放在一个 trace 中；销售代表超过 max_agents 时只显示前 max_agents 位
+    提供 result（SolveResult）时直接使用求解器的开始时间（result_timeline）；
+    否则由 routes 或 schedule_df 重新推算（route_timeline）
     """
-    # 这个函数可以用来绘制每个销售代表的时间安排
-    # 当前版本先返回一个简单的占位图
+    import plotly.graph_objects as go
+
+    title = "调度时间线"
+    if isinstance(result, SolveResult):
+        n_routes = len(result.agent_names)
+        timeline = result_timeline(result, customers_df, max_agents=max_agents)
+    else:
+        if routes is None:
+            routes = routes_from_schedule(schedule_df, customers_df, agents_df)
+        n_routes = len(routes)
+        routes = dict(list(routes.items())[:max_agents])
+        timeline = route_timeline(routes, customers_df, agents_df)
+    if n_routes > max_agents:
+        title += f"（前 {max_agents} 位销售代表）"
+
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=[0, 1, 2], y=[0, 1, 2], mode='lines+markers'))
-    fig.update_layout(title="调度时间线 (占位图)")
-    return fig
\ No newline at end of file
+    for priority, group in timeline.groupby("优先级", sort=True):
+        fig.add_trace(go.Bar(
+            y=group["销售代表"].to_numpy(),
+            x=(group["结束"] - group["开始"]).to_numpy(dtype=np.int32),
+            base=group["开始"].to_numpy(dtype=np.int32),
+            orientation="h",
+            name=f"{priority}类客户" if priority else "拜访",
+            marker={"color": PRIORITY_COLORS.get(priority, "#7f7f7f"),
+                    "line": {"width": np.where(group["超出时间窗"], 2, 0).astype(np.float32), "color": "#000"}},
+            hovertext=_timeline_hover(group),
+            hoverinfo="text",
+        ))
+
+    if len(timeline):
+        ticks = np.arange(timeline["开始"].min() // 60 * 60, timeline["结束"].max() + 60, 60)
+    else:
+        ticks = np.arange(8 * 60, 18 * 60 + 1, 60)
+    fig.update_layout(
+        title=title,
+        barmode="overlay",
+        xaxis={"title": "时间", "tickvals": ticks.tolist(), "ticktext": _format_minutes(ticks)},
+        yaxis={"autorange": "reversed"},
+        height=max(250, 40 * timeline["销售代表"].nunique() + 100),
+        margin={"r": 0, "t": 30, "l": 0, "b": 0},
+    )
+    return fig
@@ -0,0 +1,30 @@
+# conftest.py
+import hashlib
+import numpy as np
+import pytest
+from topprism_chatopt.rag_retriever import TopprismRAG
+
+class StubModel:
+    """用于测试的确定性编码器，统计编码次数"""
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, sentences):
+        self.encoded += len(sentences)
+        vectors = []
+        for s in sentences:
+            digest = hashlib.sha256(s.encode('utf-8')).digest()
+            vectors.append(np.frombuffer(digest, dtype=np.uint8)[:16].astype(np.float32) / 255.0)
+        return np.array(vectors, dtype=np.float32)
+
+@pytest.fixture
+def stub_model(monkeypatch):
+    """返回一个函数：调用后 TopprismRAG 使用新的 StubModel，不加载真实句向量模型"""
+    def patch():
+        model = StubModel()
+
+        def _load_model(self):
+            self.model = model
+        monkeypatch.setattr(TopprismRAG, "_load_model", _load_model)
+        return model
+    return patch
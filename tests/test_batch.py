@@ -0,0 +1,115 @@
+# test_batch.py
+import json
+import os
+import shutil
+import threading
+import urllib.error
+import urllib.request
+from topprism_chatopt.batch import Scenario, load_scenarios, main, run_batch
+from topprism_chatopt.jobs import JobManager
+from topprism_chatopt.resources import DATA_DIR
+from topprism_chatopt import server as server_module
+from topprism_chatopt.server import create_server
+from topprism_chatopt.solve_cache import SolveCache
+from topprism_chatopt.solve_result import SolveResult
+
+RULES = ["每个销售每天最多拜访4个客户", "A类客户优先安排"]
+
+def _make_scenarios(root):
+    for name in ("north", "south"):
+        directory = root / name
+        directory.mkdir(parents=True)
+        shutil.copy(os.path.join(DATA_DIR, "customers.csv"), directory / "customers.csv")
+        shutil.copy(os.path.join(DATA_DIR, "agents.csv"), directory / "agents.csv")
+        (directory / "rules.txt").write_text("\n".join(RULES), encoding="utf-8")
+
+def test_batch_run(tmp_path):
+    """测试批量求解目录与清单"""
+    print("=== 测试批量求解 ===")
+    _make_scenarios(tmp_path / "scenarios")
+    scenarios = load_scenarios(str(tmp_path / "scenarios"))
+    assert [s.name for s in scenarios] == ["north", "south"]
+    assert scenarios[0].rules == RULES
+
+    summary = run_batch(scenarios, str(tmp_path / "out"), max_workers=2,
+                        search_options={"time_limit_seconds": 1})
+    print(summary)
+    assert [item["status"] for item in summary] == ["solved", "solved"]
+    with open(tmp_path / "out" / "north" / "result.json", encoding="utf-8") as f:
+        result = json.load(f)
+    assert result["solved"] and result["routes"]
+    assert len(result["route_offsets"]) == 4 and result["solver_status"]
+    assert os.path.exists(tmp_path / "out" / "south" / "schedule.csv")
+    loaded = SolveResult.load(str(tmp_path / "out" / "north" / "result.npz"))
+    assert loaded["route_nodes"].tolist() == result["route_nodes"]
+
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text(json.dumps({
+        "name": "manifest", "customers": "scenarios/north/customers.csv",
+        "agents": "scenarios/north/agents.csv", "rules": RULES[:1],
+        "search_options": {"time_limit_seconds": 1},
+    }, ensure_ascii=False), encoding="utf-8")
+    assert main(["run", str(manifest), "--out", str(tmp_path / "out2"), "--workers", "1"]) == 0
+
+    # 场景名不能把输出写到输出目录之外
+    escaping = Scenario("../escape", *[os.path.join(tmp_path, "scenarios", "north", name)
+                                       for name in ("customers.csv", "agents.csv")], RULES[:1])
+    summary = run_batch([escaping], str(tmp_path / "out3"), max_workers=1,
+                        search_options={"time_limit_seconds": 1})
+    assert summary[0]["status"] == "error"
+    assert not os.path.exists(tmp_path / "escape")
+
+def _post_json(url, data):
+    """POST JSON，返回 (状态码, 响应)；错误状态码同样返回"""
+    request = urllib.request.Request(url, data=json.dumps(data).encode("utf-8"), method="POST",
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def test_http_service(tmp_path, monkeypatch):
+    """测试本地 HTTP 服务"""
+    jobs = JobManager(max_workers=1, cache=SolveCache())
+    _make_scenarios(tmp_path / "scenarios")
+    server = create_server(port=0, jobs=jobs, data_root=str(tmp_path / "scenarios"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        body = json.dumps({"rules": RULES, "search_options": {"time_limit_seconds": 1}, "wait": True}).encode("utf-8")
+        request = urllib.request.Request(base_url + "/jobs", data=body, method="POST",
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            job = json.loads(response.read())
+        assert job["status"] == "done"
+        assert job["result"]["solved"]
+
+        with urllib.request.urlopen(f"{base_url}/jobs/{job['id']}") as response:
+            assert json.loads(response.read())["result"]["objective"] == job["result"]["objective"]
+        with urllib.request.urlopen(base_url + "/health") as response:
+            assert json.loads(response.read())["status"] == "ok"
+
+        # 数据路径限制在 data_root 之内
+        status, data = _post_json(base_url + "/jobs", {
+            "rules": RULES, "customers_path": "north/customers.csv", "agents_path": "north/agents.csv",
+            "search_options": {"time_limit_seconds": 1}, "wait": True,
+        })
+        assert status == 200 and data["result"]["solved"]
+        for path in ("../secret.csv", str(tmp_path / "scenarios" / ".." / "customers.csv"), "/etc/passwd"):
+            status, data = _post_json(base_url + "/jobs", {"customers_path": path})
+            print(data)
+            assert status == 403
+
+        # 请求错误返回 400，建模失败返回 500，连接都不会被中断
+        assert _post_json(base_url + "/jobs", {"rules": RULES, "wait": True, "timeout": "abc"})[0] == 400
+        assert _post_json(base_url + "/jobs", ["not", "an", "object"])[0] == 400
+
+        def broken_prepare(*args, **kwargs):
+            raise RuntimeError("检索失败")
+        monkeypatch.setattr(server_module, "prepare_model", broken_prepare)
+        status, data = _post_json(base_url + "/jobs", {"rules": RULES})
+        assert status == 500 and "检索失败" in data["error"]
+    finally:
+        server.shutdown()
+        jobs.shutdown()
@@ -0,0 +1,63 @@
+# test_benchmark.py
+import json
+from topprism_chatopt.batch import main
+from topprism_chatopt.benchmark import (STUB_CODE, StubLLMServer, bench_generation, bench_solve, compare_to_baseline,
+                                        load_baseline, save_baseline, synthetic_instance, synthetic_rules)
+from topprism_chatopt.data_loader import validate_table
+from topprism_chatopt.llm_generator import AsyncLLMService, ResponseCache
+
+def test_synthetic_data_reproducible():
+    """测试合成实例与规则语料可复现且符合数据规范"""
+    customers, agents = synthetic_instance(120, seed=3)
+    again, _ = synthetic_instance(120, seed=3)
+    assert customers.equals(again)
+    assert len(agents) == 10
+    # 总拜访上限留有余量
+    assert agents["max_visits_per_day"].sum() >= len(customers)
+    assert (customers["time_window_end"] > customers["time_window_start"]).all()
+    validate_table(customers, "customers", "synthetic")
+    validate_table(agents, "agents", "synthetic")
+    assert synthetic_rules(20, seed=1) == synthetic_rules(20, seed=1)
+
+def test_stub_llm_and_stages():
+    """测试本地模型替身与各阶段基准指标"""
+    print("=== 测试性能基准 ===")
+    with StubLLMServer(first_token_seconds=0.01, token_seconds=0) as stub:
+        service = AsyncLLMService(base_url=stub.base_url, model="stub", cache=ResponseCache())
+        try:
+            assert service.complete([{"role": "user", "content": "规则"}]) == STUB_CODE
+        finally:
+            service.close()
+        assert stub.requests == 1
+
+    generation = bench_generation(n_requests=3, first_token_seconds=0.01, token_seconds=0)
+    llm = generation[-1]
+    print(generation)
+    assert llm["llm_requests"] == 3 and llm["fallbacks"] == 0
+    assert llm["spans"]["llm.stream"] > 0
+
+    solve = bench_solve(30, time_limit_seconds=1)[0]
+    print(solve)
+    assert solve["solved"] and solve["objective"] > 0
+    assert solve["peak_rss_mb"] > 0
+    assert solve["routes_per_second"] > 0
+
+def test_baseline_comparison(tmp_path):
+    """测试与基线比较：变慢或目标值变差超过容忍幅度时报告回归"""
+    baseline_path = str(tmp_path / "baseline.json")
+    results = [{"case": "solve/n50", "wall_seconds": 1.0, "peak_rss_mb": 100.0, "objective": 1000, "solved": True}]
+    save_baseline(results, baseline_path)
+    baseline = load_baseline(baseline_path)
+    assert compare_to_baseline(results, baseline) == []
+
+    slower = [dict(results[0], wall_seconds=1.5, objective=1010)]
+    regressions = compare_to_baseline(slower, baseline)
+    assert [item["metric"] for item in regressions] == ["wall_seconds"]
+    assert compare_to_baseline(slower, baseline, tolerances={"wall_seconds": 1.0}) == []
+
+    # 命令行：第一次写入基线，之后按基线比较
+    bench_baseline = str(tmp_path / "bench.json")
+    args = ["bench", "--stages", "solve", "--sizes", "20", "--time-limit", "1", "--baseline", bench_baseline]
+    assert main(args) == 0
+    with open(bench_baseline, encoding="utf-8") as f:
+        assert "solve/n20-m2" in json.load(f)["cases"]
@@ -0,0 +1,44 @@
+# test_constraint_store.py
+import pytest
+from topprism_chatopt.constraint_store import ConstraintCodeError, ConstraintStore
+from topprism_chatopt.llm_generator import generate_model_code_with_knowledge
+from topprism_chatopt.rag_retriever import TopprismRAG
+
+def test_generated_code_compiles(tmp_path, stub_model):
+    """测试知识库生成的代码通过校验并记录使用的 API"""
+    rules = ["每个销售每天最多拜访4个客户", "医院客户必须在9-12点拜访", "A类客户优先安排"]
+    stub_model()
+    retriever = TopprismRAG(cache_dir=str(tmp_path))
+    matches = [m[0] for m in retriever.retrieve_many(rules, k=1)]
+    code = generate_model_code_with_knowledge(rules, matches)
+
+    store = ConstraintStore()
+    artifact = store.get(code)
+    print(sorted(artifact.apis))
+    assert "routing.AddConstantDimension" in artifact.apis
+    assert store.get(code) is artifact
+    assert store.stats()["hits"] == 1 and store.stats()["misses"] == 1
+
+def test_rejects_broken_code():
+    """测试有问题的代码在建模前被拒绝"""
+    store = ConstraintStore()
+    broken = [
+        "routing.AddConstantDimension(1, 4, True,",  # 语法错误
+        "import os\nos.remove('x')",  # 不允许的导入
+        "routing.AddMagicConstraint(1)",  # 不存在的 OR-Tools 方法
+        "routing.AddDisjunction([idx], 1000)",  # 未定义的名字
+        "eval('1')",
+        "routing.__class__",
+        "f = __import__\nf('os')",  # 危险名字赋给别的变量
+        "g = getattr(__builtins__, 'open')",
+        "getattr(routing, '__class__')",
+        "x = [eval][0]",
+    ]
+    for code in broken:
+        with pytest.raises(ConstraintCodeError):
+            store.get(code)
+    # 校验失败的结果同样被缓存
+    with pytest.raises(ConstraintCodeError):
+        store.get(broken[0])
+    assert store.stats()["rejected"] == len(broken)
+    assert store.stats()["hits"] == 1
@@ -0,0 +1,81 @@
+# test_data_loader.py
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from topprism_chatopt.data_loader import (
+    SchemaError,
+    load_agents,
+    load_customers,
+    snapshot_dir,
+)
+from topprism_chatopt.resources import DATA_DIR
+
+def _is_memory_mapped(array):
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+def test_typed_snapshot(tmp_path):
+    """测试列类型、快照与修改时间失效"""
+    print("=== 测试数据快照 ===")
+    path = tmp_path / "customers.csv"
+    shutil.copy(os.path.join(DATA_DIR, "customers.csv"), path)
+    cache_dir = tmp_path / "cache"
+
+    customers = load_customers(path, cache_dir=cache_dir, chunksize=2)
+    print(customers.dtypes)
+    assert customers["lat"].dtype == np.float32
+    assert isinstance(customers["priority"].dtype, pd.CategoricalDtype)
+    assert customers["time_window_start"].dtype == np.int16
+    assert os.path.exists(os.path.join(snapshot_dir(path, cache_dir), "meta.json"))
+
+    # 第二次从内存映射快照读取，内容一致
+    cached = load_customers(path, cache_dir=cache_dir)
+    pd.testing.assert_frame_equal(customers, cached)
+    # 不筛选时数值列保持内存映射，不复制到内存
+    assert _is_memory_mapped(cached["lat"].to_numpy())
+    assert _is_memory_mapped(cached["time_window_start"].to_numpy())
+
+    # 源文件修改后快照失效
+    df = pd.read_csv(path)
+    df.loc[0, "name"] = "医院AA"
+    df.to_csv(path, index=False)
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10**9))
+    assert load_customers(path, cache_dir=cache_dir)["name"][0] == "医院AA"
+
+    agents = load_agents(os.path.join(DATA_DIR, "agents.csv"), cache_dir=cache_dir)
+    assert agents["max_visits_per_day"].dtype == np.int32
+
+def test_region_filter(tmp_path):
+    """测试按区域分块筛选"""
+    path = tmp_path / "customers.csv"
+    df = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    df["region"] = np.where(df["id"] % 2 == 1, "东城", "西城")
+    df.to_csv(path, index=False)
+    bbox = (39.90, 116.40, 39.915, 116.415)
+    expected = df[(df["lat"] >= 39.90) & (df["lat"] <= 39.915) & (df["lon"] >= 116.40) & (df["lon"] <= 116.415)]
+
+    for use_snapshot in (False, True, True):
+        filtered = load_customers(path, bbox=bbox, cache_dir=tmp_path / "cache",
+                                  use_snapshot=use_snapshot, chunksize=2)
+        assert filtered["id"].tolist() == expected["id"].tolist()
+        by_region = load_customers(path, regions=["东城"], cache_dir=tmp_path / "cache",
+                                   use_snapshot=use_snapshot, chunksize=2)
+        assert by_region["id"].tolist() == df[df["region"] == "东城"]["id"].tolist()
+
+def test_schema_errors(tmp_path):
+    """测试缺列与无效取值"""
+    path = tmp_path / "customers.csv"
+    df = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    df.drop(columns=["lat"]).to_csv(path, index=False)
+    with pytest.raises(SchemaError, match="lat"):
+        load_customers(path, use_snapshot=False)
+
+    df.loc[1, "priority"] = "Z"
+    df.to_csv(path, index=False)
+    with pytest.raises(SchemaError, match="priority"):
+        load_customers(path, use_snapshot=False)
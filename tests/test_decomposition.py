@@ -0,0 +1,72 @@
+# test_decomposition.py
+import numpy as np
+import pandas as pd
+from topprism_chatopt.benchmark import synthetic_instance
+from topprism_chatopt.decomposition import _merge_results, assign_agents_to_clusters, kmeans, solve_decomposed
+from topprism_chatopt.or_solver import solve_visit_scheduling
+from topprism_chatopt.solve_result import SolveResult
+
+def test_kmeans_and_assignment():
+    """测试聚类与按容量分配代表"""
+    points = np.array([[0.0, 0.0], [0.0, 0.1], [5.0, 5.0], [5.0, 5.1], [5.1, 5.0]])
+    labels, centers = kmeans(points, 2)
+    assert labels[0] == labels[1] and labels[2] == labels[3] == labels[4]
+    assert labels[0] != labels[2]
+
+    agents = pd.DataFrame({"max_visits_per_day": [4, 4, 4]})
+    groups = assign_agents_to_clusters(np.bincount(labels), centers, agents)
+    assert sorted(a for g in groups for a in g) == [0, 1, 2]
+    # 客户多的簇分到更多代表
+    assert len(groups[labels[2]]) == 2
+
+def test_solve_decomposed():
+    """测试分解求解输出与单一模型结构一致"""
+    print("=== 测试分解求解 ===")
+    customers, agents = synthetic_instance(60, 6)
+    result = solve_decomposed(customers, agents, ["每个销售每天最多拜访16个客户"], "", cluster_size=20,
+                              search_options={"time_limit_seconds": 1, "log_search": False}, max_workers=3)
+    print(result["schedule"])
+    assert result["solved"]
+    assert list(result["schedule"].columns) == ["销售代表", "拜访客户"]
+    assert result["schedule"]["销售代表"].tolist() == agents["name"].tolist()
+    assert len(set(result["clusters"])) == 3
+
+    # 结构化数组中的行号为完整客户表的行号
+    assert isinstance(result, SolveResult)
+    stops = result.stops()
+    visited = sorted(stops["customer"].tolist() + result["dropped"].tolist())
+    assert visited == list(range(len(customers)))
+    routes = {aid: customers["id"].iloc[result.route(v)].tolist() for v, aid in enumerate(agents["id"])}
+    assert routes == result["routes"]
+    assert (result["start_nodes"] == len(customers) + np.arange(len(agents))).all()
+    assert result["solver_status"] and result["trajectory"][-1][1] == result["objective"]
+
+
+def test_merge_results_remaps_rows():
+    """测试各簇结果拼接时行号映射回完整问题，失败簇的客户计入 dropped"""
+    customers, agents = synthetic_instance(24, 4)
+    labels = np.arange(len(customers)) % 2
+    groups = [[0, 2], [1, 3]]
+    results = {}
+    for c in range(2):
+        results[c] = solve_visit_scheduling(customers.iloc[np.flatnonzero(labels == c)].reset_index(drop=True),
+                                            agents.iloc[groups[c]].reset_index(drop=True), [], "",
+                                            search_options={"time_limit_seconds": 1}, use_cache=False)
+        assert results[c]["solved"]
+    merged = _merge_results(results, groups, customers, agents, labels)
+    assert merged["solved"] and merged["objective"] == results[0]["objective"] + results[1]["objective"]
+    for c in range(2):
+        members = np.flatnonzero(labels == c)
+        for v, agent in enumerate(groups[c]):
+            assert merged.route(agent).tolist() == members[results[c].route(v)].tolist()
+            assert merged["routes"][agents["id"].iloc[agent]] == results[c]["routes"][agents["id"].iloc[agent]]
+
+    # 第 1 簇求解失败：其余路线保留，失败簇的客户计入 dropped
+    results[1] = results[1].copy(solved=False, objective=None)
+    merged = _merge_results(results, groups, customers, agents, labels)
+    print(merged["schedule"])
+    assert not merged["solved"]
+    assert merged["failed_vehicles"] == groups[1]
+    assert merged["dropped"].tolist() == np.flatnonzero(labels == 1).tolist()
+    assert merged["schedule"]["拜访客户"].iloc[groups[1]].eq("求解失败").all()
+    assert merged.route(groups[0][0]).tolist() == np.flatnonzero(labels == 0)[results[0].route(0)].tolist()
@@ -0,0 +1,68 @@
+# test_horizon.py
+import numpy as np
+from topprism_chatopt.benchmark import synthetic_instance
+from topprism_chatopt.horizon import assign_days, day_patterns, plan_horizon
+
+def test_assign_days():
+    """测试按拜访次数与可用日期分配客户"""
+    assert day_patterns(2, 5) == [(0, 2), (1, 3), (2, 4), (0, 3), (1, 4)]
+
+    customers, agents = synthetic_instance(40, 3)
+    customers["visit_frequency"] = np.where(np.arange(40) < 10, 2, 1)
+    customers["available_days"] = ""
+    customers.loc[5, "available_days"] = "1,3"
+    assignment = assign_days(customers, agents, n_days=5)
+
+    assert all(len(assignment[cid]) == f for cid, f in zip(customers["id"], customers["visit_frequency"]))
+    assert assignment[customers.loc[5, "id"]] == [1, 3]
+    load = np.bincount([day for days in assignment.values() for day in days], minlength=5)
+    assert load.max() - load.min() <= 1
+
+    # 滚动：保留原有客户的日期
+    rolled = assign_days(customers.iloc[1:], agents, n_days=5, previous_assignment=assignment)
+    assert all(rolled[cid] == assignment[cid] for cid in customers["id"].iloc[1:])
+
+def test_plan_horizon_rolling():
+    """测试周期排程与滚动重排"""
+    print("=== 测试周期排程 ===")
+    customers, agents = synthetic_instance(30, 3)
+    agents["max_visits_per_day"] = 6
+    options = {"time_limit_seconds": 1}
+
+    plan = plan_horizon(customers, agents, [], n_days=5, search_options=options, max_workers=2)
+    print(plan["schedule"])
+    assert plan["solved"]
+    assert plan["reoptimized_days"] == [0, 1, 2, 3, 4]
+    visited = sorted(c for day in plan["days"] for route in day["routes"].values() for c in route)
+    assert visited == customers["id"].tolist()
+    # 各天路线拼接为一个结构化结果，行号为完整客户表的行号
+    assert len(plan["dropped"]) == 0
+    assert sorted(plan.stops()["customer"].tolist()) == list(range(len(customers)))
+    assert plan["schedule"]["日期"].tolist() == [day for day in ["周一", "周二", "周三", "周四", "周五"]
+                                                for _ in range(len(agents))]
+    assert sorted(c for route in plan["routes"].values() for c in route) == customers["id"].tolist()
+
+    # 删除一个客户后只重排该客户所在的日期
+    removed = customers["id"].iloc[0]
+    rolled = plan_horizon(customers.iloc[1:], agents, [], n_days=5, search_options=options,
+                          max_workers=2, previous_plan=plan)
+    assert rolled["solved"]
+    assert rolled["reoptimized_days"] == plan["assignment"][removed]
+    for day in set(range(5)) - set(rolled["reoptimized_days"]):
+        assert rolled["days"][day]["routes"] == plan["days"][day]["routes"]
+
+    # 指定日期强制重排
+    forced = plan_horizon(customers.iloc[1:], agents, [], n_days=5, search_options=options,
+                          max_workers=1, previous_plan=rolled, changed_days=[4])
+    assert forced["reoptimized_days"] == [4]
+
+def test_plan_horizon_empty_day():
+    """测试没有客户的日期与部分日期的 dropped"""
+    customers, agents = synthetic_instance(6, 2)
+    customers["available_days"] = "0"
+    plan = plan_horizon(customers, agents, [], n_days=2, search_options={"time_limit_seconds": 1}, max_workers=1)
+    print(plan["schedule"])
+    assert plan["solved"]
+    assert plan["days"][1]["stop_reason"] == "empty"
+    assert plan["schedule"]["拜访客户"].tolist()[2:] == ["无", "无"]
+    assert plan["route_offsets"][-1] == len(customers) - len(plan["dropped"])
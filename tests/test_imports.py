@@ -0,0 +1,54 @@
+# test_imports.py
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+HEAVY_MODULES = ["faiss", "sentence_transformers", "openai", "plotly"]
+# 导入全部命令行/求解模块的时间上限（秒），包含 pandas 与 ortools
+IMPORT_BUDGET_SECONDS = 3.0
+
+SCRIPT = """
+import json, sys, time
+sys.modules["sentence_transformers"] = None  # 模拟模型不可用，检索走正则路径
+start = time.perf_counter()
+import topprism_chatopt.batch, topprism_chatopt.jobs, topprism_chatopt.server, topprism_chatopt.utils
+import_seconds = time.perf_counter() - start
+
+from topprism_chatopt.batch import prepare_model
+from topprism_chatopt.or_solver import solve_visit_scheduling
+from topprism_chatopt.rag_retriever import TopprismRAG
+from topprism_chatopt.resources import load_datasets
+
+customers, agents = load_datasets()
+rules = ["每个销售每天最多拜访4个客户", "A类客户优先安排"]
+matches, code = prepare_model(rules, customers, agents, retriever=TopprismRAG(cache_dir=sys.argv[1]))
+result = solve_visit_scheduling(customers, agents, rules, code,
+                                search_options={"time_limit_seconds": 1}, use_cache=False)
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "solved": result["solved"],
+    "loaded": [name for name in sys.argv[2:] if sys.modules.get(name) is not None],
+}))
+"""
+
+def test_lazy_heavy_imports(tmp_path):
+    """测试正则检索与求解路径不加载 faiss、sentence_transformers、openai、plotly，且导入时间在预算内"""
+    env = dict(os.environ, PYTHONPATH=SRC_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT, str(tmp_path)] + HEAVY_MODULES,
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    report = json.loads(output.strip().splitlines()[-1])
+    print(report)
+    assert report["solved"]
+    assert report["loaded"] == []
+    assert report["import_seconds"] < IMPORT_BUDGET_SECONDS
+
+def test_utils_without_ortools():
+    """测试可视化模块导入时不加载 ortools"""
+    env = dict(os.environ, PYTHONPATH=SRC_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    script = "import sys, topprism_chatopt.utils; print('ortools' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "False"
@@ -0,0 +1,84 @@
+# test_jobs.py
+import time
+import pytest
+from topprism_chatopt.benchmark import synthetic_instance
+from topprism_chatopt.jobs import CANCELLED, DONE, JobManager, JobQueueFull
+from topprism_chatopt.solve_cache import SolveCache
+
+def test_job_progress_and_cache():
+    """测试后台求解任务的进度发布、请求合并与缓存"""
+    print("=== 测试后台求解任务 ===")
+    customers, agents = synthetic_instance(40, 3)
+    manager = JobManager(max_workers=2, max_queue=2, cache=SolveCache())
+    try:
+        options = {"time_limit_seconds": 2, "stall_seconds": None}
+        job_id = manager.submit(customers, agents, [], "", search_options=options)
+        # 相同的任务在进行中时复用
+        assert manager.submit(customers, agents, [], "", search_options=options) == job_id
+
+        job = manager.get(job_id)
+        assert job.wait(timeout=60)
+        snapshot = manager.status(job_id)
+        print(snapshot["progress"])
+        assert snapshot["status"] == DONE
+        assert snapshot["result"]["solved"]
+        assert snapshot["progress"]
+        assert snapshot["best_objective"] == snapshot["result"]["objective"]
+
+        # 完成后再次提交直接命中缓存
+        cached_id = manager.submit(customers, agents, [], "", search_options=options)
+        assert cached_id != job_id
+        assert manager.status(cached_id)["result"]["from_cache"]
+        assert manager.stats()["deduplicated"] == 1
+    finally:
+        manager.shutdown()
+
+def test_job_cancel_and_backpressure():
+    """测试任务取消与排队上限"""
+    customers, agents = synthetic_instance(45)
+    manager = JobManager(max_workers=1, max_queue=1, cache=SolveCache())
+    try:
+        options = {"time_limit_seconds": 30, "stall_seconds": None}
+        running = manager.submit(customers, agents, [], "", search_options=options)
+        queued = manager.submit(customers, agents, ["另一条规则"], "", search_options=options)
+        with pytest.raises(JobQueueFull):
+            manager.submit(customers, agents, ["第三条规则"], "", search_options=options)
+
+        # 等待第一个任务找到可行解后取消
+        deadline = time.time() + 30
+        while manager.status(running)["best_objective"] is None and time.time() < deadline:
+            time.sleep(0.1)
+        start = time.time()
+        assert manager.cancel(running)
+        assert manager.cancel(queued)
+        assert manager.get(running).wait(timeout=20)
+        assert manager.get(queued).wait(timeout=20)
+        assert time.time() - start < 20
+
+        snapshot = manager.status(running)
+        assert snapshot["status"] == CANCELLED
+        # 取消后保留已找到的最好结果
+        assert snapshot["best_routes"] is not None
+        assert manager.status(queued)["status"] == CANCELLED
+        assert manager.pending() == 0
+    finally:
+        manager.shutdown()
+
+def test_decomposed_job():
+    """测试分解求解同样通过后台任务执行"""
+    customers, agents = synthetic_instance(60, 6)
+    manager = JobManager(max_workers=1, cache=SolveCache())
+    try:
+        options = {"time_limit_seconds": 1}
+        job_id = manager.submit(customers, agents, [], "", search_options=options, cluster_size=20)
+        # 分解求解与单一模型的任务指纹不同
+        assert manager.submit(customers, agents, [], "", search_options=options) != job_id
+        assert manager.get(job_id).wait(timeout=60)
+        snapshot = manager.status(job_id)
+        assert snapshot["status"] == DONE
+        assert snapshot["result"]["solved"]
+        assert len(set(snapshot["result"]["clusters"])) == 3
+        assert manager.status(manager.submit(customers, agents, [], "", search_options=options,
+                                             cluster_size=20))["result"]["from_cache"]
+    finally:
+        manager.shutdown()
@@ -0,0 +1,109 @@
+# test_llm_generator.py
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from topprism_chatopt.llm_generator import (
+    AsyncLLMService,
+    ResponseCache,
+    agenerate_model_code,
+    generate_model_code,
+)
+
+STUB_CODE = ["routing.AddConstantDimension(", "1, 4, True, ", "'VisitCount')"]
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """模拟 LM Studio 的 /v1/chat/completions 流式接口"""
+    requests = 0
+    delay = 0.0
+
+    def do_POST(self):
+        type(self).requests += 1
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length))
+        assert body["stream"] is True
+        time.sleep(self.delay)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for token in STUB_CODE:
+            chunk = {
+                "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+def _start_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLLMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def test_response_cache_ttl():
+    """测试响应缓存的过期与淘汰"""
+    now = [0.0]
+    cache = ResponseCache(max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.put("c", "3")
+    assert cache.get("a") is None
+    assert cache.get("b") == "2"
+    now[0] = 11
+    assert cache.get("b") is None
+
+def test_async_generation_against_stub():
+    """测试异步流式生成、响应缓存与超时回退"""
+    print("=== 测试异步LLM生成 ===")
+    StubLLMHandler.requests = 0
+    StubLLMHandler.delay = 0.0
+    server = _start_stub_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    service = AsyncLLMService(base_url=base_url, timeout=5)
+    rules = ["每个销售每天最多拜访4个客户"]
+    try:
+        tokens = []
+
+        async def run():
+            # 同时发出的请求在同一个连接池上执行
+            return await asyncio.gather(
+                agenerate_model_code(rules, [], service=service, on_token=tokens.append),
+                agenerate_model_code(["另一条规则"], [], service=service),
+            )
+
+        first, other = asyncio.run(run())
+        assert first == "".join(STUB_CODE) == other
+        assert tokens == STUB_CODE
+
+        # 相同的提示词直接命中缓存，同步接口与异步接口共享
+        assert generate_model_code(rules, [], service=service) == first
+        assert StubLLMHandler.requests == 2
+        assert service.cache.stats()["hits"] == 1
+
+        # 相同提示词的并发请求合并为一次生成
+        StubLLMHandler.delay = 0.3
+
+        async def run_identical():
+            return await asyncio.gather(*[
+                agenerate_model_code(["并发的相同规则"], [], service=service) for _ in range(3)
+            ])
+
+        assert asyncio.run(run_identical()) == [first] * 3
+        assert StubLLMHandler.requests == 3
+        assert service.flight.stats()["deduplicated"] == 2
+
+        # 超时回退到简化版本
+        StubLLMHandler.delay = 2.0
+        slow = AsyncLLMService(base_url=base_url, timeout=0.5)
+        code = generate_model_code(["超时的规则"], [], service=slow)
+        slow.close()
+        assert code.startswith("# Topprism-ChatOpt: 本地模型调用失败")
+    finally:
+        service.close()
+        server.shutdown()
@@ -0,0 +1,226 @@
+# test_or_solver.py
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+from topprism_chatopt.batch import prepare_model
+from topprism_chatopt.constraint_store import validate
+from topprism_chatopt.llm_generator import generate_model_code_with_knowledge
+from topprism_chatopt.or_solver import (
+    build_travel_matrices,
+    depot_nodes,
+    drop_penalty_unit,
+    extract_customer_arrays,
+    solve_visit_scheduling,
+)
+from topprism_chatopt.rag_retriever import TopprismRAG
+from topprism_chatopt.resources import DATA_DIR
+from topprism_chatopt.solve_cache import SolveCache
+from topprism_chatopt.solve_result import SolveResult
+
+def test_travel_matrices():
+    """测试距离/时间矩阵"""
+    print("=== 测试距离/时间矩阵 ===")
+    customers = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    agents = pd.read_csv(os.path.join(DATA_DIR, "agents.csv"))
+
+    distance_matrix, time_matrix = build_travel_matrices(customers, agents)
+    n_nodes = len(customers) + len(agents)
+    print(distance_matrix)
+
+    assert distance_matrix.shape == (n_nodes, n_nodes)
+    assert time_matrix.shape == (n_nodes, n_nodes)
+    assert np.all(np.diag(distance_matrix) == 0)
+    assert np.array_equal(distance_matrix, distance_matrix.T)
+
+    # 北京纬度上经度相差0.01度约为850米
+    customers = pd.DataFrame({
+        "lat": [39.9, 39.9],
+        "lon": [116.40, 116.41],
+        "service_time_minutes": [30, 10],
+    })
+    distance_matrix, time_matrix = build_travel_matrices(customers, pd.DataFrame())
+    assert 840 < distance_matrix[0, 1] < 860
+    # 起点服务时长 + 行驶时间
+    assert time_matrix[0, 1] == 30 + 2
+    assert time_matrix[1, 0] == 10 + 2
+
+def test_solve_cache(tmp_path):
+    """测试求解结果缓存"""
+    print("=== 测试求解结果缓存 ===")
+    customers = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    agents = pd.read_csv(os.path.join(DATA_DIR, "agents.csv"))
+    rules = ["每个销售每天最多拜访4个客户"]
+    options = {"time_limit_seconds": 1, "log_search": False}
+
+    cache = SolveCache(disk_dir=str(tmp_path))
+    first = solve_visit_scheduling(customers, agents, rules, "", search_options=options, cache=cache)
+    assert not first["from_cache"]
+
+    # 规则中的多余空白不影响指纹
+    second = solve_visit_scheduling(customers, agents, [" 每个销售每天最多拜访4个客户 "], "", search_options=options, cache=cache)
+    assert second["from_cache"]
+    assert second["schedule"].equals(first["schedule"])
+
+    # 新的内存层从磁盘层命中
+    disk_cache = SolveCache(disk_dir=str(tmp_path))
+    third = solve_visit_scheduling(customers, agents, rules, "", search_options=options, cache=disk_cache)
+    assert third["from_cache"]
+    print(cache.stats(), disk_cache.stats())
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert disk_cache.stats()["disk_hits"] == 1
+
+    # 数据变化时重新求解
+    changed = customers.copy()
+    changed.loc[0, "time_window_end"] = 11
+    fourth = solve_visit_scheduling(changed, agents, rules, "", search_options=options, cache=cache)
+    assert not fourth["from_cache"]
+
+def test_warm_start():
+    """测试基于上一轮路线的热启动"""
+    print("=== 测试热启动 ===")
+    customers = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    agents = pd.read_csv(os.path.join(DATA_DIR, "agents.csv"))
+    rules = ["每个销售每天最多拜访4个客户"]
+    options = {"time_limit_seconds": 1, "log_search": False}
+
+    previous = solve_visit_scheduling(customers, agents, rules, "", search_options=options, use_cache=False)
+    print(previous["routes"])
+    # 每个销售代表从自己的出发点出发，所有客户都需要拜访
+    assert sorted(c for route in previous["routes"].values() for c in route) == customers["id"].tolist()
+
+    # 新增一个客户
+    new_customer = pd.DataFrame([{
+        "id": 7, "name": "药店G", "lat": 39.9150, "lon": 116.4120, "priority": "B",
+        "service_time_minutes": 15, "time_window_start": 9, "time_window_end": 17,
+    }])
+    customers = pd.concat([customers, new_customer], ignore_index=True)
+    result = solve_visit_scheduling(customers, agents, rules, "", use_cache=False,
+                                    search_options={"log_search": False},
+                                    initial_routes=previous["routes"])
+    print(result["schedule"])
+    assert result["warm_started"]
+    assert 7 in [c for route in result["routes"].values() for c in route]
+
+
+def test_customer_arrays_constraints():
+    """测试按客户数组批量添加时间窗口与优先级约束"""
+    print("=== 测试客户数组约束 ===")
+    customers = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    agents = pd.read_csv(os.path.join(DATA_DIR, "agents.csv"))
+
+    arrays = extract_customer_arrays(customers)
+    assert np.array_equal(arrays["window_start"], customers["time_window_start"].to_numpy() * 60)
+    assert np.array_equal(arrays["penalty"] > 0, (customers["priority"] == "A").to_numpy())
+
+    knowledge = [{"intent": "service_time_window"}, {"intent": "maximize_priority"}]
+    code = generate_model_code_with_knowledge(["遵守服务时间窗口", "A类客户优先"], knowledge)
+    assert "iterrows" not in code
+    validate(code)
+    result = solve_visit_scheduling(customers, agents, [], code,
+                                    search_options={"time_limit_seconds": 1}, use_cache=False)
+    print(result["schedule"])
+    assert result["solved"]
+    assert result["build_seconds"] >= 0
+
+def test_multi_depot_capacity():
+    """测试多仓库出发点与按人设置的拜访上限"""
+    print("=== 测试多仓库与按人容量 ===")
+    customers = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    agents = pd.read_csv(os.path.join(DATA_DIR, "agents.csv"))
+    agents["max_visits_per_day"] = [0, 1, 5]
+
+    starts, ends = depot_nodes(len(customers), agents)
+    assert starts == ends == [len(customers) + v for v in range(len(agents))]
+    distance_matrix, _ = build_travel_matrices(customers, agents)
+    assert distance_matrix.shape[0] == len(customers) + len(agents)
+
+    result = solve_visit_scheduling(customers, agents, [], "",
+                                    search_options={"time_limit_seconds": 1}, use_cache=False)
+    print(result["routes"])
+    assert result["solved"]
+    assert [len(route) for route in result["routes"].values()] == [0, 1, len(customers) - 1]
+
+    # 单独的返回点
+    agents["end_lat"] = agents["start_lat"] + 0.01
+    agents["end_lon"] = agents["start_lon"]
+    starts, ends = depot_nodes(len(customers), agents)
+    assert ends == [len(customers) + len(agents) + v for v in range(len(agents))]
+    assert build_travel_matrices(customers, agents)[0].shape[0] == len(customers) + 2 * len(agents)
+
+def test_default_rules_visit_everyone(tmp_path, stub_model):
+    """测试默认规则下不放弃拜访任何客户：未拜访惩罚按距离单位换算"""
+    print("=== 测试默认规则 ===")
+    customers = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    agents = pd.read_csv(os.path.join(DATA_DIR, "agents.csv"))
+    rules = ["每个销售每天最多拜访4个客户", "A类客户优先安排", "医院客户必须在9-12点拜访"]
+    stub_model()
+    _, code = prepare_model(rules, customers, agents, retriever=TopprismRAG(cache_dir=str(tmp_path)))
+    assert "AddDisjunction" in code
+    distance_matrix, _ = build_travel_matrices(customers, agents)
+    arrays = extract_customer_arrays(customers, penalty_unit=drop_penalty_unit(distance_matrix))
+    assert arrays["penalty"].max() > distance_matrix.max() * len(distance_matrix)
+
+    result = solve_visit_scheduling(customers, agents, rules, code,
+                                    search_options={"time_limit_seconds": 2}, use_cache=False)
+    print(result["schedule"], result["objective"])
+    assert result["solved"]
+    assert len(result["dropped"]) == 0
+
+def test_structured_result(tmp_path):
+    """测试结构化求解结果：路线数组、开始时间范围、未拜访客户与序列化"""
+    print("=== 测试结构化求解结果 ===")
+    customers = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    agents = pd.read_csv(os.path.join(DATA_DIR, "agents.csv"))
+    # 总容量 3 < 客户数 6，所有客户可以放弃拜访
+    agents["max_visits_per_day"] = [1, 1, 1]
+    code = "\n".join([
+        "for index in node_indices[node_indices != -1].tolist():",
+        "    routing.AddDisjunction([index], 100000)",
+    ])
+    result = solve_visit_scheduling(customers, agents, [], code,
+                                    search_options={"time_limit_seconds": 1}, use_cache=False)
+    print(result)
+    print(result.stops())
+    assert result["solved"]
+    assert result["solver_status"] in ("ROUTING_SUCCESS", "ROUTING_OPTIMAL")
+    assert result["route_nodes"].dtype == np.int32
+    assert len(result["route_offsets"]) == len(agents) + 1
+    assert len(result["route_nodes"]) == 3 and len(result["dropped"]) == 3
+    assert sorted(result["route_nodes"].tolist() + result["dropped"].tolist()) == list(range(len(customers)))
+
+    # 开始时间在时间窗内，松弛时间非负
+    stops = result.stops()
+    windows = customers.iloc[stops["customer"]]
+    assert (stops["cumul_min"].to_numpy() >= windows["time_window_start"].to_numpy() * 60).all()
+    assert (stops["cumul_max"].to_numpy() <= windows["time_window_end"].to_numpy() * 60).all()
+    assert (stops["slack"] >= 0).all()
+
+    # 展示用排程表与 routes 由数组生成
+    routes = result["routes"]
+    assert [len(route) for route in routes.values()] == [1, 1, 1]
+    assert result["schedule"]["拜访客户"].tolist() == [
+        customers["name"][node] for node in result["route_nodes"].tolist()
+    ]
+
+    # 二进制序列化往返
+    path = str(tmp_path / "result.npz")
+    result.save(path)
+    loaded = SolveResult.load(path)
+    assert loaded["objective"] == result["objective"]
+    assert np.array_equal(loaded["cumul_min"], result["cumul_min"])
+    assert loaded["schedule"].equals(result["schedule"])
+    assert loaded["routes"] == routes
+
+    # 没有出发点坐标时 0 号客户充当仓库，显示在排程开头但不计入 routes 与 dropped
+    agents = agents.drop(columns=["start_lat", "start_lon", "max_visits_per_day"])
+    result = solve_visit_scheduling(customers, agents, [], "",
+                                    search_options={"time_limit_seconds": 1}, use_cache=False)
+    assert result["dropped"].tolist() == []
+    assert all(route.startswith(customers["name"][0]) for route in result["schedule"]["拜访客户"])
+    assert 0 not in result["route_nodes"].tolist()
+
+if __name__ == "__main__":
+    # 部分测试依赖 tmp_path、stub_model 等 fixture，直接运行时交给 pytest
+    sys.exit(pytest.main([__file__, "-s"]))
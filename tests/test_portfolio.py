@@ -0,0 +1,41 @@
+# test_portfolio.py
+import os
+import pandas as pd
+from topprism_chatopt.or_solver import DEFAULT_SEARCH_OPTIONS, make_search_parameters
+from topprism_chatopt.portfolio import portfolio_configs, solve_portfolio
+from topprism_chatopt.resources import DATA_DIR
+from topprism_chatopt.solve_result import SolveResult
+
+def test_portfolio_configs():
+    """测试并行求解配置互不相同"""
+    configs = portfolio_configs(12)
+    assert len(configs) == 12
+    assert len({(c["first_solution_strategy"], c["local_search_metaheuristic"]) for c in configs}) == 12
+
+    # 组合用尽后以搜索扰动区分，worker 之间不会执行相同的搜索
+    configs = portfolio_configs(70)
+    assert len({tuple(sorted(c.items())) for c in configs}) == 70
+    assert configs[0]["guided_local_search_lambda_coefficient"] == 0.1
+    assert configs[0] != portfolio_configs(1, seed=1)[0]
+    parameters = make_search_parameters(dict(DEFAULT_SEARCH_OPTIONS, time_limit_seconds=1, **configs[40]))
+    assert parameters.guided_local_search_lambda_coefficient == 0.05
+
+def test_solve_portfolio():
+    """测试多策略并行求解"""
+    print("=== 测试多策略并行求解 ===")
+    customers = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    agents = pd.read_csv(os.path.join(DATA_DIR, "agents.csv"))
+    rules = ["每个销售每天最多拜访4个客户"]
+
+    result = solve_portfolio(customers, agents, rules, "", n_workers=3, time_limit_seconds=2)
+    print(result["schedule"])
+    print(result["portfolio"])
+    assert isinstance(result, SolveResult) and result["solved"]
+    assert SolveResult.from_bytes(result.to_bytes())["best_config"] == result["best_config"]
+    assert len(result["portfolio"]) == 3
+    assert result["objective"] == min(r["objective"] for r in result["portfolio"] if r["solved"])
+
+    # 达到目标值后所有 worker 提前结束
+    result = solve_portfolio(customers, agents, rules, "", n_workers=3, time_limit_seconds=30,
+                             target_objective=10 ** 9)
+    assert result["solved"]
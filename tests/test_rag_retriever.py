@@ -0,0 +1,145 @@
+# test_rag_retriever.py
+import os
+import numpy as np
+import pytest
+from topprism_chatopt.rag_retriever import TopprismRAG
+
+def test_index_cache(tmp_path, stub_model):
+    """测试索引磁盘缓存"""
+    print("=== 测试索引磁盘缓存 ===")
+    cold_model = stub_model()
+    cold = TopprismRAG(cache_dir=str(tmp_path))
+    assert cold.index is not None
+    assert cold_model.encoded == len(cold.pattern_strings)
+
+    warm_model = stub_model()
+    warm = TopprismRAG(cache_dir=str(tmp_path))
+    # 热启动不重新编码知识库
+    assert warm_model.encoded == 0
+    assert warm.index.ntotal == cold.index.ntotal
+    assert np.allclose(warm.index.reconstruct_n(0, warm.index.ntotal),
+                       cold.index.reconstruct_n(0, cold.index.ntotal))
+    # 只缓存索引，不保留也不另存原始向量
+    assert not hasattr(cold, "embeddings")
+    assert [name.rsplit(".", 1)[-1] for name in os.listdir(tmp_path)] == ["faiss"]
+
+    # 查询时才加载模型
+    matches = warm.retrieve("完全无关的一句话", k=1)
+    print(matches[0]["description"])
+    assert warm_model.encoded == 1
+
+def test_retrieve_many(tmp_path, stub_model):
+    """测试批量检索"""
+    print("=== 测试批量检索 ===")
+    model = stub_model()
+    retriever = TopprismRAG(cache_dir=str(tmp_path))
+
+    rules = [
+        "每个销售每天最多拜访4个客户",
+        "医院客户必须在9-12点拜访",
+        "完全无关的一句话",
+        "A类客户优先安排",
+        "另一句无关的话",
+    ]
+    model.encoded = 0
+    batched = retriever.retrieve_many(rules, k=1)
+    # 只有未精确命中的查询参与编码，且一次完成
+    assert model.encoded == 2
+    assert batched == [retriever.retrieve(rule, k=1) for rule in rules]
+
+def test_exact_match_order(tmp_path, stub_model):
+    """测试合并正则与逐条匹配结果一致"""
+    print("=== 测试合并正则精确匹配 ===")
+    import re
+    stub_model()
+    retriever = TopprismRAG(cache_dir=str(tmp_path))
+    queries = [
+        "每个销售每天最多拜访4个客户",
+        "医院客户必须在9-12点拜访",
+        "A类客户优先安排",
+        "下午3点之前完成",
+        "每名代表不能超过5个药店",
+        "没有任何关键词",
+    ]
+    for query in queries:
+        expected = None
+        for item, pattern_str in zip(retriever.pattern_to_item, retriever.pattern_strings):
+            if re.search(pattern_str, query):
+                expected = item
+                break
+        assert retriever._exact_match(query) is expected
+
+def test_keyword_match(tmp_path, stub_model):
+    """测试关键词倒排索引与逐条打分结果一致"""
+    print("=== 测试关键词倒排索引 ===")
+    import re
+    stub_model()
+    retriever = TopprismRAG(cache_dir=str(tmp_path))
+
+    def linear_regex_match(query):
+        best_match = None
+        best_score = 0
+        for item, pattern_str in zip(retriever.pattern_to_item, retriever.pattern_strings):
+            score = 0
+            for keyword in re.findall(r'[一-鿿]+', pattern_str):
+                if keyword in query:
+                    score += 1
+            if score > best_score:
+                best_score = score
+                best_match = item
+        return best_match if best_score > 0 else None
+
+    queries = [
+        "每个销售每天最多拜访4个客户",
+        "医院客户上午拜访",
+        "优先拜访大客户，尽量安排在下午",
+        "每人至少拜访两家药店",
+        "之间完成",
+        "没有任何关键词",
+        "abc",
+    ]
+    for query in queries:
+        assert retriever._regex_match(query) is linear_regex_match(query)
+
+def test_index_types(tmp_path, stub_model):
+    """测试可配置索引类型：自动选择、近似索引与量化索引的检索结果"""
+    print("=== 测试索引类型 ===")
+    from topprism_chatopt.rag_retriever import INDEX_TYPES, choose_index_type
+    assert choose_index_type(500) == "flat"
+    assert choose_index_type(50000) == "hnsw"
+    assert choose_index_type(10 ** 6) == "ivf_sq8"
+    assert choose_index_type(10 ** 7) == "ivf_pq"
+
+    model = stub_model()
+    flat = TopprismRAG(cache_dir=str(tmp_path))
+    assert flat.index_type == "flat" and flat.metric == "cosine"
+    # 余弦度量下存储的是单位向量
+    assert np.allclose(np.linalg.norm(flat.index.reconstruct_n(0, flat.index.ntotal), axis=1), 1.0)
+    # 不被任何模式精确命中，走语义检索
+    query = "完全无关的一句话"
+    model.encoded = 0
+    expected = flat.retrieve(query, k=1)
+    assert model.encoded == 1
+    for index_type in INDEX_TYPES:
+        retriever = TopprismRAG(cache_dir=str(tmp_path), index_type=index_type)
+        assert retriever.index.ntotal == len(retriever.pattern_strings)
+        print(index_type, type(retriever.index).__name__)
+        assert retriever.retrieve(query, k=1) == expected
+        # 不同索引类型使用不同的缓存文件
+        assert (retriever.cache_key == flat.cache_key) == (index_type == "flat")
+
+    l2 = TopprismRAG(cache_dir=str(tmp_path), metric="l2")
+    assert l2.cache_key != flat.cache_key
+    with pytest.raises(ValueError):
+        TopprismRAG(cache_dir=str(tmp_path), index_type="lsh")
+
+def test_index_recall_benchmark():
+    """测试近似索引相对精确搜索的召回率基准"""
+    from topprism_chatopt.benchmark import bench_index
+    results = bench_index(n_vectors=2000, dim=32, n_queries=100, index_types=["flat", "hnsw", "ivf", "ivf_sq8"])
+    for item in results:
+        print(item["case"], item["recall_at_k"], item["ms_per_query"], item["index_mb"])
+        assert item["recall_at_k"] >= 0.8
+    assert results[0]["recall_at_k"] == 1.0
+    # 8 位量化约为 float32 的四分之一
+    assert results[3]["index_mb"] < results[2]["index_mb"] / 2
@@ -0,0 +1,95 @@
+# test_search_monitor.py
+import multiprocessing
+import os
+import time
+import pandas as pd
+from topprism_chatopt.benchmark import synthetic_instance
+from topprism_chatopt.or_solver import solve_visit_scheduling
+from topprism_chatopt.resources import DATA_DIR
+from topprism_chatopt.search_monitor import ObjectiveMonitor, default_time_limit, polled_stop
+from topprism_chatopt.tracing import get_default_tracer
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def _poll(monitor):
+    return any(monitor.should_stop() for _ in range(ObjectiveMonitor.CHECK_EVERY))
+
+def test_objective_monitor():
+    """测试停滞与差距停止条件"""
+    clock = FakeClock()
+    monitor = ObjectiveMonitor(stall_seconds=2.0, min_relative_improvement=0.01, clock=clock)
+    assert not monitor.on_solution(1000)
+    clock.now = 1.5
+    assert not monitor.on_solution(995)  # 改进不足 1%，不重置停滞计时
+    clock.now = 2.5
+    # 停滞只在找到新解时判断，不需要轮询
+    assert not _poll(monitor) and monitor.calls == ObjectiveMonitor.CHECK_EVERY
+    assert monitor.on_solution(996)
+    assert monitor.stop_reason == "stall"
+    assert monitor.trajectory == [(0.0, 1000), (1.5, 995)]
+
+    monitor = ObjectiveMonitor(gap_threshold=0.05, lower_bound=100, clock=FakeClock())
+    assert not monitor.on_solution(200)
+    assert monitor.on_solution(104) and monitor.stop_reason == "gap"
+    assert monitor.should_stop()
+
+    # 外部停止通过轮询检查
+    stop = [False]
+    monitor = ObjectiveMonitor(external_stop=lambda: stop[0], clock=FakeClock())
+    assert not _poll(monitor)
+    stop[0] = True
+    assert _poll(monitor) and monitor.stop_reason == "external"
+
+def test_polled_stop():
+    """测试跨进程停止信号复制为本地标志"""
+    with polled_stop(None) as stopped:
+        assert stopped is None
+
+    manager = multiprocessing.Manager()
+    try:
+        event = manager.Event()
+        with polled_stop(event.is_set, interval=0.01) as stopped:
+            assert not stopped()
+            event.set()
+            deadline = time.monotonic() + 2
+            while not stopped() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert stopped()
+    finally:
+        manager.shutdown()
+
+def test_adaptive_time_limit():
+    """测试按规模自适应的时间上限与目标值轨迹"""
+    print("=== 测试自适应时间上限 ===")
+    assert default_time_limit(5) < default_time_limit(100) <= default_time_limit(10000) == 30
+
+    customers = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    agents = pd.read_csv(os.path.join(DATA_DIR, "agents.csv"))
+    result = solve_visit_scheduling(customers, agents, ["每个销售每天最多拜访4个客户"], "", use_cache=False)
+    print(result["trajectory"], result["stop_reason"], result["search_seconds"])
+    assert result["solved"]
+    assert result["search_seconds"] <= default_time_limit(len(customers)) + 1
+    assert result["trajectory"][-1][1] == result["objective"]
+
+    # 停滞提前停止时保留最优解；没有外部停止回调时不安装逐次回调的限制
+    with get_default_tracer().capture() as trace:
+        result = solve_visit_scheduling(customers, agents, [], "", use_cache=False,
+                                        search_options={"time_limit_seconds": 10, "stall_seconds": 0.2})
+    counters = {event["name"]: event["value"] for event in trace if event.get("type") == "counter"}
+    print(result["stop_reason"], result["search_seconds"], counters)
+    assert result["solved"] and result["stop_reason"] == "stall"
+    assert result["search_seconds"] < 10
+    assert counters.get("solve.limit_checks", 0) == 0
+
+    # 原生改进率限制
+    customers, agents = synthetic_instance(30, seed=1)
+    result = solve_visit_scheduling(customers, agents, [], "", use_cache=False, search_options={
+        "time_limit_seconds": 10, "stall_seconds": None,
+        "improvement_rate_coefficient": 0.5, "improvement_rate_solutions_distance": 5,
+    })
+    assert result["solved"] and result["search_seconds"] < 10
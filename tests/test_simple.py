@@ -1,8 +1,10 @@
 # test_simple.py
+import os
 import pandas as pd
-from rag_retriever import TopprismRAG
-from llm_generator import generate_model_code
-from or_solver import solve_visit_scheduling
+from topprism_chatopt.rag_retriever import TopprismRAG
+from topprism_chatopt.llm_generator import generate_model_code
+from topprism_chatopt.or_solver import solve_visit_scheduling
+from topprism_chatopt.resources import DATA_DIR
 
 def test_rag_retriever():
     """测试RAG检索器"""
@@ -41,8 +43,8 @@ def test_code_generation():
     rules = ["每个销售每天最多拜访4个客户"]
     
     # 读取数据
-    customers = pd.read_csv("data/customers.csv")
-    agents = pd.read_csv("data/agents.csv")
+    customers = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    agents = pd.read_csv(os.path.join(DATA_DIR, "agents.csv"))
     
     # 生成代码
     generated_code = generate_model_code(rules, matches, customers, agents)
@@ -54,8 +56,8 @@ def test_solver():
     """测试求解器"""
     print("=== 测试求解器 ===")
     # 读取数据
-    customers = pd.read_csv("data/customers.csv")
-    agents = pd.read_csv("data/agents.csv")
+    customers = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    agents = pd.read_csv(os.path.join(DATA_DIR, "agents.csv"))
     
     # 定义规则
     rules = [
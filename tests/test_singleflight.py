@@ -0,0 +1,88 @@
+# test_singleflight.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pytest
+from topprism_chatopt.or_solver import solve_flight, solve_visit_scheduling
+from topprism_chatopt.resources import DATA_DIR
+from topprism_chatopt.singleflight import SingleFlight
+from topprism_chatopt.solve_cache import SolveCache
+
+def test_do_coalesces_concurrent_calls():
+    """测试并发的相同请求只执行一次"""
+    flight = SingleFlight()
+    calls = []
+    barrier = threading.Barrier(4)
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.3)
+        return "结果"
+
+    def request():
+        barrier.wait()
+        return flight.do("key", slow)
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: request(), range(4)))
+    assert len(calls) == 1
+    assert [r[0] for r in results] == ["结果"] * 4
+    assert sorted(r[1] for r in results) == [False, True, True, True]
+    assert flight.stats() == {"executed": 1, "deduplicated": 3, "in_flight": 0}
+
+    # 异常同样传给等待的请求，之后的请求重新执行
+    def failing():
+        raise ValueError("失败")
+    with pytest.raises(ValueError):
+        flight.do("key", failing)
+    assert flight.do("key", lambda: "重试")[0] == "重试"
+
+def test_concurrent_identical_solves():
+    """测试相同的求解请求合并执行"""
+    customers = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    agents = pd.read_csv(os.path.join(DATA_DIR, "agents.csv"))
+    rules = ["每个销售每天最多拜访4个客户"]
+    cache = SolveCache()
+    before = solve_flight.stats()["deduplicated"]
+
+    def request(_):
+        return solve_visit_scheduling(customers, agents, rules, "", cache=cache,
+                                      search_options={"time_limit_seconds": 1})
+
+    with ThreadPoolExecutor(3) as pool:
+        results = list(pool.map(request, range(3)))
+    assert all(r["solved"] for r in results)
+    # 一次真正求解，其余请求合并或命中缓存
+    assert solve_flight.stats()["deduplicated"] - before + cache.stats()["hits"] == 2
+
+def test_solves_with_callbacks_run_separately():
+    """测试带回调的求解不与其它请求合并，被外部停止的结果不写入缓存"""
+    customers = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    agents = pd.read_csv(os.path.join(DATA_DIR, "agents.csv"))
+    cache = SolveCache()
+    before = solve_flight.stats()
+    seen = [[], []]
+
+    def request(i):
+        return solve_visit_scheduling(customers, agents, [], "", cache=cache,
+                                      search_options={"time_limit_seconds": 1},
+                                      on_solution=seen[i].append)
+
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(request, range(2)))
+    assert all(r["solved"] for r in results)
+    # 两个请求各自搜索（或命中另一个已写入的缓存），回调都被调用
+    assert all(seen[i] or results[i]["from_cache"] for i in range(2))
+    assert solve_flight.stats()["deduplicated"] == before["deduplicated"]
+    assert solve_flight.stats()["executed"] == before["executed"]
+
+    # 外部停止的结果不缓存
+    cache = SolveCache()
+    result = solve_visit_scheduling(customers, agents, [], "", cache=cache,
+                                    search_options={"time_limit_seconds": 5, "stall_seconds": None},
+                                    should_stop=lambda: True)
+    print(result["stop_reason"])
+    assert result["stop_reason"] == "external"
+    assert cache.stats()["memory_entries"] == 0
@@ -0,0 +1,71 @@
+# test_tracing.py
+import glob
+import json
+import os
+import pandas as pd
+from topprism_chatopt.or_solver import solve_visit_scheduling
+from topprism_chatopt.resources import DATA_DIR
+from topprism_chatopt.tracing import (
+    InMemoryExporter,
+    JsonLinesExporter,
+    PrometheusExporter,
+    Tracer,
+    get_default_tracer,
+)
+
+def test_tracer_exporters(tmp_path):
+    """测试嵌套阶段、计数与各导出器"""
+    tracer = Tracer()
+    memory = tracer.add_exporter(InMemoryExporter())
+    prometheus = tracer.add_exporter(PrometheusExporter())
+    tracer.add_exporter(JsonLinesExporter(str(tmp_path / "trace.jsonl")))
+
+    with tracer.span("outer") as attrs:
+        attrs["cache_hit"] = True
+        with tracer.span("inner"):
+            pass
+    tracer.count("solutions", 3)
+
+    assert [s["name"] for s in memory.spans] == ["inner", "outer"]
+    assert memory.spans[0]["parent"] == "outer"
+    assert memory.spans[1]["attrs"]["cache_hit"] is True
+    assert memory.counters["solutions"] == 3
+    assert memory.summary()["outer"]["count"] == 1
+
+    text = prometheus.render()
+    assert 'topprism_span_seconds_count{span="inner"} 1' in text
+    assert "topprism_solutions_total 3" in text
+
+    with open(tmp_path / "trace.jsonl", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [r["type"] for r in records] == ["span", "span", "counter"]
+
+    # 其它进程收集的记录可以交给本进程的导出器
+    with tracer.capture() as captured:
+        with tracer.span("captured"):
+            pass
+    other = Tracer()
+    other_memory = other.add_exporter(InMemoryExporter())
+    other.replay(captured)
+    assert [s["name"] for s in other_memory.spans] == ["captured"]
+
+def test_solver_spans_and_profile(tmp_path):
+    """测试求解各阶段的耗时记录与 cProfile 模式"""
+    customers = pd.read_csv(os.path.join(DATA_DIR, "customers.csv"))
+    agents = pd.read_csv(os.path.join(DATA_DIR, "agents.csv"))
+    tracer = get_default_tracer()
+    memory = tracer.add_exporter(InMemoryExporter())
+    tracer.profile_dir = str(tmp_path)
+    try:
+        solve_visit_scheduling(customers, agents, [], "routing.AddConstantDimension(1, 4, True, 'VisitCount')",
+                               search_options={"time_limit_seconds": 1}, use_cache=False)
+    finally:
+        tracer.remove_exporter(memory)
+        tracer.profile_dir = None
+
+    summary = memory.summary()
+    print(summary)
+    for name in ("solve", "solve.matrices", "solve.exec_constraints", "solve.search"):
+        assert name in summary
+    assert memory.counters["solve.solutions"] >= 1
+    assert glob.glob(os.path.join(str(tmp_path), "solve-*.prof"))
@@ -0,0 +1,95 @@
+# test_utils.py
+import numpy as np
+from topprism_chatopt.benchmark import synthetic_instance
+from topprism_chatopt.or_solver import solve_visit_scheduling
+from topprism_chatopt.resources import load_datasets
+from topprism_chatopt.utils import (MAX_MAP_POINTS, MAX_ROUTE_VERTICES, MAX_TIMELINE_AGENTS, ROUTE_COLORS,
+                                    decimate_points, plot_map, plot_schedule_timeline, route_geometry,
+                                    result_timeline, route_timeline, routes_from_schedule, simplify_polyline)
+
+def test_decimate_points():
+    """测试按缩放级别聚合客户点"""
+    customers, _ = synthetic_instance(20000, 50, seed=1)
+    points = decimate_points(customers["lat"], customers["lon"], 11, customers["priority"], max_points=1500)
+    print(len(points["lat"]))
+    assert len(points["lat"]) <= 1500
+    assert points["count"].sum() == len(customers)
+    assert points["lat"].dtype == np.float32
+    # 按类别分别聚合，各类别的客户数不变
+    for category in ("A", "B", "C"):
+        assert points["count"][points["category"] == category].sum() == (customers["priority"] == category).sum()
+    # 单点网格保留原始行号
+    single = points["rows"] >= 0
+    assert np.allclose(points["lat"][single], customers["lat"].to_numpy()[points["rows"][single]], atol=1e-5)
+
+    few = decimate_points(customers["lat"][:10], customers["lon"][:10], 11)
+    assert few["rows"].tolist() == list(range(10))
+
+    lat = np.array([39.9, 39.90001, 39.90002, 40.0])
+    lon = np.array([116.4, 116.40001, 116.40002, 116.5])
+    assert simplify_polyline(lat, lon, 12).tolist() == [0, 3]
+
+def test_route_geometry_and_timeline():
+    """测试由求解结果生成路线折线与时间线"""
+    print("=== 测试路线几何与时间线 ===")
+    customers, agents = load_datasets()
+    result = solve_visit_scheduling(customers, agents, [], "", search_options={"time_limit_seconds": 1},
+                                    use_cache=False)
+    geometry = route_geometry(result["routes"], customers, agents)
+    assert geometry["labels"] == agents["name"].tolist()
+    assert len(geometry["offsets"]) == len(agents) + 1
+    visited = sum(len(route) for route in result["routes"].values())
+    # 每条路线首尾为出发/返回点
+    assert (geometry["rows"] >= 0).sum() == visited
+    assert len(geometry["lat"]) == visited + 2 * len(agents)
+
+    timeline = route_timeline(result["routes"], customers, agents)
+    print(timeline)
+    assert len(timeline) == visited
+    windows = customers.set_index("name").loc[timeline["客户"]]
+    assert (timeline["开始"].to_numpy() >= windows["time_window_start"].to_numpy() * 60).all()
+    for _, group in timeline.groupby("销售代表"):
+        assert (group["开始"].to_numpy()[1:] >= group["结束"].to_numpy()[:-1]).all()
+
+    # 从排程表还原的路线与求解结果一致
+    assert routes_from_schedule(result["schedule"], customers, agents) == result["routes"]
+
+    fig = plot_schedule_timeline(result["schedule"], customers, routes=result["routes"], agents_df=agents)
+    assert sum(len(trace.x) for trace in fig.data) == visited
+
+    # 有求解结果时直接使用时间维度的开始时间，不重新推算
+    solved_timeline = result_timeline(result, customers)
+    assert len(solved_timeline) == visited
+    assert solved_timeline["开始"].tolist() == result["cumul_min"].tolist()
+    assert (solved_timeline["最晚开始"] >= solved_timeline["开始"]).all()
+    assert not solved_timeline["超出时间窗"].any()
+    fig = plot_schedule_timeline(result["schedule"], customers, agents_df=agents, result=result)
+    assert sum(len(trace.x) for trace in fig.data) == visited
+    assert sorted(b for trace in fig.data for b in trace.base) == sorted(result["cumul_min"].tolist())
+
+def test_map_payload_bounded():
+    """测试地图数据量不随客户数增长"""
+    payloads = []
+    for n in (2000, 20000):
+        customers, agents = synthetic_instance(n, 20, seed=2)
+        routes = {
+            agent_id: customers["id"].iloc[i::len(agents)].tolist()
+            for i, agent_id in enumerate(agents["id"])
+        }
+        fig = plot_map(customers, routes=routes, agents_df=agents)
+        markers = [trace for trace in fig.data if trace.mode == "markers"]
+        assert sum(len(trace.lat) for trace in markers) <= MAX_MAP_POINTS
+        lines = [trace for trace in fig.data if trace.mode == "lines"]
+        assert len(lines) == len(agents)
+        assert sum(np.isfinite(trace.lat).sum() for trace in lines) <= MAX_ROUTE_VERTICES + 2 * len(agents)
+        payloads.append(len(fig.to_json()))
+    print(payloads)
+    assert payloads[1] < 2 * payloads[0]
+
+    # 路线很多时按颜色合并为少量 trace
+    customers, agents = synthetic_instance(3000, 300, seed=3)
+    routes = {agent_id: customers["id"].iloc[i::len(agents)].tolist() for i, agent_id in enumerate(agents["id"])}
+    fig = plot_map(customers, routes=routes, agents_df=agents)
+    assert len([trace for trace in fig.data if trace.mode == "lines"]) <= len(ROUTE_COLORS)
+    timeline = plot_schedule_timeline(None, customers, routes=routes, agents_df=agents)
+    assert len({y for trace in timeline.data for y in trace.y}) == MAX_TIMELINE_AGENTS